@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Sound playback for Calcifer. Plays sounds on a dedicated worker thread fed by
+a command queue so the sampling loop never waits on the audio device, from a
+cache of decoded sounds so playback starts without disk I/O.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['AudioWorker', 'SoundCache']
+
+from collections import OrderedDict
+from logging import getLogger
+from pathlib import Path
+from queue import Empty, Full, Queue
+from random import choice
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from metrics import SOUND_BUCKETS, Registry
+
+
+class SoundCache(object):
+    """Index of playable files in a sounds directory plus an LRU cache of
+    their decoded PCM samples.
+
+    Parameters
+    ----------
+    path : str or Path
+        Sounds directory
+    budget : int, optional
+        Max bytes of decoded audio kept in memory; 0 disables caching,
+        by default 16MiB
+    suffixes : tuple of str, optional
+        Playable file suffixes, by default ('.wav', '.ogg')
+
+    Notes
+    -----
+    Samples are stored as raw bytes in the mixer's output format rather than
+    as `pygame.mixer.Sound` objects, so they survive the mixer being closed
+    and reopened. `pygame.mixer.Sound(buffer=...)` rebuilds a playable sound
+    from them with a single memcpy. The directory is rescanned whenever its
+    mtime changes, so new sounds are picked up without a restart.
+    """
+    def __init__(self, path, budget=16*2**20, suffixes=('.wav', '.ogg')):
+        self.path = Path(path)
+        self.budget = budget
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.files = []
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # Path -> raw samples, oldest first
+        self._format = None  # mixer format samples were decoded for
+        self._mtime = None
+        self._lock = Lock()
+        self.scan()
+
+    def scan(self):
+        """Reindex playable files if the directory changed.
+
+        Returns
+        -------
+        list of Path
+            Playable files
+        """
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return self.files
+        files = sorted(p for p in self.path.iterdir()
+                       if p.is_file() and p.suffix.lower() in self.suffixes) \
+            if mtime is not None else []
+        with self._lock:
+            self._mtime = mtime
+            self.files = files
+            for fn in [fn for fn in self._cache if fn not in files]:
+                self.nbytes -= len(self._cache.pop(fn))
+        return files
+
+    def choice(self):
+        """Random playable file, or None if there are none."""
+        files = self.scan()
+        return choice(files) if files else None
+
+    def get(self, fn, mixer):
+        """Decoded samples for `fn`, decoding and caching on a miss.
+
+        Parameters
+        ----------
+        fn : Path
+            Sound file
+        mixer : pygame.mixer
+            Initialized mixer used for decoding
+
+        Returns
+        -------
+        bytes
+            Raw samples in the mixer's output format
+        """
+        fmt = mixer.get_init()
+        with self._lock:
+            if fmt != self._format:  # output format changed; samples stale
+                self._cache.clear()
+                self.nbytes = 0
+                self._format = fmt
+            raw = self._cache.get(fn)
+            if raw is not None:
+                self._cache.move_to_end(fn)
+                self.hits += 1
+                return raw
+        self.misses += 1
+        raw = mixer.Sound(str(fn)).get_raw()
+        if len(raw) <= self.budget:
+            with self._lock:
+                self._cache[fn] = raw
+                self.nbytes += len(raw)
+                while self.nbytes > self.budget:
+                    self.nbytes -= len(self._cache.popitem(last=False)[1])
+        return raw
+
+    def preload(self, mixer):
+        """Decode indexed files until the memory budget is full."""
+        for fn in self.scan():
+            n = len(self._cache)
+            self.get(fn, mixer)
+            if len(self._cache) <= n:  # evicted or too big; budget full
+                break
+
+
+class AudioWorker(object):
+    """Sound playback thread.
+
+    Parameters
+    ----------
+    logger : logging.Logger, optional
+        Logger for playback events, by default module logger
+    cache : SoundCache, optional
+        Decoded sound cache; preloaded on start. Without one, or with a zero
+        budget, files are streamed from disk, by default None
+    timeout : float, optional
+        Max seconds a single sound may play before it is stopped, by default 60
+    mixer_idle : float, optional
+        Seconds the mixer stays open after playback before it is closed to
+        avoid ALSA underruns; 0 keeps it open, by default 5
+    maxsize : int, optional
+        Max queued commands; extra play requests are dropped, by default 4
+    metrics : metrics.Registry, optional
+        Registry for playback series, by default a private one
+
+    Notes
+    -----
+    The pygame mixer is opened lazily on the worker thread and reopened after
+    errors. If a playback call blocks inside the audio driver past `timeout`
+    plus one poll, the thread is abandoned and a fresh worker takes over the
+    queue, so a hung device cannot wedge future sounds. `check` does this
+    and is run by `play` and periodically as a supervisor probe, so a hang is
+    reported without waiting for the next sound.
+    """
+    POLL = 0.1  # playback status poll period
+
+    def __init__(self, logger=None, cache=None, timeout=60., mixer_idle=5.,
+                 maxsize=4, metrics=None):
+        self.logger = getLogger(__name__) if logger is None else logger
+        self.cache = cache
+        self.timeout = timeout
+        self.mixer_idle = mixer_idle
+        self.queue = Queue(maxsize)
+        self.thread = None
+        self.go = False
+        self.mixer = None
+        self.busy_since = None  # monotonic start of current playback
+        self.played = 0
+        self.timeouts = 0
+        self.hangs = 0
+        self._check_lock = Lock()  # `play` and the supervisor both check
+        self.last_duration = 0.
+        metrics = Registry() if metrics is None else metrics
+        self.start_latency = metrics.histogram(
+            'sound_start_seconds', 'Queue to playback start time',
+            SOUND_BUCKETS)
+        self.durations = metrics.histogram(
+            'sound_duration_seconds', 'Sound playback time', SOUND_BUCKETS)
+        metrics.counter('sound_timeouts_total', 'Sounds stopped or hung '
+                        'past sound_timeout', fn=lambda: self.timeouts)
+        metrics.counter('sound_worker_hangs_total', 'Audio workers abandoned '
+                        'hung in the driver', fn=lambda: self.hangs)
+
+    def start(self):
+        """Start worker thread and queue cache preload."""
+        self.go = True
+        self._spawn()
+        if self.cache is not None and self.cache.budget > 0:
+            self.queue.put_nowait(('preload', None))
+
+    def _spawn(self):
+        self.thread = Thread(target=self._work, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def play(self, fn):
+        """Queue sound file for playback. Never blocks.
+
+        Parameters
+        ----------
+        fn : str or Path
+            Sound file
+
+        Returns
+        -------
+        bool
+            False if the request was dropped
+        """
+        self.check()
+        try:
+            self.queue.put_nowait(('play', (fn, monotonic())))
+        except Full:
+            self.logger.warning('audio queue full; dropping %s', fn)
+            return False
+        return True
+
+    def stop(self, timeout=None):
+        """Stop worker thread after current command."""
+        self.go = False
+        try:
+            self.queue.put_nowait(('stop', None))
+        except Full:
+            pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    @property
+    def hung(self):
+        """Whether current playback has exceeded its timeout."""
+        busy = self.busy_since
+        return busy is not None and monotonic() - busy > self.timeout + 2*self.POLL
+
+    def check(self):
+        """Replace a worker stuck in the audio driver or dead.
+
+        Returns
+        -------
+        bool
+            Whether the worker was healthy
+        """
+        with self._check_lock:
+            return self._check()
+
+    def _check(self):
+        if not self.go:
+            return True
+        if self.hung:
+            self.logger.error('audio worker hung for %.0fs; starting new '
+                              'worker', monotonic() - self.busy_since)
+            self.timeouts += 1
+            self.hangs += 1
+            self.busy_since = None
+            self.mixer = None  # reopen on new thread
+            self._spawn()
+            return False
+        if self.thread is None or not self.thread.is_alive():
+            self.logger.error('audio worker died; starting new worker')
+            self._spawn()
+            return False
+        return True
+
+    def _work(self):
+        me = self.thread
+        while self.go and self.thread is me:
+            idle = self.mixer_idle if self.mixer_idle > 0 else None
+            try:
+                cmd, arg = self.queue.get(timeout=idle)
+            except Empty:
+                self._close_mixer()
+                continue
+            if cmd == 'stop':
+                break
+            try:
+                if cmd == 'play':
+                    self._play(*arg)
+                elif cmd == 'preload':
+                    self.cache.preload(self._open_mixer())
+                    self.logger.debug('preloaded %d sounds, %d bytes',
+                                      len(self.cache._cache), self.cache.nbytes,
+                                      extra={'sound_bytes': self.cache.nbytes})
+            except Exception as e:
+                self.logger.error('audio %s failed: %r', cmd, e,
+                                  extra={'audio_cmd': cmd})
+                self._close_mixer()
+        if self.thread is me:
+            self._close_mixer()
+
+    def _open_mixer(self):
+        if self.mixer is None:
+            # https://github.com/TaylorSMarks/playsound/issues/16
+            from pygame import mixer
+            mixer.init()
+            self.mixer = mixer
+        return self.mixer
+
+    def _close_mixer(self):
+        if self.mixer is not None:
+            self.mixer.quit()  # stop mixer to avoid underrun
+            self.mixer = None
+
+    def _play(self, fn, queued):
+        self.busy_since = tstart = monotonic()
+        mixer = self._open_mixer()
+        if self.cache is not None and self.cache.budget > 0:
+            sound = mixer.Sound(buffer=self.cache.get(fn, mixer))
+            channel = sound.play()
+            busy, halt = channel.get_busy, channel.stop
+        else:
+            mixer.music.load(str(fn))
+            mixer.music.play()
+            busy, halt = mixer.music.get_busy, mixer.music.stop
+        self.start_latency.observe(monotonic() - queued)
+        self.logger.debug('playing %s; started after %.3fs', fn,
+                          monotonic() - tstart, extra={'sound': str(fn)})
+        while busy():
+            if monotonic() - tstart > self.timeout:
+                self.logger.warning('sound timed out after %ss: %s',
+                                    self.timeout, fn,
+                                    extra={'sound': str(fn)})
+                halt()
+                self.timeouts += 1
+                break
+            sleep(self.POLL)
+        self.last_duration = monotonic() - tstart
+        self.durations.observe(self.last_duration)
+        self.played += 1
+        self.busy_since = None
+        self.logger.debug('sound playing time: %.1fs', self.last_duration,
+                          extra={'sound': str(fn),
+                                 'sound_seconds': self.last_duration})
@@ -0,0 +1,880 @@
+#!/usr/bin/env python3
+"""
+Hardware backends for Calcifer. Provides the board, GPIO, SPI, and MAX31856
+objects Calcifer uses, either from Blinka on a Raspberry Pi or from an
+in-process simulated thermocouple amplifier so the mainloop can be profiled
+and load tested on any Linux box.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['get_backend', 'BlinkaBackend', 'SimBackend', 'SimMAX31856',
+           'ThermocoupleType', 'parse_curve', 'interp_curve', 'parse_faults',
+           'BACKENDS', 'DrdyWaiter', 'PolledDrdyWaiter', 'channel_get']
+
+import time
+from bisect import bisect_right
+from math import exp
+from pathlib import Path
+from random import gauss
+from threading import Condition, Thread
+
+
+class ThermocoupleType(object):
+    """Copy of `adafruit_max31856.ThermocoupleType` CR1 TC type bits.
+
+    The driver only uses the int values, and importing it pulls in the
+    Blinka bus stack, so CLI commands that never touch SPI skip that cost.
+    """
+    B = 0b0000
+    E = 0b0001
+    J = 0b0010
+    K = 0b0011
+    N = 0b0100
+    R = 0b0101
+    S = 0b0110
+    T = 0b0111
+    G8 = 0b1000
+    G32 = 0b1100
+
+
+# MAX31856 Registers
+# https://datasheets.maximintegrated.com/en/ds/MAX31856.pdf
+CR0_REG = 0x00
+CR0_AUTOCONVERT = 0x80
+CR0_1SHOT = 0x40
+CR0_OCFAULT0 = 0x10
+CR0_FAULTCLR = 0x02
+CR0_50HZ = 0x01
+CR1_REG = 0x01
+MASK_REG = 0x02
+CJTH_REG = 0x0A
+LTCBH_REG = 0x0C
+SR_REG = 0x0F
+REG_DEFAULTS = bytes([0x00, 0x03, 0xFF, 0x7F, 0xC0, 0x7F, 0xFF, 0x80, 0x00,
+                      0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
+AVGSEL = {0x00: 1, 0x10: 2, 0x20: 4, 0x30: 8, 0x40: 16}
+
+# fault status register bits, keyed by `sim_faults` name
+FAULT_BITS = {'cjrange': 0x80, 'tcrange': 0x40, 'cjhigh': 0x20,
+              'cjlow': 0x10, 'tchigh': 0x08, 'tclow': 0x04, 'ovuv': 0x02,
+              'open': 0x01}
+
+
+def channel_get(conf, name, key, default=None):
+    """Config value `key` for channel `name`: `<name>.<key>` if set, else
+    the section's `<key>`, else `default`."""
+    if name and f'{name}.{key}' in conf:
+        return conf[f'{name}.{key}']
+    return conf.get(key, default)
+
+
+def conversion_time(oneshot=True, averaging=1, hz=60):
+    """MAX31856 conversion time in seconds.
+
+    Parameters
+    ----------
+    oneshot : bool, optional
+        One-shot (True) or automatic conversion mode (False), by default True
+    averaging : int, optional
+        Number of samples averaged on-chip, by default 1
+    hz : int, optional
+        Noise rejection filter frequency, 50 or 60, by default 60
+
+    Notes
+    -----
+    Typical values from the datasheet electrical characteristics table.
+    """
+    if hz == 50:
+        base, extra = (0.169, 0.040) if oneshot else (0.120, 0.040)
+    else:
+        base, extra = (0.143, 0.0333) if oneshot else (0.100, 0.0333)
+    return base + (averaging - 1) * extra
+
+
+def parse_curve(spec):
+    """Build a temperature curve from a `sim_curve` config string.
+
+    Parameters
+    ----------
+    spec : str
+        One of
+        `const:T` - constant temperature T
+        `ramp:T0,rate` - linear ramp from T0 at `rate` degC/s
+        `burn:ambient,peak,start,rise,end,fall` - ambient until `start`,
+            exponential approach to `peak` with time constant `rise`,
+            exponential decay back to ambient with time constant `fall`
+            after `end`
+        `csv:path` - linear interpolation of `time,temperature` rows; time
+            is measured from the first row
+
+    Returns
+    -------
+    function
+        Temperature in degC as a function of seconds since simulation start
+    """
+    kind, _, args = spec.strip().partition(':')
+    kind = kind.lower()
+    if kind == 'csv':
+        return _csv_curve(Path(args.strip()).expanduser())
+    vals = [float(v) for v in args.split(',')] if args.strip() else []
+    if kind == 'const':
+        T, = vals
+        return lambda t: T
+    if kind == 'ramp':
+        T0, rate = vals
+        return lambda t: T0 + rate*t
+    if kind == 'burn':
+        ambient, peak, start, rise, end, fall = vals
+        Tend = peak - (peak-ambient)*exp(-(end-start)/rise)
+
+        def curve(t):
+            if t < start:
+                return ambient
+            if t < end:
+                return peak - (peak-ambient)*exp(-(t-start)/rise)
+            return ambient + (Tend-ambient)*exp(-(t-end)/fall)
+        return curve
+    raise ValueError(f'unknown sim_curve:{spec}')
+
+
+def _csv_curve(fn):
+    """Linearly interpolated curve through `time,temperature` csv rows, with
+    time measured from the first row."""
+    ts, temps = [], []
+    with open(fn) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                t, temp = (float(v) for v in line.split(',')[:2])
+            except ValueError:  # header row
+                continue
+            ts.append(t)
+            temps.append(temp)
+    if not ts:
+        raise ValueError(f'no samples in {fn}')
+    return interp_curve([t - ts[0] for t in ts], temps)
+
+
+def interp_curve(ts, temps):
+    """Linear interpolation through sorted `ts`, `temps` samples, held
+    constant outside them."""
+    def curve(t):
+        i = bisect_right(ts, t)
+        if i == 0:
+            return temps[0]
+        if i == len(ts):
+            return temps[-1]
+        frac = (t - ts[i-1]) / (ts[i] - ts[i-1])
+        return temps[i-1] + frac*(temps[i] - temps[i-1])
+    return curve
+
+
+def parse_faults(spec):
+    """Build fault injection schedule from a `sim_faults` config string.
+
+    Parameters
+    ----------
+    spec : str
+        Comma separated `kind@start-end` entries in seconds since simulation
+        start. `end` may be omitted for a fault that never clears. Kinds are
+        the `FAULT_BITS` keys, `drdy` for a stuck DRDY pin, and `hang` for a
+        chip that stops converting until it is power cycled.
+
+    Returns
+    -------
+    list of tuples
+        (kind, start, end) entries
+    """
+    out = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, span = entry.partition('@')
+        kind = kind.strip().lower()
+        if kind not in FAULT_BITS and kind not in ('drdy', 'hang'):
+            raise ValueError(f'unknown sim_faults kind:{kind}')
+        start, _, end = span.partition('-')
+        out.append((kind, float(start), float(end) if end else float('inf')))
+    return out
+
+
+class DrdyWaiter(object):
+    """Wait for a conversion-complete edge on the amplifier's active-low
+    DRDY pin. An edge source calls `notify`; `wait` blocks on a condition
+    variable, so the waiting thread uses no CPU between conversions.
+
+    Notes
+    -----
+    Waits are for edges rather than levels so a DRDY pin stuck low by an
+    unpowered or hung chip times out instead of reading stale data.
+    """
+    def __init__(self):
+        self.cond = Condition()
+        self.edges = 0  # total falling edges seen
+        self._ready = False
+
+    def notify(self):
+        """Record a falling edge. Safe to call from interrupt callbacks."""
+        with self.cond:
+            self.edges += 1
+            self._ready = True
+            self.cond.notify_all()
+
+    def clear(self):
+        """Forget edges seen so far, e.g. before starting a conversion."""
+        with self.cond:
+            self._ready = False
+
+    def wait(self, timeout=None):
+        """Block until an edge arrives after the last `clear`/`wait`.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait, by default forever
+
+        Returns
+        -------
+        bool
+            True if a conversion completed, False on timeout
+        """
+        with self.cond:
+            ready = self.cond.wait_for(lambda: self._ready, timeout)
+            self._ready = False
+        return ready
+
+    def close(self):
+        """Release the edge source."""
+        pass
+
+
+class PolledDrdyWaiter(DrdyWaiter):
+    """Fallback for pins without edge detection. A helper thread samples the
+    DRDY level every `interval` seconds and notifies on high-to-low
+    transitions.
+    """
+    def __init__(self, drdy, interval=0.005):
+        super().__init__()
+        self.drdy = drdy
+        self.interval = interval
+        self._go = True
+        self._thread = Thread(target=self._poll, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _poll(self):
+        last = self.drdy.value
+        while self._go:
+            level = self.drdy.value
+            if last and not level:
+                self.notify()
+            last = level
+            time.sleep(self.interval)
+
+    def close(self):
+        self._go = False
+
+
+class _GPIOEdgeWaiter(DrdyWaiter):
+    """DRDY falling-edge interrupts through RPi.GPIO event detection."""
+    def __init__(self, GPIO, channel):
+        super().__init__()
+        self._GPIO = GPIO
+        self._channel = channel
+        GPIO.add_event_detect(channel, GPIO.FALLING,
+                              callback=lambda ch: self.notify())
+
+    def close(self):
+        self._GPIO.remove_event_detect(self._channel)
+
+
+class BlinkaBackend(object):
+    """Real hardware through Adafruit Blinka and the MAX31856 driver.
+
+    Imports are deferred to construction so that merely importing this
+    module never touches GPIO.
+    """
+    name = 'blinka'
+
+    def __init__(self, conf=None, clock=time):
+        import board
+        from adafruit_max31856 import MAX31856
+        from digitalio import DigitalInOut, Direction, Pull
+        self.board = board
+        self.DigitalInOut = DigitalInOut
+        self.Direction = Direction
+        self.Pull = Pull
+        self.MAX31856 = MAX31856
+        self.ThermocoupleType = ThermocoupleType
+        self.clock = clock
+
+    def eval(self, expr):
+        """Evaluate a config pin/bus expression such as `board.D22`."""
+        return eval(expr, {'board': self.board})
+
+    def drdy_waiter(self, pin, drdy, poll=0.005):
+        """Build DRDY edge waiter. Uses RPi.GPIO edge interrupts when
+        available, otherwise falls back to `PolledDrdyWaiter`.
+
+        Parameters
+        ----------
+        pin : board pin
+            DRDY pin, e.g. `board.D27`
+        drdy : DigitalInOut
+            Configured DRDY input
+        poll : float, optional
+            Fallback polling interval in seconds, by default 0.005
+
+        Returns
+        -------
+        DrdyWaiter
+        """
+        try:
+            import RPi.GPIO as GPIO
+            return _GPIOEdgeWaiter(GPIO, pin.id)
+        except (ImportError, RuntimeError, ValueError, AttributeError):
+            return PolledDrdyWaiter(drdy, poll)
+
+
+class _SimEnum(object):
+    """Stand-in for `digitalio.Direction`/`digitalio.Pull` values."""
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+class SimDirection(object):
+    INPUT = _SimEnum('INPUT')
+    OUTPUT = _SimEnum('OUTPUT')
+
+
+class SimPull(object):
+    UP = _SimEnum('UP')
+    DOWN = _SimEnum('DOWN')
+
+
+class SimSPI(object):
+    """Simulated SPI bus. Counts transactions for throughput measurements."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.transactions = 0
+
+
+class _SimBoard(object):
+    """Simulated `board` module; pins evaluate to their names."""
+    def __init__(self, backend):
+        self._backend = backend
+        self._spi = None
+
+    def SPI(self):
+        if self._spi is None:
+            self._spi = SimSPI(self._backend)
+        return self._spi
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return name
+
+
+class SimDigitalInOut(object):
+    """Simulated `digitalio.DigitalInOut`. Pins the backend knows to be wired
+    to the amplifier (drdy, tc_fault, tc_reset) reflect and drive the
+    simulated chip state.
+    """
+    def __init__(self, pin, backend):
+        self.pin = pin
+        self.direction = SimDirection.INPUT
+        self._backend = backend
+        self._pull = None
+        self._value = 0
+
+    @property
+    def pull(self):
+        return self._pull
+
+    @pull.setter
+    def pull(self, val):
+        self._pull = val
+        self._value = int(val is SimPull.UP)
+
+    @property
+    def value(self):
+        role, chip = self._backend.roles.get(self.pin, (None, None))
+        if role == 'drdy':
+            return chip.drdy_level()
+        if role == 'tc_fault':
+            return chip.fault_level()
+        if role == 'tc_reset':
+            return self._backend.relay
+        return self._value
+
+    @value.setter
+    def value(self, val):
+        if self._backend.roles.get(self.pin, (None,))[0] == 'tc_reset':
+            self._backend.set_relay(bool(val))
+        self._value = val
+
+    def deinit(self):
+        pass
+
+
+class SimChip(object):
+    """Simulated MAX31856 silicon: register file, conversion timing, DRDY and
+    FAULT pin levels, and scheduled fault injection.
+
+    Parameters
+    ----------
+    backend : SimBackend
+        Owning backend; provides clock and relay state
+    curve : function
+        Thermocouple temperature in degC vs. seconds since simulation start
+    cj_temp : float
+        Cold-junction temperature in degC
+    noise : float
+        Standard deviation of gaussian noise added to each conversion in degC
+    faults : list of tuples
+        (kind, start, end) entries from `parse_faults`
+    conv_time : float or None
+        Override datasheet conversion time in seconds; None for datasheet
+    tctype : str
+        Type of the wired thermocouple; sets the voltage seen in G8/G32
+        voltage mode
+    """
+    def __init__(self, backend, curve, cj_temp=25., noise=0., faults=(),
+                 conv_time=None, tctype='K'):
+        self.backend = backend
+        self.curve = curve
+        self.tctype = tctype
+        self.cj_temp = cj_temp
+        self.noise = noise
+        self.faults = list(faults)
+        self.conv_time_override = conv_time
+        self.hung = False
+        self._hangs = sorted(start for k, start, _ in self.faults if k == 'hang')
+        self.conversions = 0
+        self._power_on()
+
+    def _power_on(self):
+        self.regs = bytearray(REG_DEFAULTS)
+        self._oneshot_end = None  # completion time of pending one-shot
+        self._auto_start = None  # time automatic conversion mode started
+        self._auto_seen = 0  # automatic conversions already latched
+        self._pending = False  # unread conversion in LTCB registers
+
+    @property
+    def now(self):
+        return self.backend.clock.monotonic() - self.backend.t0
+
+    @property
+    def powered(self):
+        return not self.backend.relay
+
+    def power_changed(self, powered):
+        """Relay changed. Registers reset and hangs clear on power up."""
+        if powered:
+            self.hung = False
+            self._power_on()
+
+    def active(self, kind):
+        """Whether fault `kind` is scheduled at the current time."""
+        t = self.now
+        return any(k == kind and start <= t < end
+                   for k, start, end in self.faults)
+
+    def _converting(self):
+        if self._hangs and self.now >= self._hangs[0]:
+            del self._hangs[0]  # each scheduled hang fires once
+            self.hung = True
+        return self.powered and not self.hung and not self.active('drdy')
+
+    def conversion_time(self):
+        if self.conv_time_override is not None:
+            return self.conv_time_override
+        return conversion_time(
+            oneshot=not (self.regs[CR0_REG] & CR0_AUTOCONVERT),
+            averaging=AVGSEL.get(self.regs[CR1_REG] & 0x70, 16),
+            hz=50 if self.regs[CR0_REG] & CR0_50HZ else 60)
+
+    def _latch(self, t):
+        """Store a conversion completed at sim time `t` in LTCB/CJT."""
+        fault = self._fault_bits()
+        if fault & (FAULT_BITS['open'] | FAULT_BITS['ovuv']):
+            temp = self.cj_temp  # open input reads ~0V
+        else:
+            temp = self.curve(t)
+            if self.noise:
+                temp += gauss(0, self.noise)
+        temp = min(max(temp, -2048.), 2047.99)
+        mode = self.regs[CR1_REG] & 0x0F
+        if mode & 0x08:  # voltage mode, gain 8 (10xx) or 32 (11xx)
+            code = self._voltage_code(temp, 32 if mode & 0x04 else 8)
+        else:
+            code = round(temp*128)
+        code = (code << 5) & 0xFFFFFF
+        self.regs[LTCBH_REG:LTCBH_REG+3] = code.to_bytes(3, 'big')
+        cj = (round(self.cj_temp*64) << 2) & 0xFFFF
+        self.regs[CJTH_REG:CJTH_REG+2] = cj.to_bytes(2, 'big')
+        self.regs[SR_REG] = fault
+        self._pending = True
+        self.conversions += 1
+
+    def _voltage_code(self, temp, gain):
+        """19 bit voltage mode code for the wired thermocouple at `temp`."""
+        from thermocouples import emf  # NumPy only needed in voltage mode
+        mv = emf(self.tctype, temp) - emf(self.tctype, self.cj_temp)
+        if mv != mv:  # outside the type's range; saturate
+            return 2**18 - 1
+        code = round(mv/1000 * gain*1.6*2**17)
+        return min(max(code, -2**18), 2**18 - 1)
+
+    def _fault_bits(self):
+        bits = 0
+        for k, start, end in self.faults:
+            if k in FAULT_BITS and start <= self.now < end:
+                bits |= FAULT_BITS[k]
+        return bits
+
+    def update(self):
+        """Advance conversion state to the current time."""
+        if not self._converting():
+            return
+        if self._oneshot_end is not None and self.now >= self._oneshot_end:
+            self._latch(self._oneshot_end)
+            self._oneshot_end = None
+            self.regs[CR0_REG] &= ~CR0_1SHOT & 0xFF
+        if self._auto_start is not None:
+            n = self._auto_count()
+            if n > self._auto_seen:
+                self._auto_seen = n
+                self._latch(self._auto_start + n*self.conversion_time())
+
+    def _auto_count(self):
+        """Automatic conversions completed so far. Counted in integer
+        nanoseconds so it agrees exactly with `next_conversion`; a float
+        quotient like 42.99999 would truncate one conversion short."""
+        T = round(self.conversion_time()*1e9)
+        return (round(self.now*1e9) - round(self._auto_start*1e9)) // T
+
+    def next_conversion(self):
+        """Sim time the next conversion completes, or None if none is due."""
+        if not self._converting():
+            return None
+        if self._oneshot_end is not None:
+            return self._oneshot_end
+        if self._auto_start is not None:
+            T = round(self.conversion_time()*1e9)
+            return (round(self._auto_start*1e9) + (self._auto_seen+1)*T)*1e-9
+        return None
+
+    def read(self, address, length):
+        self.update()
+        if not self.powered or self.hung:
+            return bytearray(length)
+        out = bytearray(self.regs[address:address+length])
+        if address <= LTCBH_REG + 2 and address + length > LTCBH_REG:
+            self._pending = False
+        return out
+
+    def write(self, address, val):
+        self.update()
+        if not self.powered or self.hung:
+            return
+        if address == CR0_REG:
+            if val & CR0_FAULTCLR:
+                self.regs[SR_REG] = self._fault_bits()
+                val &= ~CR0_FAULTCLR & 0xFF
+            if val & CR0_AUTOCONVERT:
+                if self._auto_start is None:
+                    self._auto_start = self.now
+                    self._auto_seen = 0
+            else:
+                self._auto_start = None
+                if val & CR0_1SHOT and self._oneshot_end is None:
+                    self._oneshot_end = self.now + self.conversion_time()
+        self.regs[address] = val & 0xFF
+
+    def drdy_level(self):
+        """DRDY pin level. Active low: low while an unread conversion is
+        latched; pulled low when unpowered or stuck."""
+        self.update()
+        if not self._converting():
+            return False
+        return not self._pending
+
+    def fault_level(self):
+        """FAULT pin level. Active low."""
+        self.update()
+        if not self.powered:
+            return False
+        return not self._fault_bits()
+
+
+class SimMAX31856(object):
+    """Simulated `adafruit_max31856.MAX31856` driver. Mirrors the Adafruit
+    driver API on top of `SimChip` registers.
+    """
+    def __init__(self, spi, cs, thermocouple_type=ThermocoupleType.K,
+                 baudrate=500000):
+        self._spi = spi
+        self._chip = spi.backend.chip_for(cs.pin)
+        self._write_u8(MASK_REG, 0x0)
+        self._write_u8(CR0_REG, CR0_OCFAULT0)
+        cr1 = self._read_register(CR1_REG, 1)[0]
+        self._write_u8(CR1_REG, (cr1 & 0xF0) | (int(thermocouple_type) & 0x0F))
+
+    def _read_register(self, address, length):
+        self._spi.transactions += 1
+        return self._chip.read(address & 0x7F, length)
+
+    def _write_u8(self, address, val):
+        self._spi.transactions += 1
+        self._chip.write(address & 0x7F, val)
+
+    @property
+    def averaging(self):
+        return AVGSEL[self._read_register(CR1_REG, 1)[0] & 0x70]
+
+    @averaging.setter
+    def averaging(self, num_samples):
+        sel = {v: k for k, v in AVGSEL.items()}
+        if num_samples not in sel:
+            raise ValueError('Num_samples must be one of 1,2,4,8,16')
+        cr1 = self._read_register(CR1_REG, 1)[0]
+        self._write_u8(CR1_REG, (cr1 & 0b10001111) | sel[num_samples])
+
+    @property
+    def noise_rejection(self):
+        return 50 if self._read_register(CR0_REG, 1)[0] & CR0_50HZ else 60
+
+    @noise_rejection.setter
+    def noise_rejection(self, frequency):
+        if frequency not in (50, 60):
+            raise ValueError('Frequency must be 50 or 60')
+        cr0 = self._read_register(CR0_REG, 1)[0] & ~CR0_50HZ
+        self._write_u8(CR0_REG, cr0 | (CR0_50HZ if frequency == 50 else 0))
+
+    def initiate_one_shot_measurement(self):
+        cr0 = self._read_register(CR0_REG, 1)[0]
+        self._write_u8(CR0_REG, (cr0 & ~CR0_AUTOCONVERT) | CR0_1SHOT)
+
+    def start_autoconverting(self):
+        cr0 = self._read_register(CR0_REG, 1)[0]
+        self._write_u8(CR0_REG, (cr0 & ~CR0_1SHOT) | CR0_AUTOCONVERT)
+
+    @property
+    def oneshot_pending(self):
+        return bool(self._read_register(CR0_REG, 1)[0] & CR0_1SHOT)
+
+    def _wait_for_oneshot(self):
+        clock = self._spi.backend.clock
+        while self.oneshot_pending:
+            clock.sleep(0.01)
+
+    def unpack_temperature(self):
+        raw = int.from_bytes(self._read_register(LTCBH_REG, 3), 'big',
+                             signed=True)
+        return raw / 4096.0
+
+    def unpack_reference_temperature(self):
+        raw = int.from_bytes(self._read_register(CJTH_REG, 2), 'big',
+                             signed=True)
+        return raw / 256.0
+
+    @property
+    def temperature(self):
+        self.initiate_one_shot_measurement()
+        self._wait_for_oneshot()
+        return self.unpack_temperature()
+
+    @property
+    def reference_temperature(self):
+        self.initiate_one_shot_measurement()
+        self._wait_for_oneshot()
+        return self.unpack_reference_temperature()
+
+    @property
+    def fault(self):
+        sr = self._read_register(SR_REG, 1)[0]
+        return {'cj_range': bool(sr & 0x80), 'tc_range': bool(sr & 0x40),
+                'cj_high': bool(sr & 0x20), 'cj_low': bool(sr & 0x10),
+                'tc_high': bool(sr & 0x08), 'tc_low': bool(sr & 0x04),
+                'voltage': bool(sr & 0x02), 'open_tc': bool(sr & 0x01)}
+
+
+class SimDrdyWaiter(DrdyWaiter):
+    """DRDY edges of a `SimChip`. Sleeps on the backend clock straight to the
+    chip's next conversion instead of polling.
+    """
+    def __init__(self, chip):
+        super().__init__()
+        self.chip = chip
+        self._seen = chip.conversions
+
+    def clear(self):
+        self.chip.update()
+        self._seen = self.chip.conversions
+
+    def wait(self, timeout=None):
+        clock = self.chip.backend.clock
+        deadline = None if timeout is None else clock.monotonic() + timeout
+        while True:
+            self.chip.update()
+            if self.chip.conversions > self._seen:
+                self.edges += self.chip.conversions - self._seen
+                self._seen = self.chip.conversions
+                return True
+            now = clock.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            wake = self.chip.next_conversion()
+            wake = now + 0.01 if wake is None else wake + self.chip.backend.t0
+            if deadline is not None:
+                wake = min(wake, deadline)
+            # always advance, so rounding can never leave a virtual clock
+            # stuck just short of the conversion
+            clock.sleep(max(wake - now, 1e-6))
+
+
+class SimBackend(object):
+    """In-process simulated amplifier wired like the config section says.
+
+    Config Params
+    -------------
+    sim_curve     - thermocouple temperature curve, see `parse_curve`
+    sim_cj_temp   - cold-junction temperature in degC
+    sim_noise     - gaussian noise std dev in degC added to each conversion
+    sim_faults    - fault injection schedule, see `parse_faults`
+    sim_conv_time - conversion time override in seconds; `auto` for datasheet
+    tctype        - wired thermocouple type, for voltage mode readings
+
+    One chip is wired per entry of `channels`, or to the section's `cs`,
+    `drdy`, and `tc_fault` pins if there are none. Every key may be
+    overridden per channel with a `<name>.` prefix, e.g. `flue.sim_curve`.
+    """
+    name = 'sim'
+    Direction = SimDirection
+    Pull = SimPull
+    MAX31856 = SimMAX31856
+    ThermocoupleType = ThermocoupleType
+
+    def __init__(self, conf=None, clock=time):
+        conf = {} if conf is None else conf
+        self.clock = clock
+        self.t0 = clock.monotonic()
+        self.board = _SimBoard(self)
+        self.relay = False  # tc_reset relay; True cuts amplifier power
+        self.chips = {}  # cs pin -> SimChip
+        self.roles = {}  # pin -> (role, SimChip)
+        self._chip_params = self._params(conf, '')
+        for name in conf.get('channels', '').split() or ['']:
+            cs = channel_get(conf, name, 'cs')
+            if cs is not None:
+                self.add_chip(cs, channel_get(conf, name, 'drdy'),
+                              channel_get(conf, name, 'tc_fault'),
+                              **self._params(conf, name))
+        if 'tc_reset' in conf:
+            self.roles[self.eval(conf['tc_reset'])] = ('tc_reset', None)
+
+    @staticmethod
+    def _params(conf, name):
+        """`SimChip` keyword arguments for channel `name`."""
+        def get(k, default):
+            return channel_get(conf, name, k, default)
+        params = {
+            'curve': parse_curve(get('sim_curve', 'const:20')),
+            'cj_temp': float(get('sim_cj_temp', 25)),
+            'noise': float(get('sim_noise', 0)),
+            'faults': parse_faults(get('sim_faults', '')),
+            'tctype': get('tctype', 'K'),
+        }
+        conv_time = get('sim_conv_time', 'auto')
+        if conv_time != 'auto':
+            params['conv_time'] = float(conv_time)
+        return params
+
+    def eval(self, expr):
+        """Evaluate a config pin/bus expression such as `board.D22`."""
+        return eval(expr, {'board': self.board})
+
+    def DigitalInOut(self, pin):
+        return SimDigitalInOut(pin, self)
+
+    def drdy_waiter(self, pin, drdy, poll=0.005):
+        """Build DRDY edge waiter for the chip wired to `pin`."""
+        role, chip = self.roles.get(pin, (None, None))
+        if role != 'drdy':
+            return PolledDrdyWaiter(drdy, poll)
+        return SimDrdyWaiter(chip)
+
+    def add_chip(self, cs, drdy=None, tc_fault=None, **params):
+        """Wire a simulated amplifier to config pin expressions.
+
+        Parameters
+        ----------
+        cs : str
+            chip select pin expression
+        drdy : str, optional
+            data ready pin expression
+        tc_fault : str, optional
+            fault pin expression
+        params : optional
+            `SimChip` keyword overrides
+
+        Returns
+        -------
+        SimChip
+        """
+        chip = SimChip(self, **dict(self._chip_params, **params))
+        self.chips[self.eval(cs)] = chip
+        if drdy is not None:
+            self.roles[self.eval(drdy)] = ('drdy', chip)
+        if tc_fault is not None:
+            self.roles[self.eval(tc_fault)] = ('tc_fault', chip)
+        return chip
+
+    def chip_for(self, cs):
+        """Chip wired to chip select pin `cs`; unwired pins get a new chip."""
+        if cs not in self.chips:
+            self.chips[cs] = SimChip(self, **self._chip_params)
+        return self.chips[cs]
+
+    def set_relay(self, val):
+        if val == self.relay:
+            return
+        self.relay = val
+        for chip in self.chips.values():
+            chip.power_changed(not val)
+
+
+BACKENDS = {'blinka': BlinkaBackend, 'sim': SimBackend}
+
+
+def get_backend(name, conf=None, clock=None):
+    """Construct hardware backend by name.
+
+    Parameters
+    ----------
+    name : str
+        Backend name; key of `BACKENDS`
+    conf : mapping, optional
+        Config section used for backend-specific params, by default None
+    clock : object, optional
+        Provides `monotonic()`, `time()`, and `sleep()`, by default the
+        `time` module
+
+    Returns
+    -------
+    Backend instance
+    """
+    try:
+        cls = BACKENDS[name.lower()]
+    except KeyError:
+        raise ValueError(f'unknown backend:{name}; choices:{list(BACKENDS)}')
+    return cls(conf, clock=time if clock is None else clock)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark for Calcifer fire detectors. Feeds recorded or synthetic
+burns through the detectors configured in each config section and reports
+detection latency, false triggers, and per-sample cost.
+
+Recorded burns are csv files of `time,temperature[,fire]` rows or telemetry
+files, timed from their first sample. The optional `fire` column marks ground
+truth; every run of nonzero rows is a burn. Otherwise pass `--burn`.
+
+Detectors are run directly on a ring buffer, isolating their cost. See
+`replay.py` to run the whole mainloop on the simulated amplifier.
+
+Author: Marion Anderson
+"""
+import sys
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from json import dumps
+from pathlib import Path
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backends import parse_curve  # noqa: E402
+from detectors import detector_params, get_detector  # noqa: E402
+from replay import (curve_burns, latency_str, load_trace,  # noqa: E402
+                    parse_burn, score)
+from ringbuf import RingBuffer  # noqa: E402
+
+
+def curve_trace(spec, duration, period):
+    """Sample a `backends.parse_curve` spec every `period` seconds.
+
+    Returns
+    -------
+    samples : list of (time, temperature) tuples
+    burns : list of (start, end) tuples or None
+        Burn of `burn` curves
+    """
+    curve = parse_curve(spec)
+    n = int(duration / period) + 1
+    samples = [(i*period, curve(i*period)) for i in range(n)]
+    return samples, curve_burns(spec)
+
+
+def replay(samples, params, buflen, ema_alpha=0.2):
+    """Run a detector over samples.
+
+    Returns
+    -------
+    transitions : list of (time, fire_going) tuples
+    cost : float
+        Mean detector + buffer seconds per sample
+    """
+    params = dict(params)
+    detector = get_detector(params.pop('name'), **params)
+    buf = RingBuffer(buflen, ema_alpha)
+    going = False
+    transitions = []
+    tstart = perf_counter()
+    for t, temp in samples:
+        buf.append(temp, t)
+        new = detector.update(buf, going)
+        if new != going:
+            transitions.append((t, new))
+            going = new
+    cost = (perf_counter() - tstart) / max(len(samples), 1)
+    return transitions, cost
+
+
+parser = ArgumentParser('Replay burns through Calcifer fire detectors and '
+                        'report detection latency')
+parser.add_argument('traces', nargs='*', help='recorded burn csv or telemetry files')
+parser.add_argument('--curve', action='append', default=[],
+                    help='synthetic `backends.parse_curve` spec; repeatable')
+parser.add_argument('--duration', type=float, default=3600,
+                    help='synthetic curve duration in seconds')
+parser.add_argument('--period', type=float, default=None,
+                    help='synthetic sample period; defaults to section T_read')
+parser.add_argument('--burn', type=parse_burn, action='append', default=None,
+                    metavar='START[,END]',
+                    help='ground-truth burn seconds after trace start for '
+                    'traces without one; repeatable')
+parser.add_argument('--fnconf', type=str, default=str(ROOT / 'calcifer.ini'),
+                    help='Conf file with detector sections')
+parser.add_argument('--section', action='append', default=None,
+                    help='Conf section to benchmark; repeatable, default all')
+parser.add_argument('--detector', type=str, default=None,
+                    help='Override detector for every section')
+parser.add_argument('--json', action='store_true', help='machine-readable output')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    conf = ConfigParser()
+    conf.read(args.fnconf)
+    sections = args.section or ['DEFAULT'] + conf.sections()
+    if not args.traces and not args.curve:
+        args.curve = ['burn:20,300,600,300,3000,900']
+
+    results = []
+    for section in sections:
+        sconf = conf[section]
+        params = detector_params(sconf)
+        if args.detector is not None:
+            params['name'] = args.detector
+        period = args.period or float(sconf['T_read'])
+        runs = [(fn,) + load_trace(fn) for fn in args.traces]
+        runs += [(c,) + curve_trace(c, args.duration, period) for c in args.curve]
+        for name, samples, burns in runs:
+            if burns is None:
+                burns = args.burn
+            transitions, cost = replay(samples, params, int(sconf['buflen']),
+                                       float(sconf['ema_alpha']))
+            res = score(transitions, burns)
+            res.update({'section': section, 'detector': params['name'],
+                        'trace': name, 'samples': len(samples),
+                        'us_per_sample': cost*1e6})
+            results.append(res)
+
+    if args.json:
+        print(dumps(results, indent=2))
+    else:
+        fmt = '{:<12} {:<10} {:>12} {:>6} {:>10} {:>8}  {}'
+        print(fmt.format('section', 'detector', 'latency_s', 'false',
+                         'us/sample', 'samples', 'trace'))
+        for r in results:
+            print(fmt.format(r['section'], r['detector'], latency_str(r),
+                             r['false_triggers'], f"{r['us_per_sample']:.2f}",
+                             r['samples'], r['trace']))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the Calcifer CLI. Times each subcommand in a fresh
+interpreter, from process launch to exit, or to the control socket answering
+for `--run`. Runs against the simulated amplifier by default, with the
+control socket moved to a temporary path so a running daemon is never
+touched.
+
+    python3 bench/startup.py --section SIM -n 10
+
+Author: Marion Anderson
+"""
+import sys
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from json import dumps
+from pathlib import Path
+from statistics import median
+from subprocess import DEVNULL, Popen, run
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from control import request  # noqa: E402
+
+CALCIFER = str(ROOT / 'calcifer.py')
+# subcommand -> calcifer.py arguments after --fnconf/--section
+COMMANDS = {'help': ['--help'], 'stop': ['--stop'], 'oneshot': ['--oneshot'],
+            'replay': ['--replay', 'const:20', '--duration', '60'],
+            'run': ['--run']}
+
+
+def bench_conf(fnconf, section, tmp, hardware=False):
+    """Copy of `fnconf` with the control socket in `tmp`, and the sim
+    backend unless `hardware`.
+
+    Returns
+    -------
+    path : str
+        Config file
+    sock : str
+        Control socket path
+    """
+    conf = ConfigParser()
+    conf.read(fnconf)
+    sock = str(Path(tmp) / 'calcifer.sock')
+    conf[section]['control_socket'] = sock
+    conf[section]['metrics_port'] = '0'
+    conf[section]['conf_watch'] = '0'
+    if not hardware:
+        conf[section]['backend'] = 'sim'
+    path = Path(tmp) / 'bench.ini'
+    with open(path, 'w') as f:
+        conf.write(f)
+    return str(path), sock
+
+
+def time_command(argv):
+    """Seconds from launch to exit of `argv`."""
+    tstart = perf_counter()
+    run(argv, stdout=DEVNULL, stderr=DEVNULL)
+    return perf_counter() - tstart
+
+
+def time_run(argv, sock, timeout=30.):
+    """Seconds from launching the daemon to its control socket answering;
+    the daemon is stopped afterwards.
+
+    Returns
+    -------
+    ready : float or None
+        None if the daemon never answered
+    stop : float
+        Seconds from `stop` to exit
+    """
+    tstart = perf_counter()
+    proc = Popen(argv, stdout=DEVNULL, stderr=DEVNULL)
+    ready = None
+    while perf_counter() - tstart < timeout and proc.poll() is None:
+        try:
+            if request('status', sock, timeout=1).get('ok'):
+                ready = perf_counter() - tstart
+                break
+        except OSError:
+            sleep(0.005)
+    tstop = perf_counter()
+    try:
+        request('stop', sock, timeout=1)
+    except OSError:
+        proc.terminate()
+    proc.wait(timeout)
+    return ready, perf_counter() - tstop
+
+
+def bench(commands, fnconf, section, n=5, hardware=False):
+    """Time every subcommand `n` times.
+
+    Returns
+    -------
+    list of dict
+        Per command: min, median, and max milliseconds, plus shutdown
+        milliseconds for `run`
+    """
+    results = []
+    with TemporaryDirectory() as tmp:
+        path, sock = bench_conf(fnconf, section, tmp, hardware)
+        base = [sys.executable, CALCIFER, f'--fnconf={path}',
+                f'--section={section}']
+        for cmd in ['python'] + list(commands):
+            stops = []
+            if cmd == 'python':  # interpreter startup floor
+                ts = [time_command([sys.executable, '-c', 'pass'])
+                      for _ in range(n)]
+            elif cmd == 'run':
+                ts = []
+                for _ in range(n):
+                    ready, stop = time_run(base + COMMANDS[cmd], sock)
+                    if ready is not None:
+                        ts.append(ready)
+                        stops.append(stop)
+            else:
+                ts = [time_command(base + COMMANDS[cmd]) for _ in range(n)]
+            res = {'command': cmd, 'runs': len(ts)}
+            if ts:
+                res.update({'min_ms': min(ts)*1e3, 'median_ms': median(ts)*1e3,
+                            'max_ms': max(ts)*1e3})
+            if stops:
+                res['stop_ms'] = median(stops)*1e3
+            results.append(res)
+    return results
+
+
+parser = ArgumentParser('Time Calcifer CLI subcommand startup')
+parser.add_argument('commands', nargs='*', default=list(COMMANDS),
+                    help=f'subcommands to time; default all of {list(COMMANDS)}')
+parser.add_argument('-n', type=int, default=5, help='runs per subcommand')
+parser.add_argument('--fnconf', type=str, default=str(ROOT / 'calcifer.ini'),
+                    help='Conf file')
+parser.add_argument('--section', type=str, default='SIM', help='Conf section')
+parser.add_argument('--hardware', action='store_true',
+                    help='use the section\'s backend instead of the simulator')
+parser.add_argument('--json', action='store_true', help='machine-readable output')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for cmd in args.commands:
+        if cmd not in COMMANDS:
+            parser.error(f'unknown subcommand:{cmd}')
+    results = bench(args.commands, args.fnconf, args.section, args.n,
+                    args.hardware)
+    if args.json:
+        print(dumps(results, indent=2))
+    else:
+        fmt = '{:<10} {:>10} {:>10} {:>10} {:>10}'
+        print(fmt.format('command', 'min_ms', 'median_ms', 'max_ms', 'stop_ms'))
+        for r in results:
+            if not r['runs']:
+                print(f"{r['command']:<10} failed")
+                continue
+            print(fmt.format(r['command'], f"{r['min_ms']:.1f}",
+                             f"{r['median_ms']:.1f}", f"{r['max_ms']:.1f}",
+                             f"{r['stop_ms']:.1f}" if 'stop_ms' in r else ''))
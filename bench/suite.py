@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the Calcifer daemon. Runs against stand-in hardware: the
+simulated MAX31856 and GPIO pins (`backend = sim`), a virtual clock where
+only CPU time should count, and SDL's dummy audio driver in place of a sound
+card. Each benchmark returns a dict of numbers; costs and latencies are
+named `*_ns`, `*_us`, `*_ms`, or `*_s` and memory `*_mb`, so lower is
+always better.
+
+| benchmark | measures                                                       |
+| --------- | -------------------------------------------------------------- |
+| loop      | `step`, `update_tempbuf`, `soundbyte`, and `temp_all` CPU cost per call, on a virtual clock |
+| logging   | cost per log call at each loglevel, enabled and filtered       |
+| audio     | threshold crossing sample to sound playback start, on the real clock |
+| control   | control socket round trip per command, new and kept connections, with the mainloop running |
+| startup   | CLI subcommand startup; see `startup.py`                        |
+| memory    | RSS and live objects over a simulated day of `step` calls       |
+
+    python3 bench/suite.py --json --out before.json
+    python3 bench/suite.py --compare before.json
+
+`--compare` prints every cost against a saved run, medians for timed
+distributions, and exits 1 if any grew by more than `--tolerance`.
+
+Author: Marion Anderson
+"""
+import gc
+import logging
+import os
+import platform
+import socket
+import sys
+from argparse import ArgumentParser
+from json import dumps, load
+from pathlib import Path
+from statistics import mean, median
+from subprocess import run
+from tempfile import TemporaryDirectory
+from time import monotonic, perf_counter, perf_counter_ns, sleep, time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')  # no sound card needed
+
+from calcifer import LOGLEVELS, Calcifer, temp_all  # noqa: E402
+from control import request  # noqa: E402
+from logs import PIPELINE, get_logger  # noqa: E402
+from replay import VirtualClock  # noqa: E402
+import startup  # noqa: E402
+
+BENCHMARKS = ('loop', 'logging', 'audio', 'control', 'startup', 'memory')
+COSTS = ('_ns', '_us', '_ms', '_s', '_mb')  # compared by --compare
+SPREAD = ('min_', 'mean_', 'p99_', 'max_')  # too noisy to compare
+DAY = 'burn:15,300,36000,1800,50400,7200'  # 4 hour fire in a simulated day
+DEVNULL = open(os.devnull, 'w')
+
+
+def summarize(ts, unit='us'):
+    """Mean, median, 99th percentile, and max of `ts` seconds in `unit`."""
+    scale = {'ns': 1e9, 'us': 1e6, 'ms': 1e3, 's': 1.}[unit]
+    ts = sorted(t*scale for t in ts)
+    return {'n': len(ts), f'mean_{unit}': mean(ts),
+            f'median_{unit}': median(ts),
+            f'p99_{unit}': ts[min(len(ts) - 1, int(len(ts)*0.99))],
+            f'max_{unit}': ts[-1]}
+
+
+def make_job(fnconf, section, tmp, clock=None, **overrides):
+    """Calcifer on the simulated backend with its control socket in `tmp`,
+    no telemetry, and logs quieted."""
+    conf = {'backend': 'sim', 'telemetry_dir': '', 'loglevel': 'ERROR',
+            'metrics_port': 0, 'conf_watch': 0,
+            'control_socket': str(Path(tmp) / 'calcifer.sock')}
+    conf.update(overrides)
+    job = Calcifer(fnconf=fnconf, section=section, clock=clock,
+                   **{k: str(v) for k, v in conf.items()})
+    quiet_logs()
+    return job
+
+
+def quiet_logs():
+    """Point the log listener at /dev/null so logging cost is measured
+    without a terminal in the loop."""
+    listener = PIPELINE.listener
+    if listener is not None:
+        for handler in listener.handlers:
+            if hasattr(handler, 'setStream'):
+                handler.setStream(DEVNULL)
+
+
+def _time_calls(fn, n):
+    ts = []
+    for _ in range(n):
+        t = perf_counter_ns()
+        fn()
+        ts.append((perf_counter_ns() - t)*1e-9)
+    return ts
+
+
+def bench_loop(fnconf, section, tmp, n=5000):
+    """CPU cost per mainloop call. Conversion and relay waits are skipped by
+    the virtual clock, so only Calcifer's own work is timed."""
+    job = make_job(fnconf, section, tmp, clock=VirtualClock())
+    job.soundswitch.value = 0
+    try:
+        for _ in range(100):  # fill buffers
+            job.step()
+        res = {'step': summarize(_time_calls(job.step, n)),
+               'update_tempbuf': summarize(_time_calls(job.update_tempbuf, n))}
+
+        def soundbyte():
+            job.soundbyte()
+            job.audio.queue.get_nowait()  # worker not started; drain
+        res['soundbyte'] = summarize(_time_calls(soundbyte, n))
+        temp_all(job.spi, job.cs, job.backend)  # imports NumPy
+        res['temp_all'] = summarize(_time_calls(
+            lambda: temp_all(job.spi, job.cs, job.backend), max(n//10, 10)),
+            'ms')
+    finally:
+        job._wrapup()
+    return res
+
+
+def bench_logging(n=5000):
+    """Cost per log call for every logger level and call level, with the
+    listener writing to /dev/null."""
+    res = {}
+    args = ('%s drdy timeout; drdy_count:%d', 'tc', 3)
+    try:
+        for level in LOGLEVELS:
+            logger = get_logger(logging.getLevelName(level))
+            quiet_logs()
+            res[level] = {}
+            for call in LOGLEVELS:
+                fn = getattr(logger, call.lower())
+                t = perf_counter_ns()
+                for _ in range(n):
+                    fn(*args)
+                res[level][f'{call.lower()}_ns'] = (perf_counter_ns() - t)/n
+                while not PIPELINE.queue.empty():  # let the listener drain
+                    sleep(0.001)
+        res['dropped'] = PIPELINE.dropped
+    finally:
+        get_logger(logging.ERROR)
+    return res
+
+
+def bench_audio(fnconf, section, tmp, n=10):
+    """Seconds from the start of the iteration that reads a temperature over
+    `thresh` to the sound starting, through the threshold detector.
+
+    Notes
+    -----
+    The sample runs on the real clock, so `step` includes the simulated
+    conversion time; `queue` is the audio worker's share. The first trial
+    is reported apart as `first_ms` since it may wait on the mixer opening.
+    """
+    job = make_job(fnconf, section, tmp, detector='threshold',
+                   smoothing='last', sound_timeout=0.2)
+    chips = list(job.backend.chips.values())
+    job.soundswitch.value = 1
+    job.audio.start()
+    hist = job.audio.start_latency
+    ts, steps, queued = [], [], []
+    try:
+        for _ in range(n):
+            for chip in chips:
+                chip.curve = lambda t: 15.
+            job.clr_tempbuf()
+            for _ in range(3):  # cold samples; fire goes out
+                job.step()
+            for chip in chips:
+                chip.curve = lambda t: job.channels[0].thresh + 100
+            played, count, total = job.audio.played, hist.count, hist.sum
+            t0 = perf_counter()
+            job.step()
+            steps.append(perf_counter() - t0)
+            tstart = monotonic()
+            while hist.count == count and monotonic() - tstart < 5:
+                sleep(0.001)
+            if hist.count == count:
+                continue  # never played
+            # queued during the step, so this bounds crossing -> playback
+            queued.append(hist.sum - total)
+            ts.append(steps[-1] + queued[-1])
+            while job.audio.played == played and monotonic() - tstart < 5:
+                sleep(0.01)
+    finally:
+        job._wrapup()
+    res = {'trials': n, 'played': len(ts), 'step': summarize(steps, 'ms')}
+    if ts:
+        res['first_ms'] = ts[0]*1e3
+        res['queue'] = summarize(queued[1:] or queued, 'ms')
+        res['latency'] = summarize(ts[1:] or ts, 'ms')
+    return res
+
+
+def _persistent(path, cmd, n):
+    ts = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile('rb') as f:
+            line = cmd.encode() + b'\n'
+            for _ in range(n):
+                t = perf_counter_ns()
+                sock.sendall(line)
+                f.readline()
+                ts.append((perf_counter_ns() - t)*1e-9)
+    return ts
+
+
+def bench_control(fnconf, section, tmp, n=500, commands=('status', 'temp')):
+    """Control socket round trip per command with the daemon running:
+    `new` connects per request like `control.py`, `kept` polls over one
+    connection."""
+    job = make_job(fnconf, section, tmp)
+    path = job.control_socket
+    job.start()
+    res = {}
+    try:
+        request('status', path)  # wait for the server
+        for cmd in commands:
+            res[cmd] = {'new': summarize(_time_calls(
+                            lambda: request(cmd, path), n)),
+                        'kept': summarize(_persistent(path, cmd, n))}
+    finally:
+        job.go = False
+        job.join()
+    return res
+
+
+def bench_startup(fnconf, section, n=3):
+    """`startup.bench` per subcommand, keyed by subcommand."""
+    return {r.pop('command'): r for r in
+            startup.bench(list(startup.COMMANDS), fnconf, section, n)}
+
+
+def rss_mb():
+    """Resident set size in MiB; peak RSS where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+    except OSError:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb/2**10 if sys.platform != 'darwin' else kb/2**20
+
+
+def bench_memory(fnconf, section, tmp, hours=24, curve=DAY):
+    """Memory over `hours` of simulated `step` calls on a virtual clock,
+    sampled every simulated hour.
+
+    Returns
+    -------
+    dict
+        Start, end, and peak RSS, RSS and live object growth, steps, and
+        per-hour RSS
+    """
+    clock = VirtualClock()
+    job = make_job(fnconf, section, tmp, clock=clock, sim_curve=curve)
+    job.soundswitch.value = 0
+    steps, hourly = 0, []
+    tstart = perf_counter()
+    try:
+        for _ in range(100):
+            job.step()
+        gc.collect()
+        start, objects = rss_mb(), len(gc.get_objects())
+        for hour in range(1, hours + 1):
+            while clock.t < hour*3600:
+                clock.sleep(job.step())
+                steps += 1
+            hourly.append(rss_mb())
+        gc.collect()
+        end = rss_mb()
+        growth = len(gc.get_objects()) - objects
+    finally:
+        job._wrapup()
+    return {'hours': hours, 'steps': steps, 'wall_s': perf_counter() - tstart,
+            'start_mb': start, 'end_mb': end, 'peak_mb': max(hourly + [start]),
+            'growth_mb': end - start, 'objects_growth': growth,
+            'hourly_mb': hourly}
+
+
+def meta(section):
+    """Where and on what the suite ran, for comparing saved results."""
+    rev = run(['git', '-C', str(ROOT), 'rev-parse', '--short', 'HEAD'],
+              capture_output=True, text=True)
+    return {'time': time(), 'section': section,
+            'commit': rev.stdout.strip() or None,
+            'python': platform.python_version(),
+            'machine': platform.machine(), 'system': platform.system()}
+
+
+def flatten(d, prefix=''):
+    """Nested results as {'a.b.c': number}."""
+    out = {}
+    for k, v in d.items():
+        key = f'{prefix}{k}'
+        if isinstance(v, dict):
+            out.update(flatten(v, key + '.'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def compare(old, new, tolerance=0.2):
+    """Costs that changed between two suite results. Distributions are
+    compared by their medians.
+
+    Returns
+    -------
+    list of (key, old, new, ratio, regressed) tuples
+    """
+    a, b = flatten(old['results']), flatten(new['results'])
+    rows = []
+    for key in sorted(a.keys() & b.keys()):
+        if (not key.endswith(COSTS) or not a[key]
+                or key.rpartition('.')[2].startswith(SPREAD)):
+            continue
+        ratio = b[key]/a[key]
+        rows.append((key, a[key], b[key], ratio, ratio > 1 + tolerance))
+    return rows
+
+
+def suite(benchmarks, fnconf, section, n=None, trials=10, runs=3, hours=24):
+    """Run `benchmarks`, each against fresh stand-in hardware.
+
+    Parameters
+    ----------
+    n : int, optional
+        Calls or requests per loop, logging, and control measurement, by
+        default each benchmark's own
+    trials : int, optional
+        Threshold crossings timed by the audio benchmark, by default 10
+    runs : int, optional
+        Launches per subcommand for the startup benchmark, by default 3
+    hours : int, optional
+        Simulated hours for the memory benchmark, by default 24
+    """
+    results = {}
+    with TemporaryDirectory() as tmp:
+        for name in benchmarks:
+            kw = {} if n is None else {'n': n}
+            if name == 'loop':
+                results[name] = bench_loop(fnconf, section, tmp, **kw)
+            elif name == 'logging':
+                results[name] = bench_logging(**kw)
+            elif name == 'audio':
+                results[name] = bench_audio(fnconf, section, tmp, trials)
+            elif name == 'control':
+                results[name] = bench_control(fnconf, section, tmp, **kw)
+            elif name == 'startup':
+                results[name] = bench_startup(fnconf, section, runs)
+            elif name == 'memory':
+                results[name] = bench_memory(fnconf, section, tmp, hours)
+    return {'meta': meta(section), 'results': results}
+
+
+parser = ArgumentParser('Benchmark the Calcifer daemon against simulated '
+                        'hardware')
+parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS),
+                    help=f'benchmarks to run; default all of {list(BENCHMARKS)}')
+parser.add_argument('-n', type=int, default=None,
+                    help='calls or requests per loop, logging, and control '
+                         'measurement; default per benchmark')
+parser.add_argument('--trials', type=int, default=10,
+                    help='threshold crossings for the audio benchmark')
+parser.add_argument('--runs', type=int, default=3,
+                    help='launches per subcommand for the startup benchmark')
+parser.add_argument('--hours', type=int, default=24,
+                    help='simulated hours for the memory benchmark')
+parser.add_argument('--fnconf', type=str, default=str(ROOT / 'calcifer.ini'),
+                    help='Conf file')
+parser.add_argument('--section', type=str, default='SIM', help='Conf section')
+parser.add_argument('--json', action='store_true', help='machine-readable output')
+parser.add_argument('--out', type=str, default='',
+                    help='also write JSON results to this file')
+parser.add_argument('--compare', type=str, default='',
+                    help='JSON results of an earlier run to compare against')
+parser.add_argument('--tolerance', type=float, default=0.2,
+                    help='cost growth counted as a regression by --compare')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark:{name}')
+    res = suite(args.benchmarks, args.fnconf, args.section, args.n,
+                args.trials, args.runs, args.hours)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(dumps(res, indent=2))
+    if args.json:
+        print(dumps(res, indent=2))
+    elif not args.compare:
+        for key, v in flatten(res['results']).items():
+            print(f'{key:<40} {v:>12.4g}')
+    if args.compare:
+        with open(args.compare) as f:
+            rows = compare(load(f), res, args.tolerance)
+        fmt = '{:<40} {:>12} {:>12} {:>7}'
+        print(fmt.format('cost', 'old', 'new', 'ratio'))
+        for key, a, b, ratio, bad in rows:
+            print(fmt.format(key, f'{a:.4g}', f'{b:.4g}', f'{ratio:.2f}')
+                  + ('  REGRESSED' if bad else ''))
+        raise SystemExit(int(any(bad for *_, bad in rows)))
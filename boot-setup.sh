@@ -36,8 +36,13 @@ Description=Calcifer talking fireplace daemon. https://github.com/lowdrant/calci
 After=multi-user.target
 
 [Service]
+Type=notify
+NotifyAccess=main
+WatchdogSec=60
+Restart=on-failure
 ExecStart=$base --run
 ExecStop=$base --stop
+ExecReload=/bin/kill -HUP \$MAINPID
 User=pi
 
 [Install]
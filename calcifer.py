@@ -7,27 +7,42 @@ manner.
 Author: Marion Anderson
 """
 
-__all__ = ['Calcifer, temp_all', 'gen_tc_types']
+__all__ = ['Calcifer, temp_all', 'gen_tc_types', 'send']
 
 from argparse import ArgumentError, ArgumentParser
 from configparser import ConfigParser
-from logging import (CRITICAL, DEBUG, ERROR, INFO, WARNING, Formatter, Logger,
-                     StreamHandler)
+from configparser import Error as ConfigParserError
+from contextlib import nullcontext
+from logging import CRITICAL, DEBUG, ERROR, INFO, WARNING
+from math import nan
 from pathlib import Path
 from os import environ
-from random import randint
-from socket import AF_INET, SOCK_STREAM
-from socket import error as sock_error
-from socket import socket
-from sys import stdout
-from threading import Thread
-from time import sleep, time
-
-import board
-from digitalio import Direction as dioDirection
-from digitalio import Pull as dioPull
-from digitalio import DigitalInOut as dioDigitalInOut
-from adafruit_max31856 import MAX31856, ThermocoupleType
+from sys import stdin
+from threading import RLock
+from time import perf_counter, sleep
+
+from audio import AudioWorker, SoundCache
+from backends import ThermocoupleType, conversion_time, get_backend
+from channels import PARAM_KEYS, Channel, channel_conf
+from control import ControlServer, request
+from faults import DISCARD, FaultManager
+from logs import LOGFORMATS, PIPELINE, get_logger
+from metrics import JITTER_BUCKETS, Registry
+from sampling import Idle, Ticker, get_sampler
+from supervisor import Supervisor
+from telemetry import TelemetryWriter
+
+LOGLEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+# section keys `Calcifer.reload` applies live, besides channel `PARAM_KEYS`
+RELOAD_KEYS = ('loglevel', 'logformat', 'T_read', 'T_going', 'T_hbeat', 'tc_reset_delay',
+               'drdy_count_timeout', 'drdy_timeout', 'averaging',
+               'noise_rejection', 'sound_timeout', 'mixer_idle', 'conf_watch',
+               'sampling', 'T_min', 'T_max', 'max_rate', 'idle_after',
+               'T_idle', 'idle_rate')
+SAMPLER_KEYS = ('sampling', 'T_read', 'T_going', 'T_min', 'T_max', 'max_rate')
+IDLE_KEYS = ('idle_after', 'T_idle', 'idle_rate', 'T_hbeat')
+IDLE_BLINKS = 2  # heartbeat flashes per idle period
+IDLE_FLASH = 0.1  # seconds each idle heartbeat flash is lit
 
 
 def gen_tc_types():
@@ -52,7 +67,7 @@ def gen_tc_types():
     return [str(v) for v in dir(ThermocoupleType) if '_' not in v]
 
 
-def temp_all(spi, cs):
+def temp_all(spi, cs, backend=None, n=1):
     """Measure thermocouple temperature for all thermocouple types.
 
     Parameters
@@ -61,184 +76,664 @@ def temp_all(spi, cs):
         spi parameter for MAX31856 object
     cs : dioDigitalInOut object
         cs param for MAX31856 object
+    backend : backends object, optional
+        Hardware backend `spi` and `cs` came from, by default blinka
+    n : int, optional
+        Conversions averaged per type, by default 1
 
     Returns
     -------
     dict
         Temperature measurements keyed with thermocouple type
 
+    Notes
+    -----
+    Reads raw voltage and cold-junction temperature once per conversion in
+    voltage mode and computes every type from NIST reference functions, so
+    cost does not grow with the number of types. NumPy imported here to
+    avoid slowing daemon startup.
+
     See Also
     -------
-    adafruit_max31856.MAX31856
-    adafruit_max31856.ThermocoupleType
+    characterize.Characterizer
+    thermocouples
+    """
+    from characterize import Characterizer
+    if backend is None:
+        backend = get_backend('blinka')
+    assert cs.direction == backend.Direction.OUTPUT, 'cs must be output'
+    meas = Characterizer(backend, spi, cs).measure(n)
+    return {k: float(v.mean()) for k, v in meas.items()}
+
+
+def send(cmd, fnconf=None, section='DEFAULT', **kwargs):
+    """Send a control command to a running daemon. Only the control socket
+    keys are read from the config, so a daemon can be reached even when the
+    rest of the section would not validate (e.g. a missing calibration).
+
+    Parameters
+    ----------
+    cmd : str
+        Control command, e.g. 'stop'
+    fnconf : str, optional
+        Conf file, by default calcifer.ini
+    section : str, optional
+        Conf section, by default 'DEFAULT'
+    kwargs : optional
+        Config overrides, as for `Calcifer`
+
+    Returns
+    -------
+    dict
+        Daemon reply
+
+    Raises
+    ------
+    OSError
+        No daemon answering on the control socket
     """
-    assert cs.direction == dioDirection.OUTPUT, 'cs must be output'
-    outdict = {}
-    for k in gen_tc_types():
-        tctype = eval(f'ThermocoupleType.{k}')
-        tc = MAX31856(spi, cs, thermocouple_type=tctype)
-        outdict.update({k: tc.temperature})
-    return outdict
+    if fnconf is None:
+        fnconf = Path(__file__).resolve().parent / 'calcifer.ini'
+    conf = ConfigParser()
+    conf.read(fnconf)
+    sconf = dict(conf[section], **kwargs)
+    return request(cmd, sconf['control_socket'], sconf['host'],
+                   int(sconf['port']))
 
 
 class Calcifer(object):
     """
     Stateful mainloop for Calcifer talking fireplace sensing and actuation.
-    Uses threads to run temperature checker, heartbeat, and listen for
-    shutdown command.
+    Uses threads to run temperature checker and heartbeat, and an asyncio
+    control server for status queries and the shutdown command.
 
     States
     ------
     go         - Mainloop state. True for running, False for shutdown
-    fire_going - Fire detected state. True if fire detected, False otherwise
-    thresh     - Celsius threshold for fire off to fire on
-    off_thresh - Celsius threshold for fire on to fire off
+    fire_going - Fire detected state. True if fire detected on any channel
+    channels   - `channels.Channel` per amplifier, each with its own pins,
+                 tctype, detector thresholds, tempbuf, and fire state
+
+    Per-channel config keys (cs, drdy, tc_fault, tctype, thresh, off_thresh,
+    smoothing, detector, slope_window, rise_rate, fall_rate, combine, hold,
+    buflen, ema_alpha, calibration) take `<name>.<key>` values for each name
+    listed in the `channels` config key, falling back to the section's
+    `<key>`. With no `channels`, the section keys describe a single channel.
+    `tc`, `cs`, `drdy`, `tc_fault`, `tempbuf`, and `detector` refer to the
+    first channel.
 
 
     Threading
     ---------
-    host        - IP to listen for shutdown command on
-    port        - port to listen for shutdown command on
-    sock        - socket listening for shutdown command
-    runthread   - mainloop thread - performs temperature checking and sound playing
-    sockthread  - thread for socket listening
-    hbeatthread - thread for blinking heartbeat LED
+    control_socket - Unix socket path for control commands; empty disables
+    host           - IP to listen for control commands on over TCP
+    port           - TCP port for control commands; 0 disables TCP
+    control        - `control.ControlServer` thread serving both sockets
+    metrics_port   - TCP port for Prometheus metrics over HTTP; 0 disables
+    supervisor  - `supervisor.Supervisor` running and watching the worker
+                  threads, restarting them with `fault_*` backoff: `run` (temperature checking and
+                  sound playing), `hbeat` (heartbeat LED), and `watchconf`
+                  (reloading config when `fnconf` changes, if enabled)
+    watchdog    - seconds between supervisor checks; shortened to half of
+                  systemd's WatchdogSec
+    stall_slack - seconds a worker may miss its next beat by before it
+                  counts as stalled
+    audio       - sound playback worker thread
+    lock        - held while channels are sampled; `reload` takes it to
+                  change amplifier config or ring buffers
+
+    Metrics
+    -------
+    metrics     - `metrics.Registry` of counters, gauges, and histograms:
+                  SPI read time, samples, DRDY misses, power cycles, sound
+                  start and play time, loop jitter, temperatures, and states
+    loop_jitter - `_run` iteration start past its due time
+
+    Reload
+    ------
+    conf_watch - seconds between `fnconf` modification checks; 0 disables
+    `reload` reapplies changed config without restarting; it runs on SIGHUP,
+    the `reload` control command, and `fnconf` changes. See `RELOAD_KEYS`
+    and `channels.PARAM_KEYS`.
 
     Timing
     ------
+    sampling           - sample period scheduler: `fixed` uses T_read and
+                         T_going; `adaptive` uses T_min, T_max, max_rate
+    sampler            - `sampling` scheduler instance
+    ticker             - `sampling.Ticker` sleeping the mainloop to deadlines
+                         one sampler period apart
     T_read             - Frequency of temperature reading when fire off
     T_going            - Frequency of temperature reading when fire going
+    T_min, T_max       - adaptive sample period bounds
+    max_rate           - degC/min change the adaptive period always allows
+                         for; sets worst-case latency far from thresholds
     T_hbeat            - Heartbeat LED frequency
+    idle               - `sampling.Idle` duty cycling the daemon on cold,
+                         flat readings
+    idle_after         - seconds of cold, flat readings before idling; 0
+                         disables
+    T_idle             - seconds between samples while idle
+    idle_rate          - degC/min slope still counted as flat; resumes on a
+                         faster rise
+    amp_off            - whether idle has the amplifiers powered down
+    sound_timeout      - Max seconds a sound may play
+    mixer_idle         - Seconds audio mixer stays open after a sound; 0 for always
+    sound_cache_mb     - Memory budget for decoded sounds; 0 streams from disk
     tc_reset_delay     - Delay before repowering TC amp
-    drdy_count         - Number of times TC drdy pin hasn't been ready
-    drdy_count_timeout - max drdy_count before power cycling TC
+    powercycles        - Number of TC amp power cycles
+
+    Faults
+    ------
+    faults              - FaultManager decoding amplifier faults and running
+                          recoveries off the sampler thread
+    drdy_count_timeout  - max consecutive missed conversions on a channel
+                          before recovering its amplifier
+    fault_backoff       - seconds between first recovery attempts; doubles
+                          per failed attempt
+    fault_backoff_max   - longest seconds between recovery attempts
+    fault_breaker       - failed attempts before a recovery is suspended
+    fault_breaker_reset - seconds a suspended recovery waits for a trial
+    fault_settle        - fault-free seconds that count a recovery as held
+
+    Telemetry
+    ---------
+    telemetry        - TelemetryWriter recording every sample, or None
+    telemetry_dir    - directory for telemetry files; empty disables
+    telemetry_rotate - seconds of samples per telemetry file
+    telemetry_flush  - seconds between telemetry disk writes
+    fresh            - whether the latest loop iteration read every channel
+
+    Acquisition
+    -----------
+    acquisition  - `poll` reads every `sampler` period; `event` reads each
+                   conversion as soon as DRDY falls
+    drdy_timeout - seconds to wait for a DRDY edge before counting a timeout
+    drdy_poll    - DRDY sampling interval when edge detection is unavailable
+
+    Every channel's conversion is started before any is waited on, so the
+    amplifiers convert in parallel and a loop iteration takes about one
+    conversion time whatever the channel count.
+
+    Conversion
+    ----------
+    conversion      - `oneshot` triggers and waits for a conversion per read;
+                      `continuous` leaves the amplifier auto-converting and
+                      reads only the result registers
+    averaging       - samples averaged on-chip per conversion: 1/2/4/8/16
+    noise_rejection - mains filter frequency: 50 or 60 Hz
+
+    Hardware
+    --------
+    Claimed by `setup` (or only the thermocouples by `setup_tc`) on
+    construction, or on `start` when constructed with `setup=False`.
+    backend     - GPIO/SPI/amplifier provider, real (blinka) or simulated (sim)
+    clock       - time source with `monotonic`, `time`, and `sleep`; the
+                  `time` module unless replaying on a virtual clock
 
     GPIO Pins
     ---------
-    cs          - TC amplifier chip select pins
-    drdy        - TC amplifier data ready pin
+    cs          - TC amplifier chip select pins, per channel
+    drdy        - TC amplifier data ready pin, per channel
+    tc_fault    - TC amplifier fault pin, per channel
     hbeat       - heartbeat LED pin
     tc_reset    - TC power supply relay pin
     fault       - fault LED
     soundswitch - sound control pin input
     """
-    def  __init__(self, fnconf=None, section='DEFAULT', **kwargs):
+    def  __init__(self, fnconf=None, section='DEFAULT', clock=None, setup=True,
+                  **kwargs):
         # Config Setup
         if fnconf is None:
             fnconf = Path(__file__).resolve().parent / 'calcifer.ini'
         self.fnconf = fnconf  # for --bg cli simply access
-        conf = ConfigParser()
-        try:
-            conf.read(fnconf)
-        except OSError as e:
-            print('os error on conf read')
-
-        # Overwrite Config File
-        for k, v in kwargs.items():
-            conf[section][k] = v
+        self.section = section
+        self.overrides = kwargs  # reapplied on every reload
+        conf = self._readconf()
+        self.conf = dict(conf)  # section as of last (re)load
 
         # Read Config Params
         # - before major setup so errors avoid consuming resources
         # logging
-        self.loglevel = eval(conf[section]['loglevel'])
+        self.loglevel = eval(conf['loglevel'])
+        self.logformat = conf['logformat']
         self._configlogger()
         # timing params
-        self.T_read = float(conf[section]['T_read'])
-        self.T_going = float(conf[section]['T_going'])
-        self.T_hbeat = float(conf[section]['T_hbeat'])/2  # half for on/off cycle
-        self.tc_reset_delay = float(conf[section]['tc_reset_delay'])
-        self.drdy_count = 0  # timeout counter
-        self.drdy_count_timeout = int(conf[section]['drdy_count_timeout'])
-        # hysterysis temperature state thresholds
-        self.thresh = float(conf[section]['thresh'])
-        self.off_thresh = float(conf[section]['off_thresh'])
+        self.T_read = float(conf['T_read'])
+        self.T_going = float(conf['T_going'])
+        self.sampling = conf['sampling']
+        self.T_min = float(conf['T_min'])
+        self.T_max = float(conf['T_max'])
+        self.max_rate = float(conf['max_rate'])
+        self.sampler = self._sampler(vars(self))
+        self.T_hbeat = float(conf['T_hbeat'])/2  # half for on/off cycle
+        self.idle_after = float(conf['idle_after'])
+        self.T_idle = float(conf['T_idle'])
+        self.idle_rate = float(conf['idle_rate'])
+        self.idle = Idle(self.idle_after, self.T_idle, self.idle_rate,
+                         self.T_hbeat)
+        self.amp_off = False
+        self._amp_on = None  # when idle last powered the amplifiers up
+        self.tc_reset_delay = float(conf['tc_reset_delay'])
+        self.powercycles = 0
+        self.drdy_count_timeout = int(conf['drdy_count_timeout'])
+        self.fault_backoff = float(conf['fault_backoff'])
+        self.fault_backoff_max = float(conf['fault_backoff_max'])
+        self.fault_breaker = int(conf['fault_breaker'])
+        self.fault_breaker_reset = float(conf['fault_breaker_reset'])
+        self.fault_settle = float(conf['fault_settle'])
+        self.conf_watch = float(conf['conf_watch'])
+        self.watchdog = float(conf['watchdog'])
+        self.stall_slack = float(conf['stall_slack'])
+        # acquisition mode
+        self.acquisition = conf['acquisition']
+        if self.acquisition not in ('poll', 'event'):
+            raise ValueError(f'invalid acquisition:{self.acquisition}')
+        self.drdy_timeout = float(conf['drdy_timeout'])
+        self.drdy_poll = float(conf['drdy_poll'])
+        # amplifier conversion mode
+        self.conversion = conf['conversion']
+        if self.conversion not in ('oneshot', 'continuous'):
+            raise ValueError(f'invalid conversion:{self.conversion}')
+        self.averaging = int(conf['averaging'])
+        if self.averaging not in (1, 2, 4, 8, 16):
+            raise ValueError(f'invalid averaging:{self.averaging}')
+        self.noise_rejection = int(conf['noise_rejection'])
+        if self.noise_rejection not in (50, 60):
+            raise ValueError(f'invalid noise_rejection:{self.noise_rejection}')
+        # thermocouple channels; thresholds, detectors, and tctype per channel
+        self.channel_names = conf['channels'].split() or ['']
+        for name in self.channel_names:  # validate before claiming hardware
+            Channel.parse(channel_conf(conf, name))
         # sound files
         self.soundpath = Path(__file__).resolve().parent / 'sounds'
-        self.soundfns = list(self.soundpath.iterdir())
-        # socket connections
-        self.host = conf[section]['host']
-        self.port = int(conf[section]['port'])
-        # thermocouple
-        self._tctype_str = conf[section]['tctype']  # for debugging
-        self.tctype =  eval(f'ThermocoupleType.{conf[section]["tctype"]}')
+        self.sound_timeout = float(conf['sound_timeout'])
+        self.sound_cache_mb = float(conf['sound_cache_mb'])
+        self.mixer_idle = float(conf['mixer_idle'])
+        # telemetry
+        self.telemetry_dir = conf['telemetry_dir']
+        self.telemetry_rotate = float(conf['telemetry_rotate'])
+        self.telemetry_flush = float(conf['telemetry_flush'])
+        # control sockets
+        self.control_socket = conf['control_socket']
+        self.host = conf['host']
+        self.port = int(conf['port'])
+        self.metrics_port = int(conf['metrics_port'])
 
         # Internal Setup
-        self._buflen = 2  # buffer length
-        self.clr_tempbuf()  # set self.tempbuf, self.bufndx
-        self.fire_going = False
-        self.runthread = None
-        self.sockthread = None
-        self.hbeatthread = None
+        self.lock = RLock()  # held by step; reloads and recoveries wait on it
+        self.metrics = Registry()
         self.go = False
+        self._clock = clock
+        # claimed by setup_tc/setup
+        self.backend = self.clock = self.spi = self.ticker = None
+        self.channels = []
+        self.sounds = self.audio = self.telemetry = self.control = None
+        self.faults = self.supervisor = None
+        self.tc_reset = self.hbeat = self.fault = self.soundswitch = None
+
+        if setup:
+            self.setup()
+
+    def setup_tc(self):
+        """Claim the hardware backend, SPI bus, and thermocouple channels.
+        Enough for reading temperatures; idempotent."""
+        if self.backend is not None:
+            return
+        conf = self.conf
+        self.backend = get_backend(conf['backend'], conf, clock=self._clock)
+        self.clock = self.backend.clock  # sample timestamps and loop sleeps
+        self.ticker = Ticker(self.clock)
+        self.spi = self.backend.eval(conf['spi'])
+        self.channels = [
+            Channel(name, channel_conf(conf, name), self.backend, self.spi,
+                    acquisition=self.acquisition, conversion=self.conversion,
+                    averaging=self.averaging,
+                    noise_rejection=self.noise_rejection,
+                    drdy_poll=self.drdy_poll, metrics=self.metrics)
+            for name in self.channel_names]
+        self._log_conversion()
+
+    def setup(self):
+        """Claim everything the mainloop uses: thermocouples (`setup_tc`),
+        relay, LED, and switch pins, sounds, telemetry, and the control
+        server. Called by `start`; idempotent.
 
-        # Thermocouple Setup
-        self.spi = eval(conf[section]['spi'])
-        self.cs = dioDigitalInOut(eval(conf[section]['cs']))
-        self.cs.direction = dioDirection.OUTPUT
-        self.drdy = dioDigitalInOut(eval(conf[section]['drdy']))
-        self.drdy.direction = dioDirection.INPUT
-        self.drdy.pull = dioPull.DOWN
-        self._configtc()
-        self.tc_fault = dioDigitalInOut(eval(conf[section]['tc_fault']))
-        self.tc_fault.direction = dioDirection.INPUT
+        Notes
+        -----
+        Construct with `setup=False` to defer this, so commands that only
+        need the config (e.g. `stop`) never touch GPIO or SPI.
+        """
+        if self.control is not None:
+            return
+        self.setup_tc()
+        conf = self.conf
+        dioDigitalInOut = self.backend.DigitalInOut
+        dioDirection = self.backend.Direction
+        dioPull = self.backend.Pull
+        pin = self.backend.eval
+
+        # Sound + Telemetry Setup
+        self.sounds = SoundCache(self.soundpath, int(self.sound_cache_mb*2**20))
+        self.audio = AudioWorker(self.logger, self.sounds,
+                                 timeout=self.sound_timeout,
+                                 mixer_idle=self.mixer_idle,
+                                 metrics=self.metrics)
+        if self.telemetry_dir:
+            self.telemetry = TelemetryWriter(
+                self.telemetry_dir, rotate=self.telemetry_rotate,
+                flush=self.telemetry_flush, logger=self.logger)
 
         # TC Reset Relay Setup
-        self.tc_reset = dioDigitalInOut(eval(conf[section]['tc_reset']))
+        self.tc_reset = dioDigitalInOut(pin(conf['tc_reset']))
         self.tc_reset.direction = dioDirection.OUTPUT
         self.tc_reset.value = 0
 
         # Indicator LED Setup
-        self.hbeat = dioDigitalInOut(eval(conf[section]['hbeat']))
+        self.hbeat = dioDigitalInOut(pin(conf['hbeat']))
         self.hbeat.direction = dioDirection.OUTPUT
         self.hbeat.value = 0
-        self.fault = dioDigitalInOut(eval(conf[section]['fault']))
+        self.fault = dioDigitalInOut(pin(conf['fault']))
         self.fault.direction = dioDirection.OUTPUT
         self.fault.value = 0
 
         # Sound Control Switch Setup
-        self.soundswitch = dioDigitalInOut(eval(conf[section]['soundswitch']))
+        self.soundswitch = dioDigitalInOut(pin(conf['soundswitch']))
         self.soundswitch.direction = dioDirection.INPUT
         self.soundswitch.pull = dioPull.UP
 
-        # Socket Setup
-        self.sock = socket(AF_INET, SOCK_STREAM)
+        # Fault Recovery
+        self.faults = FaultManager(
+            self, base=self.fault_backoff, cap=self.fault_backoff_max,
+            limit=self.fault_breaker, reset=self.fault_breaker_reset,
+            settle=self.fault_settle, metrics=self.metrics)
+
+        # Worker Supervision; restarts back off like recoveries
+        self.supervisor = Supervisor(
+            self, self.watchdog, self.stall_slack,
+            backoff=dict(base=self.fault_backoff, cap=self.fault_backoff_max,
+                         limit=self.fault_breaker,
+                         reset=self.fault_breaker_reset,
+                         settle=self.fault_settle),
+            metrics=self.metrics)
+
+        # Control Server Setup
+        self.control = ControlServer(self, self.control_socket, self.host,
+                                     self.port, self.metrics_port)
+
+        # Metrics
+        self._configmetrics()
 
         # Log
-        self.logger.debug(f'Calcifer setup complete. Configuration:{dict(conf[section])}')
+        self.logger.debug(f'Calcifer setup complete. Configuration:{conf}')
 
-    def _configtc(self):
-        """Update `self.tc` with current spi, cs, tctype params.
+    def _readconf(self):
+        """Read `self.section` of `self.fnconf` with `self.overrides`
+        applied.
+
+        Returns
+        -------
+        configparser.SectionProxy
+            Config values, including DEFAULT fallbacks
+        """
+        conf = ConfigParser()
+        try:
+            conf.read(self.fnconf)
+        except OSError as e:
+            print('os error on conf read')
+        for k, v in self.overrides.items():  # overwrite config file
+            conf[self.section][k] = v
+        return conf[self.section]
+
+    def reload(self):
+        """Reread the config file and apply what changed without restarting.
+
+        Returns
+        -------
+        dict
+            `changed`: applied keys, `name.key` for channel keys of named
+            channels; `restart`: changed keys that only take effect on
+            restart; `ms`: reload time in milliseconds
+
+        Raises
+        ------
+        ValueError, KeyError
+            Invalid config; nothing is applied
 
         Notes
         -----
-        Uses SPI bus, so can only be called after SPI bus setup
+        New values are compared against the running ones, so a threshold
+        set over the control socket reverts to the file's value on reload.
+        Buffered samples and fire states are kept. Parsing happens off the
+        sampler thread. Amplifier and ring buffer changes wait for
+        `self.lock`, i.e. at most one conversion; everything else is a plain
+        attribute swap. Sleep periods take effect from the next iteration.
         """
-        self.tc = MAX31856(self.spi, self.cs, thermocouple_type=self.tctype)
+        tstart = perf_counter()
+        try:
+            conf = self._readconf()
+        except ConfigParserError as e:
+            raise ValueError(f'unreadable config: {e}') from e
+        loglevel = conf['loglevel']
+        if loglevel not in LOGLEVELS:
+            raise ValueError(f'invalid loglevel:{loglevel}')
+        logformat = conf['logformat']
+        if logformat not in LOGFORMATS:
+            raise ValueError(f'invalid logformat:{logformat}')
+        new = {'T_read': float(conf['T_read']),
+               'T_going': float(conf['T_going']),
+               'T_hbeat': float(conf['T_hbeat'])/2,
+               'tc_reset_delay': float(conf['tc_reset_delay']),
+               'drdy_count_timeout': int(conf['drdy_count_timeout']),
+               'drdy_timeout': float(conf['drdy_timeout']),
+               'conf_watch': float(conf['conf_watch']),
+               'averaging': int(conf['averaging']),
+               'noise_rejection': int(conf['noise_rejection']),
+               'sound_timeout': float(conf['sound_timeout']),
+               'mixer_idle': float(conf['mixer_idle']),
+               'sampling': conf['sampling'], 'T_min': float(conf['T_min']),
+               'T_max': float(conf['T_max']),
+               'max_rate': float(conf['max_rate']),
+               'idle_after': float(conf['idle_after']),
+               'T_idle': float(conf['T_idle']),
+               'idle_rate': float(conf['idle_rate'])}
+        sampler = self._sampler(new)
+        idle = Idle(new['idle_after'], new['T_idle'], new['idle_rate'],
+                    new['T_hbeat'])  # validates
+        if new['averaging'] not in (1, 2, 4, 8, 16):
+            raise ValueError(f'invalid averaging:{new["averaging"]}')
+        if new['noise_rejection'] not in (50, 60):
+            raise ValueError(f'invalid noise_rejection:{new["noise_rejection"]}')
+        chparams = [Channel.parse(channel_conf(conf, ch.name))
+                    for ch in self.channels]
+
+        # only amplifier and ring buffer changes wait out a conversion
+        hw = ('tctype', 'buflen', 'ema_alpha')
+        wait = (new['averaging'] != self.averaging
+                or new['noise_rejection'] != self.noise_rejection
+                or any(p[k] != ch.params[k] for k in hw
+                       for ch, p in zip(self.channels, chparams)))
+        changed = []
+        with self.lock if wait else nullcontext():
+            if eval(loglevel) != self.loglevel:
+                self.set_loglevel(loglevel)
+                changed.append('loglevel')
+            if logformat != self.logformat:
+                self.logformat = logformat
+                self._configlogger()
+                changed.append('logformat')
+            for k, v in new.items():
+                if getattr(self, k) != v:
+                    setattr(self, k, v)
+                    changed.append(k)
+            if any(k in changed for k in SAMPLER_KEYS):
+                sampler.last = min(self.sampler.last, sampler.last)
+                self.sampler = sampler
+            if any(k in changed for k in IDLE_KEYS):
+                self.idle.after, self.idle.period = idle.after, idle.period
+                self.idle.rate, self.idle.hbeat = idle.rate, idle.hbeat
+                if not self.idle_after:
+                    self.idle.wake(self.clock.monotonic())
+            if self.audio is not None:
+                self.audio.timeout = self.sound_timeout
+                self.audio.mixer_idle = self.mixer_idle
+            if 'averaging' in changed or 'noise_rejection' in changed:
+                for ch in self.channels:
+                    ch.averaging = self.averaging
+                    ch.noise_rejection = self.noise_rejection
+                self._configtc()
+            for ch, p in zip(self.channels, chparams):
+                changed += [f'{ch.name}.{k}' if ch.name else k
+                            for k in ch.reconfigure(p)]
+        old, self.conf = self.conf, dict(conf)  # keys lowercased
+        live = [k.lower() for k in RELOAD_KEYS]
+        restart = sorted(k for k in old.keys() | self.conf.keys()
+                         if old.get(k) != self.conf.get(k) and k not in live
+                         and k.rpartition('.')[2] not in PARAM_KEYS)
+        ms = (perf_counter() - tstart)*1000
+        self.logger.info(f'config reloaded in {ms:.1f}ms; changed:{changed}')
+        if restart:
+            self.logger.warning(f'config keys need restart:{restart}')
+        return {'changed': changed, 'restart': restart, 'ms': ms}
+
+    @staticmethod
+    def _sampler(p):
+        """Sample period scheduler from `SAMPLER_KEYS` values in `p`."""
+        return get_sampler(p['sampling'], T_read=p['T_read'],
+                           T_going=p['T_going'], T_min=p['T_min'],
+                           T_max=p['T_max'], max_rate=p['max_rate'])
+
+    def _try_reload(self, reason):
+        """`reload`, logging instead of raising on bad config."""
+        self.logger.info(f'reloading config on {reason}')
+        try:
+            self.reload()
+        except Exception as e:
+            self.logger.error(f'config reload failed, keeping running config: {e!r}')
+
+    def _sighup(self, signum, frame):
+        """SIGHUP handler; reloads config."""
+        self._try_reload('SIGHUP')
+
+    def _configmetrics(self):
+        """Register daemon series on `self.metrics`. Loop series are updated
+        by `_run`; the rest are read when rendered."""
+        m = self.metrics
+        self.loop_jitter = m.histogram(
+            'loop_jitter_seconds', 'Mainloop wakeup past its deadline, one '
+            'sample period after the previous deadline', JITTER_BUCKETS)
+        m.counter('loop_overruns_total', 'Mainloop iterations that ran past '
+                  'the next deadline', fn=lambda: self.ticker.overruns)
+        self.loop_seconds = m.histogram(
+            'loop_seconds', 'Mainloop iteration run time', JITTER_BUCKETS)
+        m.gauge('fire_going', 'Fire detected on any channel',
+                fn=lambda: self.fire_going)
+        m.gauge('fault', 'Fault LED state', fn=lambda: self.fault.value)
+        m.counter('powercycles_total', 'TC amp power cycles',
+                  fn=lambda: self.powercycles)
+        m.gauge('period_seconds', 'Sampling period in poll acquisition',
+                fn=lambda: self.sampler.last)
+        m.gauge('idle', 'Idling on cold, flat readings',
+                fn=lambda: self.idle.active)
+        m.counter('idle_seconds_total', 'Seconds spent idle',
+                  fn=lambda: self._idle_status()['seconds'])
+        m.counter('idle_wakeups_saved_total', 'Sampler and heartbeat wakeups '
+                  'saved by idling', fn=lambda: self._idle_status()['saved'])
+        m.counter('log_dropped_total', 'Log records dropped on a full queue',
+                  fn=lambda: PIPELINE.dropped)
+        m.counter('sounds_total', 'Sounds played', fn=lambda: self.audio.played)
+        m.counter('control_requests_total', 'Control commands run',
+                  fn=lambda: self.control.requests)
+        m.gauge('control_clients', 'Connected control clients',
+                fn=lambda: self.control.clients)
+        if self.telemetry is not None:
+            m.counter('telemetry_records_total', 'Telemetry records written',
+                      fn=lambda: self.telemetry.written)
+            m.counter('telemetry_dropped_total', 'Telemetry records dropped',
+                      fn=lambda: self.telemetry.dropped)
+
+    def _idle_status(self):
+        return self.idle.status(self.clock.monotonic())
+
+    def _amp_power(self, on):
+        """Power the amplifiers up, configuring them once powered, or down
+        through the `tc_reset` relay for idle. Amplifiers being power cycled
+        by a recovery are left alone, so an idle wakeup never re-energizes
+        the relay during a recovery's off interval; power-up is retried on
+        the next sample."""
+        if on:
+            with self.lock:
+                if any(ch.recovering for ch in self.channels):
+                    return
+                self._amp_on = self.clock.monotonic()
+                self.tc_reset.value = False
+            self.clock.sleep(self.tc_reset_delay)
+            with self.lock:
+                if not any(ch.recovering for ch in self.channels):
+                    for ch in self.channels:  # else the recovery configures
+                        ch.configtc()
+                self.amp_off = False
+            return
+        with self.lock:
+            if any(ch.recovering for ch in self.channels):
+                return
+            self.tc_reset.value = True
+            self.amp_off = True
+        if self._amp_on is not None:
+            self.idle.powered += self.clock.monotonic() - self._amp_on
+            self._amp_on = None
+
+    def _configtc(self):
+        """Reconfigure every channel's amplifier, e.g. after a power cycle."""
+        for ch in self.channels:
+            ch.configtc()
+        self._log_conversion()
+
+    def _log_conversion(self):
+        if self.conversion == 'continuous':
+            T = conversion_time(False, self.averaging, self.noise_rejection)
+            self.logger.info(f'continuous conversion every {T*1000:.0f}ms')
 
     def _configlogger(self):
-        """Update `self.logger` with current loglevel param."""
-        self.logger = Logger(__file__)
-        handler = StreamHandler(stdout)
-        handler.setLevel(self.loglevel)
-        formatter = Formatter('%(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
-    def set_tc_type(self, tctype):
+        """Apply loglevel and logformat params to the shared `calcifer`
+        logger; see `logs.get_logger`."""
+        self.logger = get_logger(self.loglevel, self.logformat)
+
+    def set_tc_type(self, tctype, channel=None):
         """Update thermocouple type.
 
         Parameters
         ----------
         tctype : str
             Thermocouple type being read; attribute of `ThermocoupleType`
+        channel : str, optional
+            Channel name to update, by default all channels
 
         See Also
         --------
         adafruit_max31856.ThermocoupleType
         """
-        self._tctypestr = tctype
-        self.tctype = eval(f'ThermocoupleType.{tctype}')
-        self._configtc()
+        for ch in self.channels:
+            if channel is None or ch.name == channel:
+                ch.set_tc_type(tctype)
+
+    def set_thresholds(self, thresh, off_thresh, channel=None):
+        """Update fire detection thresholds.
+
+        Parameters
+        ----------
+        thresh : float
+            Celsius threshold for fire off to fire on
+        off_thresh : float
+            Celsius threshold for fire on to fire off
+        channel : str, optional
+            Channel name to update, by default all channels
+        """
+        if not off_thresh < thresh:
+            raise ValueError(f'off_thresh:{off_thresh} must be below thresh:{thresh}')
+        for ch in self.channels:
+            if channel is None or ch.name == channel:
+                ch.set_thresholds(thresh, off_thresh)  # keeps detector state
 
     def set_loglevel(self, loglevel):
         """Change logger loglevel
@@ -254,174 +749,331 @@ class Calcifer(object):
         logging
         logging.Logger
         """
-        if str(loglevel) not in ('DEBUG','INFO','WARNING','ERROR','CRITICAL'):
+        if str(loglevel) not in LOGLEVELS:
             self.logger.error(f'invalid loglevel:{loglevel}')
             return
         self.loglevel = eval(loglevel)
         self._configlogger()
 
+    @property
+    def tc(self):
+        """First channel's amplifier"""
+        return self.channels[0].tc
+
+    @property
+    def cs(self):
+        """First channel's chip select"""
+        return self.channels[0].cs
+
+    @property
+    def drdy(self):
+        """First channel's data ready pin"""
+        return self.channels[0].drdy
+
+    @property
+    def tc_fault(self):
+        """First channel's fault pin"""
+        return self.channels[0].tc_fault
+
+    @property
+    def tempbuf(self):
+        """First channel's temperature ring buffer"""
+        return self.channels[0].tempbuf
+
+    @property
+    def detector(self):
+        """First channel's fire detector"""
+        return self.channels[0].detector
+
     @property
     def temperature(self):
-        """Read sensor temperature"""
-        return self.tc.temperature
+        """Read first channel's sensor temperature. See
+        `Channel.temperature`."""
+        return self.channels[0].temperature
+
+    @property
+    def fire_going(self):
+        """Whether a fire is detected on any channel."""
+        return any(ch.fire_going for ch in self.channels)
+
+    @property
+    def fresh(self):
+        """Whether the latest loop iteration read every channel."""
+        return all(ch.fresh for ch in self.channels)
 
     def clr_tempbuf(self):
-        """Fill temperature buffer with zeros & reset buffer index."""
-        self.tempbuf = [0 for i in range(self._buflen)]
-        self.bufndx = 0
+        """Empty every channel's temperature ring buffer."""
+        for ch in self.channels:
+            ch.clr_tempbuf()
 
     def update_tempbuf(self):
-        """Update self.tempbuf circular buffer."""
-        # check that data is ready to be read
-        drdyval = self.drdy.value
-        if drdyval:
-            self.bufndx = (self.bufndx + 1) % self._buflen  # current data ndx
-            self.tempbuf[self.bufndx] = self.temperature
-            self.drdy_count = 0  # reset timeout counter
-        self.logger.debug(f'drdy before read:{self.drdy.value}')
-        self.logger.debug(f'tc_fault before read:{self.tc_fault.value}')
-        # timeout condition
-        self.logger.debug(f'drdy_count:{self.drdy_count}')
-        if self.drdy_count < self.drdy_count_timeout and self.tc_fault.value==1:
-            self.fault.value = 0
-        else:
-            self.fault.value = 1
-        self.logger.debug(f'fault:{self.fault.value}')
-        if self.drdy_count > self.drdy_count_timeout:
-            self.logger.critical(f'drdy timed out; power cycling max')
-            self.powercycle_max()
-        if self.tc_fault.value:
-            self.logger.critical(f'tc_fault:{self.tc_fault.value}')
+        """Acquire a sample on every channel. All conversions are started
+        before any is waited on, so the amplifiers convert in parallel.
+        Channels being power cycled are skipped."""
+        started = [not ch.recovering and ch.begin() for ch in self.channels]
+        deadline = self.clock.monotonic() + self.drdy_timeout
+        for ch, ok in zip(self.channels, started):
+            if ch.recovering:
+                ch.fresh = False
+                continue
+            read = ok and ch.finish(deadline)
+            ch.fresh = read and not ch.fault_classes & DISCARD
+            if read:
+                ch.drdy_count = 0
+            else:
+                ch.drdy_count += 1
+                ch.misses.inc()
+                self.logger.warning('%s drdy timeout; drdy_count:%d', ch.name,
+                                    ch.drdy_count,
+                                    extra={'channel': ch.name,
+                                           'drdy_count': ch.drdy_count})
+        self._check_faults()
+
+    def read_once(self):
+        """Read one conversion per channel through `Channel.begin` and
+        `Channel.finish`, for one-off reads outside the mainloop. Waits up
+        to `drdy_timeout` for each amplifier to be ready and convert.
+
+        Returns
+        -------
+        list of float
+            Temperature per channel; NaN if no valid conversion was read
+        """
+        deadline = self.clock.monotonic() + self.drdy_timeout
+        started = [False] * len(self.channels)
+        while True:
+            started = [ok or ch.begin()
+                       for ch, ok in zip(self.channels, started)]
+            if all(started) or self.clock.monotonic() >= deadline:
+                break
+            self.clock.sleep(self.drdy_poll)
+        temps = []
+        for ch, ok in zip(self.channels, started):
+            n = len(ch.tempbuf)
+            read = ok and ch.finish(deadline)
+            fresh = read and len(ch.tempbuf) > n
+            temps.append(ch.tempbuf.last if fresh else nan)
+        return temps
+
+    def _check_faults(self):
+        """Update fault LED and request recoveries from `self.faults`;
+        recoveries run on its worker thread."""
+        self.fault.value = int(self.faults.check(self.channels,
+                                                 self.clock.monotonic()))
+        self.logger.debug('fault:%s', self.fault.value)
 
-        self.drdy_count += 1  # increment timeout counter every time
+    @property
+    def soundfns(self):
+        """Playable files in `sounds/` directory."""
+        return self.sounds.scan()
+
+    def record_sample(self):
+        """Append latest loop iteration to telemetry, if enabled."""
+        if self.telemetry is not None:
+            t = self.clock.time()
+            fault = bool(self.fault.value)
+            for i, ch in enumerate(self.channels):
+                self.telemetry.record(t, ch.tempbuf.last if ch.fresh else nan,
+                                      ch.fresh, fault, ch.fire_going, i)
 
     def soundbyte(self):
-        """Play random file from `sounds/` directory."""
-        n = randint(0, len(self.soundfns)-1)
-        fn = self.soundfns[n]
-        # https://github.com/TaylorSMarks/playsound/issues/16
-        mixer.init()  # only have mixer going when playing
-        mixer.music.load(fn)
-        self.logger.debug(f'playing {fn}')
-        tstart = time()
-        mixer.music.play()
-        while mixer.music.get_busy():  # TODO: infinite loop
-            self.logger.debug(f'sound playing time: {(time()-tstart):.1f}s')
-            sleep(1)
-        mixer.quit()  # stop mixer to avoid underrun
+        """Queue random file from `sounds/` directory on the audio worker.
+        Returns immediately; playback happens on `self.audio`'s thread."""
+        fn = self.sounds.choice()
+        if fn is None:
+            self.logger.error('no playable sounds in %s', self.soundpath)
+            return
+        self.audio.play(fn)
+
+    def step(self):
+        """Run one mainloop iteration: read temperatures, update fire states,
+        play sound on fire start, and record telemetry. While idle the
+        amplifiers are powered up for the sample and down after it.
+
+        Returns
+        -------
+        float
+            Seconds to wait before the next iteration; 0 when acquisition
+            already waited for the conversion
+        """
+        if self.amp_off:
+            self._amp_power(True)
+        with self.lock:
+            self.update_tempbuf()
+        self.logger.debug('channels:%s', self.channels)
+
+        was_going = self.fire_going
+        for ch in self.channels:
+            going = ch.detect()
+            if going == ch.fire_going:
+                continue
+            ch.fire_going = going
+            label = f'{ch.name} ' if ch.name else ''
+            extra = {'channel': ch.name, 'fire_going': going}
+            if going:
+                # TODO: log thresh cross
+                self.logger.info('%sFire going, tempbuf:%s', label, ch.tempbuf,
+                                 extra=extra)
+            else:
+                self.logger.info('%sFire no longer going, tempbuf:%s', label,
+                                 ch.tempbuf, extra=extra)
+
+        if self.fire_going and not was_going:
+            if self.soundswitch.value:
+                self.logger.info('soundswitch high; playing sound')
+                self.soundbyte()
+            else:
+                self.logger.info('soundswitch low; not playing sound')
+
+        self.record_sample()
+        if self.acquisition == 'event':
+            period = 0
+        else:
+            period = self.sampler.period(self.channels, was_going)
+        return self._idle(was_going, period)
+
+    def _idle(self, was_going, period):
+        """Enter, stay in, or leave idle after a sample; see
+        `sampling.Idle`.
+
+        Returns
+        -------
+        float
+            `period`, or `T_idle` while idle
+        """
+        idle = self.idle
+        was_idle = idle.active
+        normal = period or conversion_time(self.conversion == 'oneshot',
+                                           self.averaging, self.noise_rejection)
+        if idle.update(self.channels, was_going, self.clock.monotonic(),
+                       normal):
+            if not was_idle:
+                self.logger.info('cold and flat for %gs; idling, sampling '
+                                 'every %gs with amplifiers off',
+                                 idle.after, idle.period)
+            self._amp_power(False)
+            return idle.period
+        if was_idle:
+            st = self._idle_status()
+            self.logger.info('rising trend; idle over. idle %.0fs total, '
+                             'amplifiers off %.0fs, %d wakeups saved',
+                             st['seconds'], st['off'], st['saved'],
+                             extra={'idle_seconds': st['seconds'],
+                                    'wakeups_saved': st['saved']})
+        return period
+
     def _run(self):
-        """Calcifer mainloop. Controlled by `self.go` attribute."""
+        """Calcifer mainloop. Controlled by `self.go` attribute. Iterations
+        start on `self.ticker` deadlines one sampler period apart, however
+        long each one takes. Each iteration beats the supervisor; an
+        exception ends the thread, and the supervisor restarts it with
+        backoff rather than letting a failing loop spin."""
+        self.ticker.start()
         while self.go:
-            try:
-                if self.tc_fault.value == 0:
-                    self.logger.critical(f'tc_fault pin low')
-
-                self.update_tempbuf()
-                self.logger.debug(f'tempbuf:{self.tempbuf}')
-                self.logger.debug(f'fire_going:{self.fire_going}')
-
-                if self.fire_going:
-                    if self.tempbuf[self.bufndx] < self.off_thresh:
-                        self.fire_going = False
-                        self.logger.info(f'Fire no longer going, tempbuf:{self.tempbuf}')
-                    sleep(self.T_going)
-
-                else:
-                    if self.tempbuf[self.bufndx] > self.thresh:
-                        # TODO: log thresh cross
-                        if self.soundswitch.value:
-                            self.logger.info('soundswitch high; playing sound')
-                            self.soundbyte()
-                        else:
-                            self.logger.info('soundswitch low; not playing sound')
-                        self.fire_going = True
-                        self.logger.info(f'Fire going, tempbuf:{self.tempbuf}')
-                    sleep(self.T_read)
-            except Exception as e:
-                self._errlog(e)
+            tstart = self.clock.monotonic()
+            period = self.step()
+            self.loop_seconds.observe(self.clock.monotonic() - tstart)
+            self.supervisor.beat('run', period or self.drdy_timeout)
+            late = self.ticker.wait(period)
+            if period:
+                self.loop_jitter.observe(late)
 
         self.logger.debug(f'run thread exited. go:{self.go}')
         self.logger.info('Calcifer program ended.')
 
-    def _listen(self):
-        """Shutoff command listener thread. Controlled by `self.go` attribute."""
-        while self.go:
-            try:
-                self.sock.listen()
-                conn, addr = self.sock.accept()
-                data = conn.recv(128).decode('utf-8')
-                # TODO: log received connections
-                if data == 'off':
-                    self.go = False
-                    self.sock.close()
-                    self.logger.info('Shutoff signal recieved. Shutting down...')
-                else:
-                    self.logger.warning(f'Socket connection sent {data} rather than off')
-                    self.fault.value = 1  # turn on fault led to alert user
-                self.logger.debug(
-                    f'socket connection; conn:{conn} addr:{addr} data:{data} go:{self.go}'
-                )
-            except Exception as e:
-                self._errlog(e)
-        self.logger.debug(f'listen thread exited. go:{self.go}')
-
     def _hbeat(self):
-        """Heartbeat LED execution thread. Controlled by `self.go` attribute."""
+        """Heartbeat LED execution thread. Controlled by `self.go` attribute.
+        The LED only blinks while the `run` worker is beating on time, so it
+        shows sampler progress rather than just a live thread. While idle it
+        flashes `IDLE_BLINKS` times once per idle period."""
+        ticker = Ticker()
+        ticker.start()
         while self.go:
-            self.hbeat.value = not self.hbeat.value if (self.T_hbeat>0) else 0  # no hbeat case
-            sleep(self.T_hbeat)
-        self.hbeat.hbeat = 0  # turn off led when ending program
+            if self.idle.active:  # one burst of flashes per idle period
+                self.supervisor.beat('hbeat', self.T_idle)
+                self.hbeat.value = 0
+                if self.T_hbeat > 0 and self.supervisor.ok('run'):
+                    for _ in range(IDLE_BLINKS):
+                        self.hbeat.value = 1
+                        sleep(IDLE_FLASH)
+                        self.hbeat.value = 0
+                        sleep(IDLE_FLASH)
+                    self.idle.blinked(2*IDLE_BLINKS)
+                self.idle.pause()
+                self.idle.blinked()
+                ticker.start()
+                continue
+            T = self.T_hbeat if self.T_hbeat > 0 else 1
+            blink = self.T_hbeat > 0 and self.supervisor.ok('run')
+            self.hbeat.value = not self.hbeat.value if blink else 0
+            self.supervisor.beat('hbeat', T)
+            ticker.wait(T)
+        self.hbeat.value = 0  # turn off led when ending program
         self.logger.debug(f'hbeat thread exited. go:{self.go}')
 
+    def _conf_mtime(self):
+        try:
+            return Path(self.fnconf).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _watchconf(self):
+        """Config file watch thread; reloads when the file's mtime changes.
+        Checks every `conf_watch` seconds while `self.go`, and once per idle
+        period while idle."""
+        mtime = self._conf_mtime()
+        while self.go and self.conf_watch > 0:
+            if self.idle.active:
+                self.supervisor.beat('watchconf', self.T_idle)
+                self.idle.pause()
+            else:
+                self.supervisor.beat('watchconf', self.conf_watch)
+                sleep(self.conf_watch)
+            m = self._conf_mtime()
+            if m != mtime and m is not None:
+                mtime = m
+                self._try_reload(f'{self.fnconf} change')
+        self.logger.debug(f'conf watch thread exited. go:{self.go}')
+
     def start(self):
-        """Start Calcifer mainloop thread."""
+        """Start Calcifer worker threads under `self.supervisor`."""
         if self.go:
             self.logger.error('start called but go already True')
             return
+        self.setup()
         try:
-            self.sock.bind(('127.0.0.1', self.port))
-        except sock_error as e:
-            print(e)
-            self.logger.error(f'start called but 127.0.0.1:{self.port} already in use')
+            self.control.start()
+        except OSError as e:
+            self.logger.error(f'start called but control socket unavailable: {e}')
             return
         self.go = True
-        # calcifer thread
-        self.runthread = Thread(target=self._run, args=())
-        self.runthread.daemon = True
-        # shutoff command socket thread
-        self.sockthread = Thread(target=self._listen, args=())
-        self.sockthread.daemon = True
-        # heartbeat thread
-        self.hbeatthread = Thread(target=self._hbeat, args=())
-        self.hbeatthread.daemon = True
+        self.supervisor.add('run', self._run)
+        self.supervisor.add('hbeat', self._hbeat)
+        if self.conf_watch > 0:
+            self.supervisor.add('watchconf', self._watchconf)
+        self.supervisor.probe('audio', self.audio.check)
         # start threads
-        self.runthread.start()
-        self.sockthread.start()
-        self.hbeatthread.start()
+        if self.telemetry is not None:
+            self.telemetry.start()
+        self.audio.start()
+        self.faults.start()
+        self.supervisor.start()
 
     def _wrapup(self):
         """Release resources + turn off relay/leds."""
         self.hbeat.value = 0
         self.tc_reset.value = 0
-        try:
-            self.sock.close()
-        except sock_error as e:
-            logger.error('Failed to close socket')
+        for ch in self.channels:
+            ch.close()
+        self.audio.stop(timeout=1)
+        self.faults.stop(timeout=1)
+        if self.telemetry is not None:
+            self.telemetry.stop(timeout=5)
+        self.control.stop(timeout=1)
 
     def join(self):
         """Calcifer instance equivalent to `thread.join`"""
-        try:
-            self.hbeatthread.join()
-        except Exception as e:
-            pass
-        try:
-            self.sockthread.join()
-        except Exception as e:
-            pass
-        try:
-            self.runthread.join()
-        except Exception as e:
-            pass
+        self.supervisor.join()
         self.logger.debug('All threads have joined')
         self._wrapup()
 
@@ -433,32 +1085,40 @@ class Calcifer(object):
         join : bool, optional
             Whether or not to join instance's run threads, by default False
         """
-        # use socket to enforce
-        with socket(AF_INET, SOCK_STREAM) as sock:
-            sock.connect( (self.host, self.port) )
-            sock.sendall( b'off' )
+        # use control socket to enforce
+        request('stop', self.control_socket, self.host, self.port)
         if join:
             self.join()
 
     def powercycle_max(self):
-        """Power cycle max chip using relay on relay pin."""
-        self.tc_reset.value = True
-        sleep(self.tc_reset_delay)  # TODO: empirically determined
-        self.tc_reset.value = False
-        self._configtc()  # call to ensure correct tc chip configuration
-        sleep(self.tc_reset_delay)  # TODO: empirically determined
+        """Power cycle max chip using relay on relay pin. Channels are
+        marked `recovering` so the sampler skips them meanwhile; the lock is
+        only held to start and end the cycle between conversions."""
+        self.powercycles += 1
+        with self.lock:
+            for ch in self.channels:
+                ch.recovering = True
+            self.tc_reset.value = True
+        try:
+            self.clock.sleep(self.tc_reset_delay)  # TODO: empirically determined
+            self.tc_reset.value = False
+            with self.lock:
+                self._configtc()  # call to ensure correct tc chip configuration
+            self.clock.sleep(self.tc_reset_delay)  # TODO: empirically determined
+        finally:
+            for ch in self.channels:
+                ch.drdy_count = 0
+                ch.recovering = False
 
-    def _errlog(e):
-        """put error on logger
+    def _errlog(self, e):
+        """put error on logger, with its traceback
 
         Parameters
         ----------
         e : Exception
         """
-        errstr = f'{e.__name__}: '
-        if hasattr(e, args):
-            errstr = errstr + ' '.join(e.args)
-        self.logger.error(errstr)
+        errstr = f'{type(e).__name__}: ' + ' '.join(str(a) for a in e.args)
+        self.logger.error(errstr, exc_info=e)
 
 parser = ArgumentParser('usage: Talking fireplace interface. ' +
                         'Also provides thermocouple characterization CLI')
@@ -468,6 +1128,23 @@ parser.add_argument('--section', type=str, default='DEFAULT',
                     help='Conf file section to use for thermocouple.')
 parser.add_argument('--characterize', action='store_true',
                     help='Thermocouple characterization interface.')
+parser.add_argument('--samples', type=int, default=1,
+                    help='Conversions averaged per characterization reference point.')
+parser.add_argument('--refs', type=str, default=None, metavar='FN',
+                    help='Characterization reference temperatures, one per line; '
+                    '- for stdin. Defaults to prompting on a terminal.')
+parser.add_argument('--out', type=str, default='characterization', metavar='PREFIX',
+                    help='Characterization results appended to PREFIX.csv and '
+                    'snapshotted to PREFIX.npz as each point is measured.')
+parser.add_argument('--plot', type=str, default=None, metavar='FN',
+                    help='Characterization plot file, by default PREFIX.png; '
+                    'empty to skip.')
+parser.add_argument('--calibration', type=str, default=None, metavar='FN',
+                    help='Write --characterize results for the first channel\'s '
+                    'tctype as a calibration file; defaults to its `calibration` key.')
+parser.add_argument('--fit', type=str, default='piecewise',
+                    choices=['piecewise', 'poly1', 'poly2', 'poly3'],
+                    help='Calibration correction fit.')
 parser.add_argument('--oneshot', action='store_true',
                     help='Report a single temperature reading.')
 parser.add_argument('--type', type=str, default=None, choices=gen_tc_types(),
@@ -478,6 +1155,19 @@ parser.add_argument('--loglevel', type=str, default=None,
 parser.add_argument('--run', action='store_true', help='Run Calcifer mainloop')
 parser.add_argument('--bg', action='store_true', help='Run Calcifer mainloop in background.')
 parser.add_argument('--stop', action='store_true', help='Stop Calcifer backgrounded mainloop')
+parser.add_argument('--replay', type=str, nargs='+', default=None, metavar='TRACE',
+                    help='Replay csv/telemetry traces or sim_curve specs on the '
+                    'simulator with a virtual clock and report fire transitions.')
+parser.add_argument('--sweep', type=str, nargs='+', default=None, metavar='SECTION',
+                    help='Replay every trace through each conf section in parallel; '
+                    'defaults to --section.')
+parser.add_argument('--duration', type=float, default=None,
+                    help='Replay seconds; required for sim_curve specs.')
+parser.add_argument('--burn', type=str, action='append', default=None,
+                    metavar='START[,END]',
+                    help='Replay ground-truth burn seconds, overriding the '
+                    "trace's; repeatable.")
+parser.add_argument('--json', action='store_true', help='Replay results as json.')
 
 if __name__ == '__main__':
     # prevent also underrun errors
@@ -491,68 +1181,91 @@ if __name__ == '__main__':
         kwargs.update({'tctype':args.type})
     if args.loglevel is not None:
         kwargs.update({'loglevel':args.loglevel})
-    job = Calcifer(fnconf=args.fnconf, section=args.section, **kwargs)
+
+    if args.replay is not None:  # simulator only; no hardware setup
+        from replay import parse_burn, report, sweep
+        burns = args.burn and [parse_burn(b) for b in args.burn]
+        results = sweep(args.replay, args.sweep or [args.section],
+                        fnconf=args.fnconf, duration=args.duration,
+                        burns=burns, **kwargs)
+        if args.json:
+            from json import dumps
+            print(dumps(results, indent=2))
+        else:
+            report(results)
+        raise SystemExit(0)
+
+    # config only; each command claims just the hardware it uses
+    if args.oneshot or args.characterize or args.bg or args.run:
+        job = Calcifer(fnconf=args.fnconf, section=args.section, setup=False,
+                       **kwargs)
 
     if args.oneshot:
-        print(f'{job._tctype_str}-type Temperature: {job.temperature}')
+        job.setup_tc()
+        for ch, temp in zip(job.channels, job.read_once()):
+            label = f'{ch.name} ' if ch.name else ''
+            print(f'{label}{ch._tctype_str}-type Temperature: {temp}')
 
     if args.characterize:
-        import matplotlib.pyplot as plt  # numerics only used here; import
-        from numpy import asarray  # here to avoid slowing startup
-        truetemp = []
-        meastemp = []
-        while True:
-            inp = input('Reference Temperature (degC) (or \'quit\'): ')
-            # exit cond
-            if inp.lower() in ('q','quit','exit'):
-                print('End characterization')
-                break
-            try:
-                t = float(inp)
-            # bad input
-            except ValueError:
-                print('Bad input')
-                continue
-            # temp reading
-            else:
-                truetemp.append(t)
-                meastemp.append(temp_all(job.spi, job.cs))
-        # reorder measurements into dict of lists
-        meastemp_dict = {k:[] for k in meastemp[0].keys()}
-        for m in meastemp:
-            [meastemp_dict[k].append(v) for k,v in m.items()]
-        meastemp = {k:asarray(v) for k,v in meastemp_dict.items()}
-        errtemp = {k:v-truetemp for k,v in meastemp.items()}
-        print('End computations')
-
-        print('Plotting...')
-        fig, ax = plt.subplots(ncols=2, num='tc-characterization')
-        # Measurement Plot
-        ax[0].set_title('Temperature Measurements')
-        ax[0].set_ylabel('Temperature [deg C]')
-        ax[0].set_xlabel('sample')
-        for k,v in meastemp_dict.items():
-            ax[0].plot(v, '-', label=f'{k}', marker=f'${k}$')
-        # plot ground truth last for color matching b/t subplots
-        ax[0].plot(truetemp, '.-', label='Ground Truth')
-        ax[0].legend()
-
-        # Error Plot
-        ax[1].set_title('Temperature Error')
-        ax[1].set_ylabel('Temperature Error [deg C]')
-        ax[1].set_xlabel('sample')
-        for k,v in errtemp.items():
-            ax[1].plot(v, '-', label=f'{k}', marker=f'${k}$')
-        ax[1].legend()
-
-        plt.show()
+        from characterize import Characterizer, Session, read_refs
+        job.setup_tc()
+        engine = Characterizer(job.backend, job.spi, job.cs,
+                               averaging=job.averaging,
+                               noise_rejection=job.noise_rejection)
+        session = Session(engine, out=args.out)
+        if args.refs is None or args.refs == '-':
+            interactive = args.refs is None and stdin.isatty()
+            src = nullcontext(stdin)  # never close stdin
+            prompt = ('Reference Temperature (degC) (or \'quit\'): '
+                      if interactive else None)
+        else:
+            src, prompt = open(args.refs), None
+        try:
+            with src as f:
+                for t in read_refs(f, prompt):
+                    meas = session.measure(t, args.samples)
+                    print(f'{t:g}degC: ' + ' '.join(
+                        f'{k}:{v:.2f}' for k, v in meas.items()))
+        except KeyboardInterrupt:
+            print('Interrupted; keeping measured points')
+        finally:
+            session.close()
+        print(f'End characterization; {session.points} points')
+        if not session.points:
+            raise SystemExit(1)
+        print('error mean/std/max: ' + ' '.join(
+            f'{k}:{m:.2f}/{sd:.2f}/{mx:.2f}' for k, m, sd, mx in zip(
+                engine.tctypes, session.err.values, session.err.std,
+                session.maxerr)))
+
+        ch = job.channels[0]
+        calfn = args.calibration or ch.calibration_fn
+        if calfn:
+            from calibration import fit
+            method, _, degree = args.fit.partition('poly')
+            meas = session.mean[:, engine.tctypes.index(ch._tctype_str)]
+            cal = fit(meas.tolist(), session.ref.tolist(), ch._tctype_str,
+                      method='poly' if degree else 'piecewise',
+                      degree=int(degree or 1), sensor=ch.name)
+            cal.save(calfn)
+            resid = max(abs(r) for r in cal.residuals())
+            print(f'Wrote {cal} to {calfn}; max residual {resid:.2f}degC')
+
+        plotfn = f'{args.out}.png' if args.plot is None else args.plot
+        if plotfn:
+            session.plot(plotfn)
+            print(f'Wrote {plotfn}')
 
     if args.bg:
         from subprocess import Popen  # subprocess only used here
         act = Path(__file__).resolve().parent / 'env/bin/activate'
         fn = Path(__file__).resolve()
-        Popen(['python3', fn, f'--fnconf={job.fnconf}',
-               f'--section={args.section}', f'--type={args.type}', '--run'])
+        cmd = ['python3', fn, f'--fnconf={job.fnconf}',
+               f'--section={args.section}', '--run']
+        cmd += [f'--{k}={v}' for k, v in (('type', args.type),
+                                           ('loglevel', args.loglevel))
+                if v is not None]
+        Popen(cmd)
 
     if args.run:
         # basic install check
@@ -563,6 +1276,8 @@ if __name__ == '__main__':
             print('Did you run `install-pygame-deps.sh`?')
             raise e
         # run job
+        from signal import SIGHUP, signal
+        signal(SIGHUP, job._sighup)  # `systemctl reload` / `kill -HUP`
         try:
             job.start()
             job.join()
@@ -575,6 +1290,9 @@ if __name__ == '__main__':
         finally:
             mixer.quit()
 
-    if args.stop:
-        job.stop(join=False)  # can't join; threads on diff Calcifer instance
+    if args.stop:  # control keys only; don't validate the rest of the config
+        try:
+            send('stop', args.fnconf, args.section, **kwargs)
+        except OSError as e:
+            raise SystemExit(f'no daemon answering on control socket: {e}')
 
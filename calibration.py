@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Per-sensor calibration for Calcifer. `--characterize` measures a probe
+against reference temperatures; `fit` turns those points into a
+measured -> true correction and `Calibration.save` writes it as JSON for a
+channel's `calibration` key. Corrections are piecewise-linear through the
+reference points or a least-squares polynomial. Either way the correction
+is sampled into a lookup table on load, so applying it costs one index and
+one linear interpolation per sample whatever the fit.
+
+Outside the characterized range the correction is held at its value at the
+nearest reference point rather than extrapolated.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['Calibration', 'fit', 'METHODS']
+
+import json
+from bisect import bisect_right
+from math import ceil
+
+METHODS = ('piecewise', 'poly')
+
+
+class Calibration(object):
+    """Measured -> true temperature correction.
+
+    Parameters
+    ----------
+    points : list of (float, float)
+        (measured, true) reference pairs in degC
+    tctype : str
+        Thermocouple type the points were measured as
+    method : str, optional
+        `piecewise` interpolates between points; `poly` evaluates `coeffs`,
+        by default 'piecewise'
+    coeffs : list of float, optional
+        `poly` correction (true - measured) coefficients, highest power
+        first
+    sensor : str, optional
+        Channel or probe name, by default ''
+    step : float, optional
+        Lookup table spacing in degC, by default 1
+
+    Notes
+    -----
+    Call the instance on a reading to correct it. NaN passes through.
+    """
+    def __init__(self, points, tctype, method='piecewise', coeffs=None,
+                 sensor='', step=1.):
+        if method not in METHODS:
+            raise ValueError(f'invalid calibration method:{method}')
+        if not points:
+            raise ValueError('calibration needs at least one point')
+        if method == 'poly' and not coeffs:
+            raise ValueError('poly calibration needs coeffs')
+        self.points = sorted((float(m), float(t)) for m, t in points)
+        self.tctype = tctype
+        self.method = method
+        self.coeffs = [float(c) for c in coeffs] if coeffs else None
+        self.sensor = sensor
+        self.lo = self.points[0][0]
+        hi = self.points[-1][0]
+        n = max(ceil((hi - self.lo) / step), 1)
+        self.step = (hi - self.lo) / n or step
+        self.inv_step = 1 / self.step
+        self.table = [self.offset(self.lo + i*self.step) for i in range(n + 1)]
+        self.last = len(self.table) - 1
+
+    def offset(self, x):
+        """Exact correction (true - measured) at measured `x`; slow path
+        used to build the table."""
+        x = min(max(x, self.lo), self.points[-1][0])
+        if self.method == 'poly':
+            y = 0.
+            for c in self.coeffs:
+                y = y*x + c
+            return y
+        ms = [m for m, _ in self.points]
+        i = bisect_right(ms, x) - 1
+        if i >= len(ms) - 1:
+            return self.points[-1][1] - self.points[-1][0]
+        (m0, t0), (m1, t1) = self.points[i], self.points[i + 1]
+        if m1 == m0:
+            return t0 - m0
+        return t0 + (t1 - t0)*(x - m0)/(m1 - m0) - x
+
+    def __call__(self, x):
+        f = (x - self.lo)*self.inv_step
+        if f != f:  # NaN reading
+            return x
+        if f <= 0:
+            return x + self.table[0]
+        i = int(f)
+        if i >= self.last:
+            return x + self.table[-1]
+        a = self.table[i]
+        return x + a + (f - i)*(self.table[i + 1] - a)
+
+    def __repr__(self):
+        return (f'Calibration({self.sensor or "-"}, {self.tctype}, '
+                f'{self.method}, {len(self.points)} points, '
+                f'{self.lo:g}..{self.points[-1][0]:g}degC)')
+
+    def residuals(self):
+        """Corrected minus true temperature at every reference point."""
+        return [self(m) - t for m, t in self.points]
+
+    def to_dict(self):
+        d = {'sensor': self.sensor, 'tctype': self.tctype,
+             'method': self.method, 'points': self.points}
+        if self.coeffs:
+            d['coeffs'] = self.coeffs
+        return d
+
+    def save(self, fn):
+        """Write calibration as JSON to `fn`."""
+        with open(fn, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, fn):
+        """Read calibration JSON from `fn`.
+
+        Raises
+        ------
+        ValueError
+            Unreadable or invalid file
+        """
+        try:
+            with open(fn) as f:
+                d = json.load(f)
+            return cls(d['points'], d['tctype'], d.get('method', 'piecewise'),
+                       d.get('coeffs'), d.get('sensor', ''))
+        except (OSError, KeyError, TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f'invalid calibration {fn}: {e!r}') from e
+
+
+def fit(measured, true, tctype, method='piecewise', degree=1, sensor=''):
+    """Fit a correction to characterization results.
+
+    Parameters
+    ----------
+    measured, true : array_like
+        Measured and reference temperatures in degC
+    tctype : str
+        Thermocouple type `measured` was read as
+    method : str, optional
+        `piecewise` or `poly`, by default 'piecewise'
+    degree : int, optional
+        `poly` degree; lowered to fit the number of points, by default 1
+    sensor : str, optional
+        Channel or probe name, by default ''
+
+    Returns
+    -------
+    Calibration
+    """
+    points = list(zip(measured, true))
+    coeffs = None
+    if method == 'poly':
+        import numpy as np  # only needed to fit, not to apply
+        m = np.asarray(measured, float)
+        degree = min(degree, len(np.unique(m)) - 1)
+        coeffs = np.polyfit(m, np.asarray(true, float) - m, degree).tolist()
+    return Calibration(points, tctype, method, coeffs, sensor)
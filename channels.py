@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Thermocouple channels for Calcifer. A channel is one MAX31856 amplifier on
+the shared SPI bus with its own chip select, DRDY and fault pins,
+thermocouple type, fire detector, temperature ring buffer, and fire state.
+
+Conversions are split into `begin` and `finish` so a scheduler can start
+every channel's conversion before waiting on any of them. The amplifiers
+then convert in parallel and one loop iteration costs about one conversion
+time regardless of channel count.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['Channel', 'CHANNEL_KEYS', 'PARAM_KEYS', 'channel_conf']
+
+from time import perf_counter
+
+from backends import ThermocoupleType, channel_get, conversion_time
+from calibration import Calibration
+from detectors import get_detector
+from faults import DISCARD, NOFAULTS, decode
+from metrics import SPI_BUCKETS, Registry
+from ringbuf import STATS, RingBuffer
+
+# config keys a channel may override with a `<name>.` prefix
+CHANNEL_KEYS = ('cs', 'drdy', 'tc_fault', 'tctype', 'thresh', 'off_thresh',
+                'smoothing', 'detector', 'slope_window', 'rise_rate',
+                'fall_rate', 'combine', 'hold', 'buflen', 'ema_alpha',
+                'calibration')
+# channel keys `Channel.reconfigure` applies live; pins need a restart
+PARAM_KEYS = CHANNEL_KEYS[3:]
+DETECTOR_KEYS = ('thresh', 'off_thresh', 'smoothing', 'detector',
+                 'slope_window', 'rise_rate', 'fall_rate', 'combine', 'hold')
+# detector keys changed in place, keeping slope fit and hold state
+THRESH_KEYS = ('thresh', 'off_thresh')
+
+
+def channel_conf(conf, name):
+    """Channel config from a section; `<name>.<key>` overrides `<key>`.
+
+    Parameters
+    ----------
+    conf : mapping
+        Config section, e.g. `ConfigParser()['DEFAULT']`
+    name : str
+        Channel name; empty for the section's own keys
+
+    Returns
+    -------
+    dict
+        Values for `CHANNEL_KEYS`
+    """
+    return {k: channel_get(conf, name, k) for k in CHANNEL_KEYS}
+
+
+class Channel(object):
+    """One thermocouple amplifier and its fire detection state.
+
+    Parameters
+    ----------
+    name : str
+        Channel name used in logs and config key prefixes; may be empty
+    conf : mapping
+        Channel config; see `channel_conf`
+    backend : backends object
+        Hardware backend
+    spi : board.SPI object
+        Shared SPI bus
+    acquisition : str, optional
+        `poll` or `event`, by default 'poll'
+    conversion : str, optional
+        `oneshot` or `continuous`, by default 'oneshot'
+    averaging : int, optional
+        Samples averaged on-chip per conversion, by default 1
+    noise_rejection : int, optional
+        Mains filter frequency, by default 60
+    drdy_poll : float, optional
+        DRDY sampling interval when edge detection is unavailable,
+        by default 0.005
+    metrics : metrics.Registry, optional
+        Registry for this channel's series, by default a private one
+
+    Notes
+    -----
+    `drdy_count` counts consecutive conversions that did not complete;
+    `misses` counts all of them. When the FAULT pin is low after a
+    conversion, the fault status register is decoded into `fault_classes`
+    (see `faults.decode`) and conversions faults.DISCARD marks as garbage
+    are left out of `tempbuf`. `recovering` is set while a recovery has the
+    amplifier powered down, so the sampler skips the channel.
+    """
+    def __init__(self, name, conf, backend, spi, acquisition='poll',
+                 conversion='oneshot', averaging=1, noise_rejection=60,
+                 drdy_poll=0.005, metrics=None):
+        self.name = name
+        self.backend = backend
+        self.clock = backend.clock
+        self.spi = spi
+        self.acquisition = acquisition
+        self.conversion = conversion
+        self.averaging = averaging
+        self.noise_rejection = noise_rejection
+        # thermocouple + detection params
+        self._setparams(self.parse(conf))
+        self.configdetector()
+        self.clr_tempbuf()
+        self.fire_going = False
+        self.fresh = False
+        self.drdy_count = 0
+        self.fault_classes = NOFAULTS
+        self.recovering = False
+
+        # metrics; values already tracked are read only when rendered
+        metrics = Registry() if metrics is None else metrics
+        self.samples = metrics.counter('samples_total', 'Conversions read',
+                                       channel=name)
+        self.misses = metrics.counter(
+            'drdy_misses_total', 'Conversions that did not complete',
+            channel=name)
+        self.discards = metrics.counter(
+            'discards_total', 'Conversions discarded on amplifier fault',
+            channel=name)
+        self.spi_read = metrics.histogram(
+            'spi_read_seconds', 'Result register read time', SPI_BUCKETS,
+            channel=name)
+        metrics.gauge('temperature_celsius', 'Newest temperature',
+                      fn=lambda: self.tempbuf.last, channel=name)
+        metrics.gauge('smoothed_celsius', 'Temperature compared to thresholds',
+                      fn=lambda: self.smoothed, channel=name)
+        metrics.gauge('threshold_celsius', 'Fire on threshold',
+                      fn=lambda: self.thresh, channel=name)
+        metrics.gauge('off_threshold_celsius', 'Fire off threshold',
+                      fn=lambda: self.off_thresh, channel=name)
+        metrics.gauge('channel_fire_going', 'Fire detected on channel',
+                      fn=lambda: self.fire_going, channel=name)
+
+        # pins
+        pin = backend.eval
+        self.cs = backend.DigitalInOut(pin(conf['cs']))
+        self.cs.direction = backend.Direction.OUTPUT
+        drdy_pin = pin(conf['drdy'])
+        self.drdy = backend.DigitalInOut(drdy_pin)
+        self.drdy.direction = backend.Direction.INPUT
+        self.drdy.pull = backend.Pull.DOWN
+        self.drdy_waiter = None
+        if acquisition == 'event' or conversion == 'continuous':
+            self.drdy_waiter = backend.drdy_waiter(drdy_pin, self.drdy,
+                                                   drdy_poll)
+        self.configtc()
+        self.tc_fault = backend.DigitalInOut(pin(conf['tc_fault']))
+        self.tc_fault.direction = backend.Direction.INPUT
+
+    def __repr__(self):
+        return f'Channel({self.name or "-"}, {self._tctype_str}, {self.tempbuf})'
+
+    @staticmethod
+    def parse(conf):
+        """Typed, validated `PARAM_KEYS` values from channel config.
+
+        Raises
+        ------
+        ValueError
+            Invalid value
+        """
+        p = {'tctype': conf['tctype'], 'thresh': float(conf['thresh']),
+             'off_thresh': float(conf['off_thresh']),
+             'smoothing': conf['smoothing'], 'detector': conf['detector'],
+             'slope_window': float(conf['slope_window']),
+             'rise_rate': float(conf['rise_rate']),
+             'fall_rate': float(conf['fall_rate']), 'combine': conf['combine'],
+             'hold': float(conf['hold']),
+             'buflen': int(conf['buflen']),
+             'ema_alpha': float(conf['ema_alpha']),
+             'calibration': conf['calibration']}
+        if not hasattr(ThermocoupleType, p['tctype']) or '_' in p['tctype']:
+            raise ValueError(f'invalid tctype:{p["tctype"]}')
+        if p['smoothing'] not in STATS:
+            raise ValueError(f'invalid smoothing:{p["smoothing"]}')
+        if not p['off_thresh'] < p['thresh']:
+            raise ValueError(f'off_thresh:{p["off_thresh"]} must be below '
+                             f'thresh:{p["thresh"]}')
+        if p['buflen'] < 1:
+            raise ValueError(f'invalid buflen:{p["buflen"]}')
+        if p['calibration']:
+            cal = Calibration.load(p['calibration'])
+            if cal.tctype != p['tctype']:
+                raise ValueError(f'calibration {p["calibration"]} is for '
+                                 f'type {cal.tctype}, not {p["tctype"]}')
+        return p
+
+    @property
+    def params(self):
+        """Running `PARAM_KEYS` values."""
+        return {'tctype': self._tctype_str, 'thresh': self.thresh,
+                'off_thresh': self.off_thresh, 'smoothing': self.smoothing,
+                'detector': self.detector_name,
+                'slope_window': self.slope_window, 'rise_rate': self.rise_rate,
+                'fall_rate': self.fall_rate, 'combine': self.combine,
+                'hold': self.hold, 'buflen': self.buflen, 'ema_alpha': self.ema_alpha,
+                'calibration': self.calibration_fn}
+
+    def _setparams(self, p):
+        self._tctype_str = p['tctype']
+        self.tctype = getattr(ThermocoupleType, p['tctype'])
+        self.thresh = p['thresh']
+        self.off_thresh = p['off_thresh']
+        self.smoothing = p['smoothing']
+        self.detector_name = p['detector']
+        self.slope_window = p['slope_window']
+        self.rise_rate = p['rise_rate']
+        self.fall_rate = p['fall_rate']
+        self.combine = p['combine']
+        self.hold = p['hold']
+        self.buflen = p['buflen']
+        self.ema_alpha = p['ema_alpha']
+        self.calibration_fn = p['calibration']
+        self.calibration = (Calibration.load(p['calibration'])
+                            if p['calibration'] else None)
+
+    def reconfigure(self, p):
+        """Apply params that differ from the running ones, keeping buffered
+        samples and fire state.
+
+        Parameters
+        ----------
+        p : dict
+            `parse` result
+
+        Returns
+        -------
+        list of str
+            Changed keys
+
+        Notes
+        -----
+        The detector is rebuilt only if a detection param other than the
+        thresholds changed; threshold changes alone are applied in place so
+        slope fits and pending holds survive. The ring
+        buffer is reallocated (newest samples kept) only if `buflen` or
+        `ema_alpha` changed, and the amplifier is reconfigured only if
+        `tctype` changed. Nothing is modified if the new detector is invalid.
+        """
+        changed = [k for k, v in self.params.items() if p[k] != v]
+        detector = self.detector
+        if any(k in DETECTOR_KEYS and k not in THRESH_KEYS for k in changed):
+            detector = self._detector(p)  # raises before anything changes
+        self._setparams(p)
+        if detector is self.detector:
+            detector.set_thresholds(self.thresh, self.off_thresh)
+        self.detector = detector
+        if 'buflen' in changed or 'ema_alpha' in changed:
+            samples = list(self.tempbuf)[-self.buflen:]
+            self.clr_tempbuf()
+            for x, t in samples:
+                self.tempbuf.append(x, t)
+        if 'tctype' in changed:
+            self.configtc()
+        return changed
+
+    def configtc(self):
+        """Update `self.tc` with current spi, cs, tctype params.
+
+        Notes
+        -----
+        Uses SPI bus, so can only be called after SPI bus setup. Filter and
+        averaging are set before auto-conversion starts; the datasheet
+        forbids changing the filter mid-conversion.
+        """
+        self.tc = self.backend.MAX31856(self.spi, self.cs,
+                                        thermocouple_type=self.tctype)
+        self.tc.noise_rejection = self.noise_rejection
+        self.tc.averaging = self.averaging
+        self._converted = self.conversion != 'continuous'
+        if self.conversion == 'continuous':
+            if self.drdy_waiter is not None:
+                self.drdy_waiter.clear()  # only edges of the new conversions
+            self.tc.start_autoconverting()
+
+    def set_thresholds(self, thresh, off_thresh):
+        """Change fire thresholds on the running detector, keeping its
+        state."""
+        if not off_thresh < thresh:
+            raise ValueError(f'off_thresh:{off_thresh} must be below '
+                             f'thresh:{thresh}')
+        self.thresh, self.off_thresh = thresh, off_thresh
+        self.detector.set_thresholds(thresh, off_thresh)
+
+    def configdetector(self):
+        """Update `self.detector` with current detection params."""
+        self.detector = self._detector(self.params)
+
+    @staticmethod
+    def _detector(p):
+        return get_detector(
+            p['detector'], thresh=p['thresh'], off_thresh=p['off_thresh'],
+            smoothing=p['smoothing'], slope_window=p['slope_window'],
+            rise_rate=p['rise_rate'], fall_rate=p['fall_rate'],
+            combine=p['combine'], hold=p['hold'])
+
+    def set_tc_type(self, tctype):
+        """Update thermocouple type; attribute name of `ThermocoupleType`."""
+        self._tctype_str = tctype
+        self.tctype = getattr(ThermocoupleType, tctype)
+        self.configtc()
+
+    @property
+    def temperature(self):
+        """Read sensor temperature, calibrated if `calibration` is set.
+        Latest auto-conversion result in continuous mode, waiting for the
+        first one after auto-conversion (re)starts; otherwise a blocking
+        one-shot conversion."""
+        if self.conversion == 'continuous':
+            if not self._converted:
+                self._first_conversion()
+            temp = self.tc.unpack_temperature()
+        else:
+            temp = self.tc.temperature
+        if self.calibration is not None:
+            temp = self.calibration(temp)
+        return temp
+
+    def _first_conversion(self):
+        """Wait for the first auto-conversion after `configtc`; the result
+        registers are empty until then."""
+        tconv = conversion_time(oneshot=True, averaging=self.averaging,
+                                hz=self.noise_rejection)
+        if self.drdy_waiter is None:
+            self.clock.sleep(tconv)
+        else:
+            self.drdy_waiter.wait(2*tconv)  # timeout also covers no edge
+        self._converted = True
+
+    def clr_tempbuf(self):
+        """Allocate empty temperature ring buffer."""
+        self.tempbuf = RingBuffer(self.buflen, self.ema_alpha)
+
+    @property
+    def smoothed(self):
+        """Buffered temperature statistic compared against thresholds."""
+        return self.tempbuf.stat(self.smoothing)
+
+    def detect(self):
+        """Fire state after newest sample."""
+        if not len(self.tempbuf):
+            return self.fire_going
+        return self.detector.update(self.tempbuf, self.fire_going)
+
+    def begin(self):
+        """Start acquiring a sample without waiting for it.
+
+        Returns
+        -------
+        bool
+            Whether a conversion is expected; False if the amplifier is not
+            ready
+        """
+        if self.acquisition == 'event':
+            if self.conversion == 'oneshot':
+                self.drdy_waiter.clear()
+                self.tc.initiate_one_shot_measurement()
+            return True
+        if self.conversion == 'continuous':  # conversion since last read
+            return self.drdy_waiter.wait(0)
+        if not self.drdy.value:
+            return False
+        self.tc.initiate_one_shot_measurement()
+        return True
+
+    def finish(self, deadline):
+        """Wait for the conversion `begin` started and append it to
+        `tempbuf` unless the amplifier flags it as garbage.
+
+        Parameters
+        ----------
+        deadline : float
+            Clock monotonic time to give up at in `event` acquisition
+
+        Returns
+        -------
+        bool
+            Whether a conversion was read
+        """
+        if self.acquisition == 'event':
+            timeout = max(deadline - self.clock.monotonic(), 0)
+            if not self.drdy_waiter.wait(timeout):
+                return False
+        elif self.conversion == 'oneshot':
+            while self.tc.oneshot_pending:
+                self.clock.sleep(0.01)
+        tconv = self.clock.monotonic()  # conversion done; before SPI time
+        self._converted = True
+        tread = perf_counter()
+        temp = self.tc.unpack_temperature()
+        self.spi_read.observe(perf_counter() - tread)
+        if self.calibration is not None:
+            temp = self.calibration(temp)
+        if self.tc_fault.value:  # active low
+            self.fault_classes = NOFAULTS
+        else:
+            self.fault_classes = decode(self.tc.fault)
+            if self.fault_classes & DISCARD:
+                self.discards.inc()
+                return True
+        self.tempbuf.append(temp, tconv)
+        self.samples.inc()
+        return True
+
+    def close(self):
+        """Release DRDY waiter."""
+        if self.drdy_waiter is not None:
+            self.drdy_waiter.close()
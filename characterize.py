@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Thermocouple characterization engine for Calcifer. Puts the MAX31856 in
+voltage mode, reads the raw thermocouple voltage and cold-junction
+temperature once per conversion, and converts every reading to all
+thermocouple types in software with `thermocouples`, instead of
+reconfiguring the chip and converting once per type.
+
+`Session` runs unattended: reference temperatures stream in from a file or
+stdin (`read_refs`), conversions are folded into running per-type
+mean/variance/error statistics (`Welford`), and every reference point is
+appended to a CSV file and snapshotted to NPZ as soon as it is measured.
+Memory per reference point stays constant however many conversions are
+taken; the per-point arrays grow (doubling) with the number of points. An
+interrupted sweep keeps every completed point. Plots are
+rendered to a file with the Agg backend, so no display is needed.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['Characterizer', 'Session', 'Welford', 'code_to_mv', 'read_refs']
+
+import os
+import sys
+
+import numpy as np
+
+from thermocouples import TC_TYPES, all_types
+
+
+def code_to_mv(temp, gain=8):
+    """Convert a voltage mode `unpack_temperature` result to mV.
+
+    Parameters
+    ----------
+    temp : float or array_like
+        Driver temperature reading, i.e. 19 bit code / 128
+    gain : int, optional
+        Voltage mode gain, 8 or 32, by default 8
+
+    Notes
+    -----
+    Datasheet voltage mode transfer function: code = gain * 1.6 * 2**17 * V.
+    """
+    return np.multiply(temp, 128*1000 / (gain*1.6*2**17))
+
+
+class Characterizer(object):
+    """Multi-type thermocouple reader using a single conversion per sample.
+
+    Parameters
+    ----------
+    backend : backends object
+        Hardware backend providing `MAX31856` and `ThermocoupleType`
+    spi : board.SPI object
+        spi parameter for MAX31856 object
+    cs : dioDigitalInOut object
+        cs param for MAX31856 object
+    gain : int, optional
+        Voltage mode gain; 8 covers +/-78mV, every type's full range, and 32
+        covers +/-19.5mV at 4x resolution, by default 8
+    averaging : int, optional
+        Samples averaged on-chip per conversion, by default 1
+    noise_rejection : int, optional
+        Mains filter frequency, 50 or 60, by default 60
+    tctypes : iterable of str, optional
+        Thermocouple types to compute, by default `thermocouples.TC_TYPES`
+
+    Notes
+    -----
+    Constructing a Characterizer reconfigures the amplifier; the owner must
+    restore its thermocouple type afterwards (e.g. `Calcifer._configtc`).
+    """
+    def __init__(self, backend, spi, cs, gain=8, averaging=1,
+                 noise_rejection=60, tctypes=TC_TYPES):
+        if gain not in (8, 32):
+            raise ValueError(f'invalid gain:{gain}')
+        self.gain = gain
+        self.tctypes = tuple(tctypes)
+        mode = backend.ThermocoupleType.G8 if gain == 8 \
+            else backend.ThermocoupleType.G32
+        self.tc = backend.MAX31856(spi, cs, thermocouple_type=mode)
+        self.tc.averaging = averaging
+        self.tc.noise_rejection = noise_rejection
+
+    def sample(self, n=1):
+        """Take `n` conversions.
+
+        Returns
+        -------
+        mv : numpy.ndarray
+            Thermocouple voltages in mV
+        cj : numpy.ndarray
+            Cold-junction temperatures in degC
+        """
+        mv = np.empty(n)
+        cj = np.empty(n)
+        for i in range(n):
+            mv[i] = self.tc.temperature  # one-shot conversion, raw code
+            cj[i] = self.tc.unpack_reference_temperature()  # same conversion
+        return code_to_mv(mv, self.gain), cj
+
+    def measure(self, n=1):
+        """Take `n` conversions and interpret them as every type.
+
+        Returns
+        -------
+        dict
+            Thermocouple type -> length `n` array of temperatures in degC
+        """
+        return all_types(*self.sample(n), self.tctypes)
+
+
+def read_refs(f, prompt=None):
+    """Reference temperatures from a text stream, one per line.
+
+    Parameters
+    ----------
+    f : file object
+        e.g. an open file or `sys.stdin`; blank lines and `#` comments are
+        skipped, and `q`, `quit`, or `exit` ends the stream
+    prompt : str, optional
+        Printed before each line when reading interactively, by default None
+
+    Yields
+    ------
+    float
+        Reference temperature in degC
+    """
+    while True:
+        if prompt is not None:
+            print(prompt, end='', flush=True)
+        line = f.readline()
+        if not line:
+            return
+        line = line.split('#')[0].strip()
+        if not line:
+            continue
+        if line.lower() in ('q', 'quit', 'exit'):
+            return
+        try:
+            yield float(line)
+        except ValueError:
+            print(f'Bad input: {line}', file=sys.stderr)
+
+
+class Welford(object):
+    """Running mean and variance per element, ignoring NaN.
+
+    Parameters
+    ----------
+    n : int
+        Number of elements, e.g. thermocouple types
+
+    Notes
+    -----
+    Batches are merged with Chan et al.'s parallel update, so folding in a
+    block of conversions costs a few vector operations regardless of how
+    many were taken before.
+    """
+    def __init__(self, n):
+        self.count = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+
+    def reset(self):
+        self.count[:] = 0
+        self.mean[:] = 0
+        self.m2[:] = 0
+
+    def update(self, x):
+        """Fold in a block of samples.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            (samples, n) values; NaN entries are skipped
+        """
+        x = np.atleast_2d(x)
+        ok = ~np.isnan(x)
+        nb = ok.sum(axis=0)
+        has = nb > 0
+        if not has.any():
+            return
+        xb = np.where(ok, x, 0.)
+        mb = np.zeros_like(self.mean)
+        mb[has] = xb[:, has].sum(axis=0) / nb[has]
+        m2b = (np.where(ok, x - mb, 0.)**2).sum(axis=0)
+        n = self.count + nb
+        delta = mb - self.mean
+        frac = np.divide(nb, n, out=np.zeros_like(self.mean), where=n > 0)
+        self.mean += delta*frac
+        self.m2 += m2b + delta**2*self.count*frac
+        self.count = n
+
+    @property
+    def var(self):
+        """Sample variance; NaN with fewer than 2 samples."""
+        out = np.full_like(self.mean, np.nan)
+        np.divide(self.m2, self.count - 1, out=out, where=self.count > 1)
+        return out
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    @property
+    def values(self):
+        """Mean; NaN where nothing was folded in."""
+        return np.where(self.count > 0, self.mean, np.nan)
+
+
+class Session(object):
+    """Streaming characterization against reference temperatures.
+
+    Parameters
+    ----------
+    engine : Characterizer
+        Amplifier reader
+    out : str or Path, optional
+        Output prefix; `<out>.csv` gains a row per reference point, appended
+        to any earlier sessions' rows, and `<out>.npz` is rewritten with
+        this session's points after each one, by default None (no files)
+    max_points : int, optional
+        Initial capacity for points kept for plots and calibration; doubled
+        whenever full, by default 1024
+    chunk : int, optional
+        Conversions read per statistics update, by default 16
+
+    Attributes
+    ----------
+    ref : numpy.ndarray
+        Reference temperatures of measured points
+    mean, std : numpy.ndarray
+        (points, types) measured temperature statistics per point
+    err : Welford
+        Error (measured - reference) statistics per type over all points
+    maxerr : numpy.ndarray
+        Largest absolute error per type
+    """
+    def __init__(self, engine, out=None, max_points=1024, chunk=16):
+        self.engine = engine
+        self.tctypes = engine.tctypes
+        nt = len(self.tctypes)
+        self.chunk = chunk
+        self.points = 0
+        self._ref = np.full(max_points, np.nan)
+        self._n = np.zeros(max_points, int)
+        self._mean = np.full((max_points, nt), np.nan)
+        self._std = np.full((max_points, nt), np.nan)
+        self._block = np.empty((chunk, nt))
+        self._point = Welford(nt)
+        self.err = Welford(nt)
+        self.maxerr = np.zeros(nt)
+        self.out = None if out is None else str(out)
+        if self.out is not None:
+            self._csv = open(f'{self.out}.csv', 'a')
+            if not self._csv.tell():  # new file
+                cols = [f'{t}_{s}' for t in self.tctypes
+                        for s in ('mean', 'std', 'err')]
+                self._csv.write(','.join(['ref', 'n'] + cols) + '\n')
+                self._csv.flush()
+
+    @property
+    def ref(self):
+        return self._ref[:self.points]
+
+    @property
+    def mean(self):
+        return self._mean[:self.points]
+
+    @property
+    def std(self):
+        return self._std[:self.points]
+
+    def measure(self, ref, samples=1):
+        """Measure one reference point and record it.
+
+        Parameters
+        ----------
+        ref : float
+            Reference temperature in degC
+        samples : int, optional
+            Conversions averaged, by default 1
+
+        Returns
+        -------
+        dict
+            Thermocouple type -> mean measured temperature
+        """
+        point = self._point
+        point.reset()
+        left = samples
+        while left > 0:
+            k = min(left, self.chunk)
+            temps = self.engine.measure(k)
+            for j, t in enumerate(self.tctypes):
+                self._block[:k, j] = temps[t]
+            point.update(self._block[:k])
+            left -= k
+        mean, std = point.values, point.std
+        err = mean - ref
+        self.err.update(err)
+        self.maxerr = np.fmax(self.maxerr, np.abs(err))
+        if self.points == len(self._ref):
+            self._grow()
+        i = self.points
+        self._ref[i], self._n[i] = ref, samples
+        self._mean[i], self._std[i] = mean, std
+        self.points += 1
+        if self.out is not None:
+            self._write(ref, samples, mean, std, err)
+        return dict(zip(self.tctypes, mean.tolist()))
+
+    def _grow(self):
+        """Double point capacity."""
+        def grow(a, fill):
+            return np.concatenate([a, np.full_like(a, fill)])
+        self._ref = grow(self._ref, np.nan)
+        self._n = grow(self._n, 0)
+        self._mean = grow(self._mean, np.nan)
+        self._std = grow(self._std, np.nan)
+
+    def _write(self, ref, samples, mean, std, err):
+        row = [repr(ref), str(samples)]
+        for m, s, e in zip(mean, std, err):
+            row += [f'{m:.4f}', f'{s:.4f}', f'{e:.4f}']
+        self._csv.write(','.join(row) + '\n')
+        self._csv.flush()
+        os.fsync(self._csv.fileno())
+        self.save()
+
+    def save(self):
+        """Snapshot every recorded point and the error statistics to
+        `<out>.npz`; replaced atomically, so an interruption leaves the
+        previous snapshot."""
+        if self.out is None:
+            return
+        tmp = f'{self.out}.npz.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, tctypes=np.array(self.tctypes), ref=self.ref,
+                     n=self._n[:self.points], mean=self.mean, std=self.std,
+                     err_mean=self.err.values, err_std=self.err.std,
+                     err_max=self.maxerr)
+        os.replace(tmp, f'{self.out}.npz')
+
+    def close(self):
+        if self.out is not None:
+            self._csv.close()
+
+    def plot(self, fn):
+        """Render measurements and errors against reference to `fn` with
+        the Agg backend."""
+        import matplotlib
+        matplotlib.use('Agg')  # headless; must precede pyplot
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots(ncols=2, figsize=(12, 5))
+        order = np.argsort(self.ref)
+        ref, mean, std = self.ref[order], self.mean[order], self.std[order]
+        ax[0].set_title('Temperature Measurements')
+        ax[0].set_ylabel('Temperature [deg C]')
+        ax[0].set_xlabel('Reference Temperature [deg C]')
+        ax[1].set_title('Temperature Error')
+        ax[1].set_ylabel('Temperature Error [deg C]')
+        ax[1].set_xlabel('Reference Temperature [deg C]')
+        for j, t in enumerate(self.tctypes):
+            ax[0].errorbar(ref, mean[:, j], yerr=std[:, j], label=t,
+                           marker=f'${t}$', linestyle='-')
+            ax[1].plot(ref, mean[:, j] - ref, '-', label=t, marker=f'${t}$')
+        ax[0].plot(ref, ref, 'k.--', label='Ground Truth')
+        ax[0].legend()
+        ax[1].legend()
+        fig.tight_layout()
+        fig.savefig(fn)
+        plt.close(fig)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Control plane for the Calcifer daemon. An asyncio server on a Unix-domain
+socket, plus an optional TCP port, answers a line protocol from any number
+of concurrent clients on its own thread, so monitoring never blocks the
+sampler or other clients. The same event loop optionally serves
+`Calcifer.metrics` over HTTP for Prometheus at `GET /metrics`.
+
+Each request is one line of whitespace separated words; each reply is one
+line of JSON with an `ok` field and, on failure, an `error` message.
+
+    status                       daemon and per-channel state
+    temp [CHANNEL]               newest temperature(s)
+    buffer [CHANNEL]             ring buffer contents, oldest first
+    thresh ON OFF [CHANNEL]      set detector thresholds in degC
+    loglevel LEVEL               set log level
+    reload                       reapply changed config file values
+    metrics                      Prometheus text exposition in `metrics`
+    faults                       active faults, recovery breakers, history
+    sound                        play a random sound
+    stop                         shut down the daemon; `off` is an alias
+    help                         list commands
+
+Author: Marion Anderson
+"""
+
+__all__ = ['ControlServer', 'request', 'COMMANDS']
+
+import json
+import socket
+from math import isnan
+from pathlib import Path
+from threading import Event, Thread
+
+from metrics import CONTENT_TYPE
+
+COMMANDS = ('status', 'temp', 'buffer', 'thresh', 'loglevel', 'reload',
+            'metrics', 'faults', 'sound', 'stop', 'help')
+MAXLINE = 1024  # longest accepted request line in bytes
+
+
+def _num(x):
+    """JSON-safe float; NaN becomes null."""
+    return None if isnan(x) else x
+
+
+class ControlServer(object):
+    """Asyncio control server for a `Calcifer` instance.
+
+    Parameters
+    ----------
+    job : Calcifer
+        Daemon to control
+    path : str or Path
+        Unix-domain socket path; empty disables it
+    host : str, optional
+        TCP listen address, by default '127.0.0.1'
+    port : int, optional
+        TCP listen port; 0 disables TCP, by default 0
+    metrics_port : int, optional
+        HTTP metrics port on `host`; 0 disables, by default 0
+
+    Notes
+    -----
+    Commands and metrics rendering run on the event loop's default thread
+    pool, so a slow command (e.g. `reload` waiting on `job.lock` and reading
+    the config file) never stalls other clients or `/metrics`. Reads are
+    snapshots of sampler state; setters replace whole objects (detectors,
+    loggers) so the sampler never sees a half-applied change.
+    """
+    def __init__(self, job, path, host='127.0.0.1', port=0, metrics_port=0):
+        self.job = job
+        self.path = Path(path) if path else None
+        self.host = host
+        self.port = port
+        self.metrics_port = metrics_port
+        self.clients = 0
+        self.requests = 0
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    def start(self):
+        """Bind sockets and start serving on a background thread.
+
+        Raises
+        ------
+        OSError
+            Socket in use by a running daemon, or bind failure
+        """
+        if self.path is not None:
+            self._claim_path()
+        ready = Event()
+        errors = []
+        self._thread = Thread(target=self._main, args=(ready, errors))
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        if errors:
+            self._thread.join()
+            raise errors[0]
+
+    def stop(self, timeout=None):
+        """Close sockets and stop server thread."""
+        if self._loop is not None and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+            self._thread.join(timeout)
+
+    def _claim_path(self):
+        """Remove a stale socket file; refuse if a daemon answers on it."""
+        if not self.path.exists():
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            try:
+                s.connect(str(self.path))
+            except OSError:  # nobody listening
+                self.path.unlink()
+                return
+        raise OSError(f'control socket {self.path} already in use')
+
+    def _main(self, ready, errors):
+        import asyncio  # only the daemon needs it; keeps `request` light
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve(ready, errors))
+        finally:
+            self._loop.close()
+
+    async def _serve(self, ready, errors):
+        import asyncio
+        self._stopped = asyncio.Event()
+        servers = []
+        try:
+            if self.path is not None:
+                servers.append(await asyncio.start_unix_server(
+                    self._handle, str(self.path), limit=MAXLINE))
+            if self.port:
+                servers.append(await asyncio.start_server(
+                    self._handle, self.host, self.port, limit=MAXLINE))
+            if self.metrics_port:
+                servers.append(await asyncio.start_server(
+                    self._handle_http, self.host, self.metrics_port,
+                    limit=MAXLINE))
+        except OSError as e:
+            errors.append(e)
+        ready.set()
+        if not errors:
+            self.job.logger.info(f'control server listening; path:{self.path} '
+                                 f'port:{self.port} '
+                                 f'metrics_port:{self.metrics_port}')
+            await self._stopped.wait()
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        if self.path is not None and not errors:
+            self.path.unlink(missing_ok=True)
+
+    async def _handle(self, reader, writer):
+        self.clients += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # line over MAXLINE
+                    writer.write(b'{"ok": false, "error": "line too long"}\n')
+                    break
+                if not line:
+                    break
+                reply = await self._loop.run_in_executor(
+                    None, self.dispatch, line.decode(errors='replace'))
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+                if reply.get('stopping'):
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _handle_http(self, reader, writer):
+        """Answer one HTTP/1.0-style request; only `GET /metrics`."""
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():  # skip headers
+                pass
+            method, target = (request.decode(errors='replace').split()
+                              + ['', ''])[:2]
+            if method == 'GET' and target.split('?')[0] == '/metrics':
+                status, ctype = '200 OK', CONTENT_TYPE
+                body = (await self._loop.run_in_executor(
+                    None, self.job.metrics.render)).encode()
+            else:
+                status, ctype, body = '404 Not Found', 'text/plain', b'not found\n'
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: {ctype}\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (ConnectionError, ValueError):  # reset or line over MAXLINE
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, line):
+        """Run one request line. Blocking; the server calls it off the
+        event loop. Any handler exception becomes an error reply.
+
+        Returns
+        -------
+        dict
+            JSON-serializable reply
+        """
+        words = line.split()
+        if not words:
+            return {'ok': False, 'error': 'empty request'}
+        cmd, args = words[0].lower(), words[1:]
+        if cmd == 'off':  # legacy shutdown message
+            cmd = 'stop'
+        if cmd not in COMMANDS:
+            return {'ok': False, 'error': f'unknown command:{cmd}'}
+        self.requests += 1
+        try:
+            reply = getattr(self, f'cmd_{cmd}')(*args)
+        except Exception as e:
+            return {'ok': False, 'error': f'{cmd}: {e}'}
+        reply['ok'] = True
+        return reply
+
+    def _channels(self, name=None):
+        chans = self.job.channels
+        if name is None:
+            return chans
+        chans = [ch for ch in chans if ch.name == name]
+        if not chans:
+            raise KeyError(f'unknown channel:{name}')
+        return chans
+
+    def cmd_status(self):
+        job = self.job
+        return {'go': job.go, 'fire_going': job.fire_going,
+                'powercycles': job.powercycles, 'fault': bool(job.fault.value),
+                'clients': self.clients,
+                'channels': [{'name': ch.name, 'tctype': ch._tctype_str,
+                              'temp': _num(ch.tempbuf.last),
+                              'smoothed': _num(ch.smoothed),
+                              'thresh': ch.thresh, 'off_thresh': ch.off_thresh,
+                              'fire_going': ch.fire_going,
+                              'drdy_count': ch.drdy_count}
+                             for ch in job.channels],
+                'idle': job.idle.status(job.clock.monotonic()),
+                'workers': job.supervisor.status()}
+
+    def cmd_temp(self, channel=None):
+        return {'temp': {ch.name: _num(ch.tempbuf.last)
+                         for ch in self._channels(channel)}}
+
+    def cmd_buffer(self, channel=None):
+        return {'buffer': {ch.name: [(_num(x), t) for x, t in list(ch.tempbuf)]
+                           for ch in self._channels(channel)}}
+
+    def cmd_thresh(self, on, off, channel=None):
+        self._channels(channel)  # validate name
+        self.job.set_thresholds(float(on), float(off), channel)
+        return {}
+
+    def cmd_loglevel(self, level):
+        level = level.upper()
+        if level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+            raise ValueError(f'invalid loglevel:{level}')
+        self.job.set_loglevel(level)
+        return {}
+
+    def cmd_reload(self):
+        return self.job.reload()
+
+    def cmd_metrics(self):
+        return {'metrics': self.job.metrics.render()}
+
+    def cmd_faults(self):
+        return self.job.faults.status()
+
+    def cmd_sound(self):
+        self.job.soundbyte()
+        return {}
+
+    def cmd_stop(self):
+        self.job.logger.info('Shutoff signal recieved. Shutting down...')
+        self.job.go = False
+        return {'stopping': True}
+
+    def cmd_help(self):
+        return {'commands': list(COMMANDS)}
+
+
+def request(cmd, path=None, host='127.0.0.1', port=0, timeout=2.):
+    """Send one request to a control server and return its reply.
+
+    Parameters
+    ----------
+    cmd : str
+        Request line, e.g. 'temp' or 'thresh 120 50'
+    path : str or Path, optional
+        Unix-domain socket path; tried first if set, by default None
+    host : str, optional
+        TCP address, by default '127.0.0.1'
+    port : int, optional
+        TCP port, used if `path` is unset; by default 0
+    timeout : float, optional
+        Socket timeout in seconds, by default 2
+
+    Returns
+    -------
+    dict
+        Decoded reply
+    """
+    if path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        addr = str(path)
+    elif port:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        addr = (host, port)
+    else:
+        raise ValueError('no control socket path or port')
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        sock.sendall(cmd.strip().encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError('control server closed connection')
+    return json.loads(line)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser('Send a command to a running Calcifer daemon')
+    parser.add_argument('command', nargs='+', help=f'one of {COMMANDS}')
+    parser.add_argument('--socket', type=str, default='/tmp/calcifer.sock',
+                        help='control socket path')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0,
+                        help='use TCP instead of the Unix socket')
+    args = parser.parse_args()
+    path = None if args.port else args.socket
+    reply = request(' '.join(args.command), path, args.host, args.port)
+    print(json.dumps(reply, indent=2))
+    raise SystemExit(0 if reply.get('ok') else 1)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Fire detectors for Calcifer. Each detector looks at the temperature ring
+buffer after every new sample and decides whether a fire is going. All
+detectors cost O(1) per sample.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['ThresholdDetector', 'SlopeDetector', 'CombinedDetector',
+           'HoldDetector', 'get_detector', 'detector_params', 'DETECTORS']
+
+from ringbuf import RingBuffer
+
+SLOPE_BINS = 10  # slope window subdivisions; samples in each are averaged
+
+
+class ThresholdDetector(object):
+    """Absolute temperature hysteresis.
+
+    Parameters
+    ----------
+    thresh : float
+        Celsius threshold for fire off to fire on
+    off_thresh : float
+        Celsius threshold for fire on to fire off
+    smoothing : str, optional
+        RingBuffer statistic to compare, by default 'last'
+    """
+    name = 'threshold'
+
+    def __init__(self, thresh, off_thresh, smoothing='last', **kwargs):
+        self.thresh = thresh
+        self.off_thresh = off_thresh
+        self.smoothing = smoothing
+
+    def update(self, buf, fire_going):
+        """Fire state after newest sample in `buf`.
+
+        Parameters
+        ----------
+        buf : RingBuffer
+            Temperature buffer; newest sample already appended
+        fire_going : bool
+            Fire state before this sample
+
+        Returns
+        -------
+        bool
+            Fire state after this sample
+        """
+        temp = buf.stat(self.smoothing)
+        if fire_going:
+            return not temp < self.off_thresh
+        return temp > self.thresh
+
+    def set_thresholds(self, thresh, off_thresh):
+        """Change thresholds in place, keeping detector state. Assigned in
+        the order that keeps `off_thresh` below `thresh` throughout, as the
+        sampler may read them meanwhile."""
+        if off_thresh < self.off_thresh:
+            self.off_thresh, self.thresh = off_thresh, thresh
+        else:
+            self.thresh, self.off_thresh = thresh, off_thresh
+
+
+class SlopeDetector(object):
+    """Rate-of-rise detector using a least-squares slope over the last
+    `slope_window` seconds. A cold flue warms quickly long before it reaches
+    an absolute threshold, so ignition is flagged as soon as the slope
+    exceeds `rise_rate`. The fire is considered out once the temperature is
+    below `off_thresh` and no longer rising faster than `fall_rate`.
+
+    The window is split into `SLOPE_BINS` bins and the samples in each bin
+    are averaged before the fit, so the window covers the same time and
+    rejects the same noise whatever `T_read` is. No fire is declared until
+    the fit spans at least half the window.
+
+    Parameters
+    ----------
+    off_thresh : float
+        Celsius threshold for fire on to fire off
+    slope_window : float
+        Seconds in the least-squares window
+    rise_rate : float
+        degC/min slope for fire off to fire on
+    fall_rate : float, optional
+        degC/min slope at or below which the fire may go out, by default 0
+    smoothing : str, optional
+        RingBuffer statistic compared to `off_thresh`, by default 'last'
+    """
+    name = 'slope'
+
+    def __init__(self, off_thresh, slope_window, rise_rate, fall_rate=0.,
+                 smoothing='last', **kwargs):
+        if not slope_window > 0:
+            raise ValueError(f'invalid slope_window:{slope_window}')
+        self.off_thresh = off_thresh
+        self.slope_window = slope_window
+        self.rise_rate = rise_rate
+        self.fall_rate = fall_rate
+        self.smoothing = smoothing
+        self.binwidth = slope_window / SLOPE_BINS
+        self.window = RingBuffer(SLOPE_BINS)
+        self._tlast = None
+        self._bin = [0, 0., 0., None]  # count, sum x, sum t, first t
+
+    @property
+    def rate(self):
+        """Current slope in degC/min"""
+        return self.window.slope * 60
+
+    @property
+    def ready(self):
+        """Whether the fit spans enough of the window to be trusted"""
+        return (len(self.window) >= 3
+                and self.window.span >= self.slope_window / 2)
+
+    def _add(self, x, t):
+        b = self._bin
+        if b[0] and t - b[3] >= self.binwidth:  # close bin at its mean
+            self.window.append(b[1] / b[0], b[2] / b[0])
+            b[:] = [0, 0., 0., None]
+        if not b[0]:
+            b[3] = t
+        b[0] += 1
+        b[1] += x
+        b[2] += t
+
+    def update(self, buf, fire_going):
+        """Fire state after newest sample in `buf`. See
+        `ThresholdDetector.update`."""
+        x, t = buf[-1]
+        if t != self._tlast:  # ignore repeat calls without a new sample
+            self._add(x, t)
+            self._tlast = t
+        rate = self.rate
+        if fire_going:
+            return not (buf.stat(self.smoothing) < self.off_thresh
+                        and rate <= self.fall_rate)
+        return self.ready and rate > self.rise_rate
+
+    def set_thresholds(self, thresh, off_thresh):
+        """Change `off_thresh` in place, keeping the slope fit. See
+        `ThresholdDetector.set_thresholds`."""
+        self.off_thresh = off_thresh
+
+
+class CombinedDetector(object):
+    """Combine threshold and slope detectors.
+
+    Parameters
+    ----------
+    combine : str, optional
+        `any` declares a fire when either detector does and puts it out when
+        both do; `all` requires both to agree a fire started, by default 'any'
+    kwargs
+        Parameters for `ThresholdDetector` and `SlopeDetector`
+    """
+    name = 'combined'
+
+    def __init__(self, combine='any', **kwargs):
+        if combine not in ('any', 'all'):
+            raise ValueError(f'invalid combine:{combine}')
+        self.combine = combine
+        self.detectors = [ThresholdDetector(**kwargs), SlopeDetector(**kwargs)]
+
+    def update(self, buf, fire_going):
+        """Fire state after newest sample in `buf`. See
+        `ThresholdDetector.update`."""
+        votes = [d.update(buf, fire_going) for d in self.detectors]
+        if fire_going:  # stay going until every detector says out
+            return any(votes)
+        return any(votes) if self.combine == 'any' else all(votes)
+
+    def set_thresholds(self, thresh, off_thresh):
+        """See `ThresholdDetector.set_thresholds`."""
+        for d in self.detectors:
+            d.set_thresholds(thresh, off_thresh)
+
+
+class HoldDetector(object):
+    """Debounce another detector: a change of fire state is only reported
+    once the wrapped detector has voted for it continuously for `hold`
+    seconds, so a noise spike can neither start nor put out a fire.
+
+    Parameters
+    ----------
+    detector : Detector
+        Detector whose votes are held
+    hold : float
+        Seconds a vote for the other state must last
+    """
+
+    def __init__(self, detector, hold):
+        if hold < 0:
+            raise ValueError(f'invalid hold:{hold}')
+        self.detector = detector
+        self.hold = hold
+        self._since = None
+
+    @property
+    def name(self):
+        return self.detector.name
+
+    def update(self, buf, fire_going):
+        """Fire state after newest sample in `buf`. See
+        `ThresholdDetector.update`."""
+        t = buf[-1][1]
+        if self.detector.update(buf, fire_going) == fire_going:
+            self._since = None
+            return fire_going
+        if self._since is None:
+            self._since = t
+        if t - self._since < self.hold:
+            return fire_going
+        self._since = None
+        return not fire_going
+
+    def set_thresholds(self, thresh, off_thresh):
+        """Change the wrapped detector's thresholds, keeping any pending
+        hold. See `ThresholdDetector.set_thresholds`."""
+        self.detector.set_thresholds(thresh, off_thresh)
+
+
+DETECTORS = {'threshold': ThresholdDetector, 'slope': SlopeDetector,
+             'combined': CombinedDetector}
+
+
+def get_detector(name, hold=0., **kwargs):
+    """Construct fire detector by name.
+
+    Parameters
+    ----------
+    name : str
+        Detector name; key of `DETECTORS`
+    hold : float, optional
+        Seconds a state change must persist; wraps the detector in a
+        `HoldDetector` if nonzero, by default 0
+    kwargs
+        Detector parameters: thresh, off_thresh, smoothing, slope_window,
+        rise_rate, fall_rate, combine
+
+    Returns
+    -------
+    Detector instance
+    """
+    try:
+        cls = DETECTORS[name.lower()]
+    except KeyError:
+        raise ValueError(f'unknown detector:{name}; choices:{list(DETECTORS)}')
+    if hold < 0:
+        raise ValueError(f'invalid hold:{hold}')
+    detector = cls(**kwargs)
+    return HoldDetector(detector, hold) if hold else detector
+
+
+def detector_params(conf):
+    """Read detector parameters from a config section.
+
+    Parameters
+    ----------
+    conf : mapping
+        Config section, e.g. `ConfigParser()['DEFAULT']`
+
+    Returns
+    -------
+    dict
+        `get_detector` keyword arguments, including `name`
+    """
+    return {'name': conf['detector'], 'thresh': float(conf['thresh']),
+            'off_thresh': float(conf['off_thresh']),
+            'smoothing': conf['smoothing'],
+            'slope_window': float(conf['slope_window']),
+            'rise_rate': float(conf['rise_rate']),
+            'fall_rate': float(conf['fall_rate']), 'combine': conf['combine'],
+            'hold': float(conf['hold'])}
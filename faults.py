@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Fault handling for Calcifer. Decodes the MAX31856 fault status register into
+fault classes, picks a recovery action per class, and runs recoveries on a
+worker thread with exponential backoff and a circuit breaker, so a flapping
+sensor cannot keep the amplifiers power cycling and the sampler never blocks
+on a relay delay.
+
+| class    | status register bits       | readings  | recovery               |
+| -------- | -------------------------- | --------- | ---------------------- |
+| open     | open_tc                    | discarded | none; wait for repair  |
+| ovuv     | voltage                    | discarded | power cycle            |
+| cj_range | cj_range                   | discarded | none                   |
+| tc_range | tc_range                   | kept      | none                   |
+| limit    | cj/tc high/low thresholds  | kept      | none                   |
+| drdy     | DRDY never fell            | -         | reconfigure, then power cycle |
+
+The status register is only read when a channel's FAULT pin is low, so a
+healthy sample costs nothing extra.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['FaultManager', 'Backoff', 'decode', 'FAULT_CLASSES', 'CLASSES',
+           'DISCARD', 'RECOVERY', 'NOFAULTS']
+
+from collections import deque
+from queue import Queue
+from threading import Thread
+
+# driver `fault` dict key -> fault class
+FAULT_CLASSES = {'open_tc': 'open', 'voltage': 'ovuv', 'cj_range': 'cj_range',
+                 'tc_range': 'tc_range', 'cj_high': 'limit',
+                 'cj_low': 'limit', 'tc_high': 'limit', 'tc_low': 'limit'}
+CLASSES = ('open', 'ovuv', 'cj_range', 'tc_range', 'limit', 'drdy')
+# classes whose conversions are garbage and kept out of the ring buffer
+DISCARD = frozenset(('open', 'ovuv', 'cj_range'))
+# class -> recovery actions, escalating to the next once one has failed
+RECOVERY = {'ovuv': ('powercycle',), 'drdy': ('reconfigure', 'powercycle')}
+NOFAULTS = frozenset()
+
+
+def decode(fault):
+    """Fault classes from the driver's `fault` status dict.
+
+    Parameters
+    ----------
+    fault : dict
+        `MAX31856.fault`, status register bit name -> bool
+
+    Returns
+    -------
+    frozenset of str
+        Active `CLASSES`
+    """
+    return frozenset(FAULT_CLASSES[k] for k, v in fault.items()
+                     if v and k in FAULT_CLASSES)
+
+
+class Backoff(object):
+    """Exponential backoff and circuit breaker for one recovery action.
+
+    Parameters
+    ----------
+    base : float
+        Seconds between the first and second attempt; doubles per attempt
+    cap : float
+        Longest delay between attempts in seconds
+    limit : int
+        Failed attempts that open the breaker
+    reset : float
+        Seconds an open breaker waits before allowing one trial attempt
+    settle : float
+        Fault-free seconds after which the last attempt counts as a success
+
+    Notes
+    -----
+    An attempt fails if its fault comes back within `settle` seconds, so a
+    flapping sensor keeps backing off instead of resetting every time it
+    briefly recovers.
+    """
+    def __init__(self, base=1., cap=300., limit=5, reset=3600., settle=600.):
+        self.base = base
+        self.cap = cap
+        self.limit = limit
+        self.reset = reset
+        self.settle = settle
+        self.failures = 0
+        self.attempts = 0
+        self.last = None  # time of last attempt
+        self.last_fault = None  # time fault was last requested
+
+    @property
+    def delay(self):
+        """Seconds the next attempt must wait after the last one."""
+        if not self.failures:
+            return 0.
+        return min(self.cap, self.base * 2**(self.failures - 1))
+
+    def is_open(self, now):
+        """Whether the breaker is blocking attempts at `now`."""
+        return (self.failures >= self.limit
+                and now - self.last < self.reset
+                and now - self.last_fault < self.settle)
+
+    def request(self, now):
+        """Note a fault needing this recovery at `now`.
+
+        Returns
+        -------
+        bool
+            Whether to attempt the recovery now
+        """
+        if self.last_fault is not None and now - self.last_fault >= self.settle:
+            self.failures = 0  # quiet long enough; last attempt held
+        self.last_fault = now
+        if self.last is not None:
+            wait = self.reset if self.failures >= self.limit else self.delay
+            if now - self.last < wait:
+                return False
+        self.failures += 1
+        self.attempts += 1
+        self.last = now
+        return True
+
+
+class FaultManager(object):
+    """Tracks per-channel fault classes and runs recoveries.
+
+    Parameters
+    ----------
+    job : Calcifer
+        Daemon whose channels, relay, and lock recoveries use
+    base, cap, limit, reset, settle : optional
+        `Backoff` parameters for every recovery action
+    history : int, optional
+        Fault events kept, by default 256
+    metrics : metrics.Registry, optional
+        Registry for fault and recovery series
+
+    Notes
+    -----
+    `check` runs on the sampler thread and only compares sets; recoveries
+    are queued for the worker thread started by `start`. Without a worker
+    (e.g. replay on a virtual clock) recoveries run inline.
+    """
+    def __init__(self, job, base=1., cap=300., limit=5, reset=3600.,
+                 settle=600., history=256, metrics=None):
+        self.job = job
+        self.params = dict(base=base, cap=cap, limit=limit, reset=reset,
+                           settle=settle)
+        self.backoffs = {}  # (action, channel or '') -> Backoff
+        self.active = {}  # channel name -> frozenset of classes
+        self.history = deque(maxlen=history)
+        self._pending = set()
+        self._queue = Queue()
+        self._thread = None
+        self._onsets = {}
+        self._recoveries = {}
+        if metrics is not None:
+            for ch in job.channels:
+                for c in CLASSES:
+                    self._onsets[ch.name, c] = metrics.counter(
+                        'faults_total', 'Fault onsets', channel=ch.name,
+                        fault=c)
+            for action in ('reconfigure', 'powercycle'):
+                self._recoveries[action] = metrics.counter(
+                    'recoveries_total', 'Recovery attempts', action=action)
+            metrics.gauge('breakers_open', 'Recovery breakers open',
+                          fn=lambda: sum(b.is_open(self.job.clock.monotonic())
+                                         for b in list(self.backoffs.values())))
+
+    def start(self):
+        """Start recovery worker thread."""
+        self._thread = Thread(target=self._work, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop recovery worker thread after current recovery."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _event(self, channel, fault, event, **kwargs):
+        rec = {'time': self.job.clock.time(), 'channel': channel,
+               'fault': fault, 'event': event}
+        rec.update(kwargs)
+        self.history.append(rec)
+
+    def check(self, channels, now):
+        """Update fault classes after a loop iteration and request
+        recoveries. Runs on the sampler thread.
+
+        Parameters
+        ----------
+        channels : list of channels.Channel
+            Channels with `fault_classes` and `drdy_count` up to date
+        now : float
+            Clock monotonic time
+
+        Returns
+        -------
+        bool
+            Whether any fault is active
+        """
+        timeout = self.job.drdy_count_timeout
+        faulted = False
+        for ch in channels:
+            classes = ch.fault_classes
+            if ch.drdy_count > timeout:
+                classes = classes | {'drdy'}
+            prev = self.active.get(ch.name, NOFAULTS)
+            if not (classes or prev):
+                continue
+            faulted = faulted or bool(classes) or ch.drdy_count >= timeout
+            if classes != prev:
+                self._transition(ch, prev, classes)
+            for c in classes:
+                if c in RECOVERY:
+                    self._request(ch, c, now)
+        return faulted
+
+    def _transition(self, ch, prev, classes):
+        logger = self.job.logger
+        for c in classes - prev:
+            logger.critical('%s fault:%s', ch.name or 'tc', c)
+            self._event(ch.name, c, 'onset')
+            if (ch.name, c) in self._onsets:
+                self._onsets[ch.name, c].inc()
+        for c in prev - classes:
+            logger.warning('%s fault cleared:%s', ch.name or 'tc', c)
+            self._event(ch.name, c, 'cleared')
+        if classes:
+            self.active[ch.name] = classes
+        else:
+            del self.active[ch.name]
+
+    def _backoff(self, action, channel):
+        key = (action, channel)
+        if key not in self.backoffs:
+            self.backoffs[key] = Backoff(**self.params)
+        return self.backoffs[key]
+
+    def _request(self, ch, fault, now):
+        """Pick the first recovery for `fault` that has not failed yet."""
+        actions = RECOVERY[fault]
+        for action in actions:
+            # the relay powers every amplifier, so power cycles are shared
+            b = self._backoff(action, '' if action == 'powercycle' else ch.name)
+            if b.failures and action != actions[-1] \
+                    and now - b.last_fault < b.settle:
+                b.last_fault = now
+                continue  # tried recently and the fault is back; escalate
+            if b.request(now):
+                self._submit(action, ch, fault)
+                if b.failures == b.limit:
+                    self.job.logger.error('%s breaker open after %d attempts;'
+                                          ' next in %gs', action, b.failures,
+                                          b.reset)
+                    self._event(ch.name, fault, 'breaker_open', action=action)
+            return
+
+    def _submit(self, action, ch, fault):
+        key = (action, '' if action == 'powercycle' else ch.name)
+        if key in self._pending:
+            return
+        self._pending.add(key)
+        if self._thread is None:
+            self._recover(key, action, ch, fault)
+        else:
+            self._queue.put((key, action, ch, fault))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._recover(*item)
+
+    def _recover(self, key, action, ch, fault):
+        job = self.job
+        job.logger.warning('%s recovery for %s fault:%s', action,
+                           ch.name or 'tc', fault)
+        if action in self._recoveries:
+            self._recoveries[action].inc()
+        try:
+            if action == 'powercycle':
+                job.powercycle_max()
+            else:
+                with job.lock:
+                    ch.configtc()
+                    ch.drdy_count = 0
+            result = 'ok'
+        except Exception as e:
+            job.logger.error(f'{action} recovery failed: {e!r}')
+            result = repr(e)
+        finally:
+            self._pending.discard(key)
+        self._event(ch.name, fault, action, result=result)
+
+    def status(self):
+        """Active faults, breakers, and history.
+
+        Returns
+        -------
+        dict
+            JSON-serializable status
+        """
+        now = self.job.clock.monotonic()
+        return {'active': {k: sorted(v) for k, v in self.active.items()},
+                'breakers': [{'action': a, 'channel': c,
+                              'open': b.is_open(now), 'failures': b.failures,
+                              'attempts': b.attempts, 'delay': b.delay}
+                             for (a, c), b in list(self.backoffs.items())],
+                'history': list(self.history)}
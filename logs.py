@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Logging pipeline for Calcifer. Every module logs through the one `calcifer`
+logger, whose only handler puts records on a bounded queue; a listener
+thread formats and writes them. Calls below the log level return after a
+cached level check, and calls above it cost one message merge and a queue
+put on the calling thread, so logging never waits on stdout or the journal.
+If the listener falls behind, records are dropped and counted rather than
+blocking the sampler.
+
+Log calls should pass arguments instead of pre-formatting, so filtered calls
+do no string work; `extra` fields become structured fields in JSON and
+journald output:
+
+    logger = get_logger(INFO, 'json')
+    logger.warning('%s drdy timeout', name, extra={'channel': name})
+
+| format   | output                                                   |
+| -------- | -------------------------------------------------------- |
+| text     | `LEVEL - message` lines on stdout                        |
+| json     | one JSON object per line on stdout                       |
+| journald | native journal fields (PRIORITY, CODE_*, extras); falls back to text without a journal |
+
+Author: Marion Anderson
+"""
+
+__all__ = ['get_logger', 'LogPipeline', 'PIPELINE', 'LOGFORMATS', 'LOGGER']
+
+import atexit
+import json
+import logging
+import os
+import socket
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from sys import stdout
+
+LOGGER = 'calcifer'
+LOGFORMATS = ('text', 'json', 'journald')
+JOURNAL_SOCKET = '/run/systemd/journal/socket'
+# logging level -> syslog priority
+PRIORITIES = {logging.CRITICAL: 2, logging.ERROR: 3, logging.WARNING: 4,
+              logging.INFO: 6, logging.DEBUG: 7}
+# attributes every LogRecord has; anything else came from `extra`
+_STANDARD = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_TRACEBACKS = logging.Formatter()
+
+
+def _extras(record):
+    return {k: v for k, v in vars(record).items() if k not in _STANDARD}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, message, `extra` fields,
+    and the traceback if any."""
+    def format(self, record):
+        doc = {'time': record.created, 'level': record.levelname,
+               'msg': record.getMessage()}
+        doc.update(_extras(record))
+        if record.exc_info:
+            doc['exc'] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str)
+
+
+class JournalHandler(logging.Handler):
+    """Writes records to journald's native socket, with `extra` fields as
+    uppercase journal fields.
+
+    Raises
+    ------
+    OSError
+        No journal socket
+    """
+    def __init__(self, identifier=LOGGER, path=JOURNAL_SOCKET):
+        super().__init__()
+        self.identifier = identifier
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.connect(path)
+
+    @staticmethod
+    def _field(key, value):
+        key, value = key.upper().encode(), str(value).encode()
+        if b'\n' not in value:
+            return key + b'=' + value + b'\n'
+        # binary-safe form: name, newline, little-endian length, value
+        return key + b'\n' + len(value).to_bytes(8, 'little') + value + b'\n'
+
+    def emit(self, record):
+        try:
+            msg = record.getMessage()
+            if record.exc_info:
+                msg += '\n' + _TRACEBACKS.formatException(record.exc_info)
+            fields = {'MESSAGE': msg,
+                      'PRIORITY': PRIORITIES.get(record.levelno, 6),
+                      'SYSLOG_IDENTIFIER': self.identifier,
+                      'CODE_FILE': record.pathname,
+                      'CODE_LINE': record.lineno,
+                      'CODE_FUNC': record.funcName}
+            fields.update(_extras(record))
+            self.sock.sendall(b''.join(self._field(k, v)
+                                       for k, v in fields.items()))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.sock.close()
+        super().close()
+
+
+class _Enqueue(QueueHandler):
+    """QueueHandler that only merges the message arguments on the calling
+    thread, and drops records instead of blocking when the queue is full."""
+    def __init__(self, queue, pipeline):
+        super().__init__(queue)
+        self.pipeline = pipeline
+
+    def prepare(self, record):
+        # arguments may be live objects (ring buffers) that change before
+        # the listener gets to them, so merge them now; formatting waits
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.pipeline.dropped += 1
+
+
+class LogPipeline(object):
+    """The `calcifer` logger and its queue listener.
+
+    Parameters
+    ----------
+    name : str, optional
+        Logger name, by default 'calcifer'
+    maxsize : int, optional
+        Records queued before new ones are dropped, by default 10000
+
+    Notes
+    -----
+    The logger object never changes, so modules holding it (audio,
+    telemetry, faults) see level and format changes immediately.
+    """
+    def __init__(self, name=LOGGER, maxsize=10000):
+        self.logger = logging.getLogger(name)
+        self.logger.propagate = False
+        self.maxsize = maxsize
+        self.fmt = None
+        self.listener = None
+        self.dropped = 0
+        self._handler = None
+        self._new_queue()
+        atexit.register(self.stop)  # flush queued records on exit
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _new_queue(self):
+        if self._handler is not None:
+            self.logger.removeHandler(self._handler)
+        self.queue = Queue(self.maxsize)
+        self._handler = _Enqueue(self.queue, self)
+        self.logger.addHandler(self._handler)
+
+    def _output(self, fmt):
+        if fmt == 'journald':
+            try:
+                return JournalHandler()
+            except OSError:
+                fmt = 'text'  # not under systemd
+        handler = logging.StreamHandler(stdout)
+        handler.setFormatter(JSONFormatter() if fmt == 'json' else
+                             logging.Formatter('%(levelname)s - %(message)s'))
+        return handler
+
+    def configure(self, level, fmt='text'):
+        """Set log level and output format; starts the listener thread.
+
+        Parameters
+        ----------
+        level : int
+            logging library level
+        fmt : str, optional
+            One of `LOGFORMATS`, by default 'text'
+
+        Returns
+        -------
+        logging.Logger
+        """
+        if fmt not in LOGFORMATS:
+            raise ValueError(f'invalid logformat:{fmt}; choices:{LOGFORMATS}')
+        self.logger.setLevel(level)  # gates records before any formatting
+        if fmt != self.fmt:
+            self.stop()
+            self.listener = QueueListener(self.queue, self._output(fmt))
+            self.listener.start()
+            self.fmt = fmt
+        return self.logger
+
+    def stop(self):
+        """Write out queued records and stop the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+        self.fmt = None
+
+    def _after_fork(self):
+        # the listener thread does not survive a fork, and the queue lock may
+        # have been held by another thread when it happened
+        fmt, self.fmt, self.listener = self.fmt, None, None
+        self._new_queue()
+        if fmt is not None:
+            self.configure(self.logger.level, fmt)
+
+
+PIPELINE = LogPipeline()
+
+
+def get_logger(level, fmt='text'):
+    """The `calcifer` logger at `level`, writing `fmt` output.
+
+    Parameters
+    ----------
+    level : int
+        logging library level
+    fmt : str, optional
+        One of `LOGFORMATS`, by default 'text'
+
+    Returns
+    -------
+    logging.Logger
+    """
+    return PIPELINE.configure(level, fmt)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Metrics for Calcifer in the Prometheus text exposition format. Counters and
+histograms are plain attribute updates on the sampler thread, so recording
+costs well under a microsecond per sample. Values Calcifer already tracks
+(temperatures, fire state, power cycles) are registered as callbacks and
+only read when the metrics are rendered, so they cost nothing per sample.
+
+    reg = Registry()
+    reads = reg.counter('samples_total', 'Conversions read', channel='flue')
+    reads.inc()
+    reg.gauge('fire_going', 'Fire detected', fn=lambda: job.fire_going)
+    print(reg.render())
+
+Author: Marion Anderson
+"""
+
+__all__ = ['Registry', 'Counter', 'Gauge', 'Histogram', 'CONTENT_TYPE',
+           'SPI_BUCKETS', 'JITTER_BUCKETS', 'SOUND_BUCKETS']
+
+from bisect import bisect_left
+from math import isinf, isnan
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'calcifer_'
+
+# histogram bucket upper bounds in seconds
+SPI_BUCKETS = (50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 50e-3)
+JITTER_BUCKETS = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 0.1,
+                  0.2, 0.5, 1., 5.)
+SOUND_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1., 2., 5., 10., 30., 60.)
+
+
+def _fmt(v):
+    """Sample value as exposition text."""
+    if isinstance(v, int):  # counts and bools
+        return str(int(v))
+    v = float(v)
+    if isnan(v):
+        return 'NaN'
+    if isinf(v):
+        return '+Inf' if v > 0 else '-Inf'
+    return repr(v)
+
+
+def _labelstr(labels):
+    if not labels:
+        return ''
+    esc = [(k, str(v).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n')) for k, v in labels.items()]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in esc) + '}'
+
+
+class Counter(object):
+    """Monotonic count.
+
+    Parameters
+    ----------
+    labels : dict
+        Series labels
+    fn : callable, optional
+        Returns the current count when rendered; `inc` unused, by default
+        None
+    """
+    kind = 'counter'
+
+    def __init__(self, labels, fn=None):
+        self.labels = labels
+        self.fn = fn
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def samples(self, name):
+        v = self.value if self.fn is None else self.fn()
+        yield name, self.labels, v
+
+
+class Gauge(Counter):
+    """Value that can go up and down; see `Counter`."""
+    kind = 'gauge'
+
+    def set(self, v):
+        self.value = v
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets.
+
+    Parameters
+    ----------
+    labels : dict
+        Series labels
+    buckets : tuple of float
+        Increasing bucket upper bounds; +Inf is implicit
+    """
+    kind = 'histogram'
+
+    def __init__(self, labels, buckets):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def samples(self, name):
+        total = 0
+        for le, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            yield f'{name}_bucket', dict(self.labels, le=_fmt(le)), total
+        yield f'{name}_sum', self.labels, self.sum
+        yield f'{name}_count', self.labels, self.count
+
+
+class Registry(object):
+    """Collection of named metric series.
+
+    Parameters
+    ----------
+    prefix : str, optional
+        Prepended to every metric name, by default 'calcifer_'
+
+    Notes
+    -----
+    Series with the same name share HELP and TYPE lines; registering a name
+    again with new labels adds a series.
+    """
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self._metrics = {}  # name -> (help, kind, [series])
+
+    def _add(self, name, help, metric):
+        name = self.prefix + name
+        _, kind, series = self._metrics.setdefault(name,
+                                                   (help, metric.kind, []))
+        if kind != metric.kind:
+            raise ValueError(f'metric {name} already registered as {kind}')
+        series.append(metric)
+        return metric
+
+    def counter(self, name, help, fn=None, **labels):
+        """Register a `Counter`; `labels` become series labels."""
+        return self._add(name, help, Counter(labels, fn))
+
+    def gauge(self, name, help, fn=None, **labels):
+        """Register a `Gauge`; `labels` become series labels."""
+        return self._add(name, help, Gauge(labels, fn))
+
+    def histogram(self, name, help, buckets, **labels):
+        """Register a `Histogram`; `labels` become series labels."""
+        return self._add(name, help, Histogram(labels, buckets))
+
+    def render(self):
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        for name, (help, kind, series) in self._metrics.items():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in series:
+                for sname, labels, v in metric.samples(name):
+                    lines.append(f'{sname}{_labelstr(labels)} {_fmt(v)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Offline replay for Calcifer. Runs the full mainloop iteration
+(`Calcifer.step`) against the simulated amplifier on a virtual clock, so a
+recorded or synthetic burn season replays as fast as the CPU allows instead
+of in real time. Reports fire transitions, detection latency, and false
+triggers per config section; section sweeps run on a process pool.
+
+Traces are `time,temperature[,fire]` csv files, telemetry files or
+directories (first channel), or `backends.parse_curve` specs. Every
+simulated channel replays the same trace. Trace time is measured from
+its first sample. For csv traces the optional `fire` column marks ground
+truth and every run of nonzero rows is a burn; for telemetry the recorded
+fire state is used. A trace may hold any number of burns; latency is
+scored per burn and false triggers in the gaps between them.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['VirtualClock', 'load_trace', 'parse_burn', 'curve_burns', 'score',
+           'latency_str', 'replay', 'sweep']
+
+from concurrent.futures import ProcessPoolExecutor
+from math import isnan
+from pathlib import Path
+from time import perf_counter
+
+from backends import interp_curve, parse_curve
+from sampling import Ticker
+
+EPOCH = 1.6e9  # wall time of virtual clock zero
+
+
+class VirtualClock(object):
+    """Drop-in for the `time` module clock functions whose `sleep` advances
+    time instantly.
+
+    Parameters
+    ----------
+    epoch : float, optional
+        Wall time `time()` reports at `monotonic()` zero, by default `EPOCH`
+    """
+    def __init__(self, epoch=EPOCH):
+        self.epoch = epoch
+        self.t = 0.
+
+    def monotonic(self):
+        return self.t
+
+    def monotonic_ns(self):
+        return round(self.t*1e9)
+
+    def time(self):
+        return self.epoch + self.t
+
+    def sleep(self, secs):
+        if secs > 0:
+            self.t += secs
+
+
+def load_trace(fn, channel=0):
+    """Read burn trace from a csv file or telemetry file/directory.
+
+    Parameters
+    ----------
+    fn : str or Path
+        `time,temperature[,fire]` csv, `.tlm` telemetry file, or directory
+        of telemetry files
+    channel : int, optional
+        Telemetry channel index, by default 0
+
+    Returns
+    -------
+    samples : list of (time, temperature) tuples
+        Time in seconds since the first sample
+    burns : list of (start, end) tuples or None
+        Runs of nonzero fire rows; `end` is None for a burn still going at
+        the end of the trace. None if the trace has no fire column
+    """
+    fn = Path(fn)
+    if fn.is_dir() or fn.suffix == '.tlm':
+        from telemetry import load
+        data = load(fn, channel=channel)
+        data = data[data['drdy'] != 0]  # skip loop iterations without a read
+        rows = zip(data['time'].tolist(), data['temp'].tolist(),
+                   data['fire_going'].tolist())
+    else:
+        rows = _csv_rows(fn)
+    samples, burns, t0, truth = [], [], None, False
+    for t, temp, fire in rows:
+        if isnan(temp):
+            continue
+        if t0 is None:
+            t0 = t
+        samples.append((t - t0, temp))
+        truth = truth or fire is not None
+        if fire and (not burns or burns[-1][1] is not None):
+            burns.append((t - t0, None))
+        elif not fire and burns and burns[-1][1] is None:
+            burns[-1] = (burns[-1][0], t - t0)
+    return samples, burns if truth else None
+
+
+def _csv_rows(fn):
+    """(time, temperature, fire) rows of a csv trace."""
+    with open(fn) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            row = line.strip().split(',')
+            try:
+                t, temp = float(row[0]), float(row[1])
+            except ValueError:  # header row
+                continue
+            yield t, temp, float(row[2]) if len(row) > 2 else None
+
+
+def parse_burn(spec):
+    """(start, end) burn from a `start[,end]` string; end may be omitted
+    for a fire still going at the end of the trace."""
+    start, _, end = spec.partition(',')
+    return float(start), float(end) if end.strip() else None
+
+
+def score(transitions, burns):
+    """Detection latency per burn and false triggers between burns.
+
+    Parameters
+    ----------
+    transitions : list of (time, fire_going) tuples
+        Fire state changes, starting from fire out
+    burns : list of (start, end) tuples, float, or None
+        Ground-truth fires, sorted; `end` None for a fire still going at the
+        end of the trace. A float is a single burn starting then. None if
+        unknown: the first detection is reported and nothing is scored
+
+    Returns
+    -------
+    dict
+        `ignition` and `detected`, `latency`, `already_on` of the first
+        burn; worst `latency` over all burns, None if any was missed;
+        `missed` burns; `false_triggers` summed over gaps; `transitions`
+        count; and `burns` and `gaps` lists of per-interval results. A burn
+        the detector is already on for at its start has latency 0 and
+        `already_on` set. Later fire-on edges within a burn count as its
+        `retriggers`; every fire-on edge between burns is a false trigger.
+    """
+    ons = [t for t, going in transitions if going]
+    if burns is None:
+        return {'ignition': None, 'detected': ons[0] if ons else None,
+                'latency': None, 'already_on': False, 'missed': 0,
+                'false_triggers': 0, 'transitions': len(transitions),
+                'burns': [], 'gaps': []}
+    if not isinstance(burns, (list, tuple)):
+        burns = [(burns, None)]
+    inf = float('inf')
+    results, gaps, prev = [], [], 0.
+    for start, end in burns:
+        end = inf if end is None else end
+        gaps.append({'start': prev, 'end': start, 'false_triggers':
+                     sum(prev <= t < start for t in ons)})
+        going = False  # fire state just before `start`
+        for t, g in transitions:
+            if t >= start:
+                break
+            going = g
+        hits = [t for t in ons if start <= t < end]
+        detected = start if going else (hits[0] if hits else None)
+        results.append({
+            'start': start, 'end': None if end == inf else end,
+            'detected': detected, 'already_on': going,
+            'latency': None if detected is None else detected - start,
+            'retriggers': len(hits) - (not going and bool(hits))})
+        prev = end
+    if prev != inf:
+        gaps.append({'start': prev, 'end': None, 'false_triggers':
+                     sum(t >= prev for t in ons)})
+    lats = [b['latency'] for b in results]
+    first = results[0] if results else {}
+    return {'ignition': first.get('start'), 'detected': first.get('detected'),
+            'latency': (max(lats) if lats and None not in lats else None),
+            'already_on': first.get('already_on', False),
+            'missed': lats.count(None),
+            'false_triggers': sum(g['false_triggers'] for g in gaps),
+            'transitions': len(transitions), 'burns': results, 'gaps': gaps}
+
+
+def curve_burns(spec):
+    """(start, end) of `burn` curve specs; None otherwise."""
+    kind, _, args = spec.strip().partition(':')
+    if kind.lower() == 'burn':
+        vals = [float(v) for v in args.split(',')]
+        return [(vals[2], vals[4])]
+    return None
+
+
+def replay(trace, fnconf=None, section='DEFAULT', duration=None,
+           burns=None, **kwargs):
+    """Replay a trace through `Calcifer.step` on a virtual clock.
+
+    Parameters
+    ----------
+    trace : str
+        csv or telemetry path, or `backends.parse_curve` spec
+    fnconf : str, optional
+        Conf file, by default calcifer.ini
+    section : str, optional
+        Conf section, by default 'DEFAULT'
+    duration : float, optional
+        Seconds to replay; required for curve specs, by default trace length
+    burns : list of (start, end) tuples or float, optional
+        Ground-truth burns overriding the trace's; see `score`, by default
+        None
+    kwargs : optional
+        Config overrides passed to `Calcifer`
+
+    Returns
+    -------
+    dict
+        `score` results plus section, trace, transitions as (time, state)
+        tuples, samples read, loop iterations, simulated seconds, wall
+        seconds, drdy power cycles, and idle seconds and wakeups saved
+    """
+    from calcifer import Calcifer  # deferred; workers import it themselves
+    if Path(trace).exists():
+        samples, trace_burns = load_trace(trace)
+        if not samples:
+            raise ValueError(f'no samples in {trace}')
+        ts, temps = zip(*samples)
+        curve = interp_curve(list(ts), list(temps))
+        duration = ts[-1] if duration is None else duration
+    else:
+        trace_burns = curve_burns(trace)
+        if duration is None:
+            raise ValueError(f'duration required for curve:{trace}')
+        curve = parse_curve(trace)
+    burns = trace_burns if burns is None else burns
+
+    conf = {'backend': 'sim', 'telemetry_dir': '', 'loglevel': 'ERROR'}
+    conf.update({k: str(v) for k, v in kwargs.items()})
+    clock = VirtualClock()
+    job = Calcifer(fnconf=fnconf, section=section, clock=clock, **conf)
+    for chip in job.backend.chips.values():
+        chip.curve = curve
+    job.soundswitch.value = 0  # replay never plays sounds
+    transitions, reads, steps = [], 0, 0
+    ticker = Ticker(clock)  # same deadlines as `Calcifer._run`
+    ticker.start()
+    tstart = perf_counter()
+    try:
+        while clock.t < duration:
+            going = job.fire_going
+            ticker.wait(job.step())
+            steps += 1
+            reads += job.fresh
+            if job.fire_going != going:
+                transitions.append((clock.t, job.fire_going))
+    finally:
+        job._wrapup()
+    res = score(transitions, burns)
+    res.update({'section': section, 'trace': str(trace),
+                'detector': job.channels[0].detector_name, 'transitions': transitions,
+                'samples': reads, 'steps': steps, 'sim_s': clock.t,
+                'wall_s': perf_counter() - tstart,
+                'powercycles': job.powercycles,
+                'idle_s': job._idle_status()['seconds'],
+                'wakeups_saved': job._idle_status()['saved']})
+    return res
+
+
+def _replay(args):
+    trace, kw = args
+    return replay(trace, **kw)
+
+
+def sweep(traces, sections, fnconf=None, workers=None, **kwargs):
+    """Replay every trace through every section on a process pool.
+
+    Parameters
+    ----------
+    traces : list of str
+        Traces; see `replay`
+    sections : list of str
+        Conf sections
+    fnconf : str, optional
+        Conf file, by default calcifer.ini
+    workers : int, optional
+        Worker processes, by default CPU count
+    kwargs : optional
+        `replay` keyword arguments shared by every run
+
+    Returns
+    -------
+    list of dict
+        `replay` results in trace-major order
+    """
+    jobs = [(trace, dict(kwargs, fnconf=fnconf, section=section))
+            for trace in traces for section in sections]
+    if len(jobs) == 1:
+        return [_replay(jobs[0])]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(_replay, jobs))
+
+
+def latency_str(res):
+    """Worst `score` latency for tables: `missed n/m` if any burn was
+    missed, `-` with no ground truth, and a `*` if the detector was already
+    on at a burn's start."""
+    burns = res['burns']
+    if not burns:
+        return '-'
+    if res['missed']:
+        return f"missed {res['missed']}/{len(burns)}"
+    star = '*' if any(b['already_on'] for b in burns) else ''
+    return f"{res['latency']:.1f}{star}"
+
+
+def report(results):
+    """Print `replay` results as a table."""
+    fmt = '{:<12} {:<10} {:>12} {:>6} {:>6} {:>10} {:>7} {:>8}  {}'
+    print(fmt.format('section', 'detector', 'latency_s', 'false', 'trans',
+                     'sim_h', 'idle_h', 'wall_s', 'trace'))
+    for r in results:
+        print(fmt.format(r['section'], r['detector'], latency_str(r),
+                         r['false_triggers'], len(r['transitions']), f"{r['sim_s']/3600:.1f}",
+                         f"{r['idle_s']/3600:.1f}", f"{r['wall_s']:.2f}",
+                         r['trace']))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Fixed-size temperature ring buffer with constant-cost running statistics for
+fire detection.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['RingBuffer', 'STATS']
+
+from array import array
+from bisect import bisect_left, insort
+from math import nan
+
+# statistics usable as `smoothing` config values
+STATS = ('last', 'mean', 'median', 'ema')
+
+
+class RingBuffer(object):
+    """Preallocated circular buffer of timestamped samples.
+
+    Running sums keep `mean`, `ema`, and least-squares `slope` at O(1) cost
+    per sample regardless of buffer length. `median` keeps a sorted copy of
+    the window in an array, so it costs an O(log n) search plus a memmove.
+
+    Parameters
+    ----------
+    n : int
+        Buffer length in samples
+    alpha : float, optional
+        Exponential moving average weight of the newest sample, by default 0.2
+
+    Notes
+    -----
+    Timestamps are stored relative to an origin that is moved to the oldest
+    sample (and the sums recomputed) once every `n` appends. That keeps the
+    least-squares sums well conditioned and stops subtraction error from
+    accumulating while remaining amortized O(1).
+    """
+    def __init__(self, n, alpha=0.2):
+        if n < 1:
+            raise ValueError(f'invalid ring buffer length:{n}')
+        self.n = int(n)
+        self.alpha = float(alpha)
+        self.clear()
+
+    def clear(self):
+        """Drop all samples."""
+        self.vals = array('d', bytes(8*self.n))
+        self.times = array('d', bytes(8*self.n))
+        self._sorted = array('d')
+        self.ndx = -1  # index of newest sample
+        self.count = 0
+        self.ema = nan
+        self._t0 = 0.  # timestamp origin for least-squares sums
+        self._st = self._sx = self._stt = self._stx = 0.
+        self._since_rebase = 0
+
+    def append(self, x, t):
+        """Add sample `x` taken at time `t` seconds, evicting the oldest."""
+        if self.count == 0:
+            self._t0 = t
+        self.ndx = (self.ndx + 1) % self.n
+        if self.count == self.n:  # evict oldest, which lives at ndx
+            xo = self.vals[self.ndx]
+            to = self.times[self.ndx] - self._t0
+            self._st -= to
+            self._sx -= xo
+            self._stt -= to*to
+            self._stx -= to*xo
+            del self._sorted[bisect_left(self._sorted, xo)]
+        else:
+            self.count += 1
+        self.vals[self.ndx] = x
+        self.times[self.ndx] = t
+        tr = t - self._t0
+        self._st += tr
+        self._sx += x
+        self._stt += tr*tr
+        self._stx += tr*x
+        insort(self._sorted, x)
+        self.ema = x if self.count == 1 else self.ema + self.alpha*(x - self.ema)
+        self._since_rebase += 1
+        if self._since_rebase >= self.n:
+            self._rebase()
+
+    def _rebase(self):
+        """Move timestamp origin to the oldest sample and recompute sums."""
+        self._since_rebase = 0
+        self._t0 = self.times[(self.ndx + 1) % self.n] \
+            if self.count == self.n else self.times[0]
+        self._st = self._sx = self._stt = self._stx = 0.
+        for i in range(self.count):
+            tr = self.times[i] - self._t0
+            x = self.vals[i]
+            self._st += tr
+            self._sx += x
+            self._stt += tr*tr
+            self._stx += tr*x
+
+    @property
+    def last(self):
+        """Newest sample"""
+        return self.vals[self.ndx] if self.count else nan
+
+    @property
+    def mean(self):
+        """Mean of buffered samples"""
+        return self._sx / self.count if self.count else nan
+
+    @property
+    def median(self):
+        """Median of buffered samples"""
+        c = self.count
+        if not c:
+            return nan
+        if c % 2:
+            return self._sorted[c//2]
+        return (self._sorted[c//2 - 1] + self._sorted[c//2]) / 2
+
+    @property
+    def slope(self):
+        """Least-squares temperature slope over the buffer in units/second"""
+        c = self.count
+        den = c*self._stt - self._st*self._st
+        if c < 2 or den <= 0:
+            return 0.
+        return (c*self._stx - self._st*self._sx) / den
+
+    @property
+    def span(self):
+        """Seconds between oldest and newest sample"""
+        if self.count < 2:
+            return 0.
+        return self.times[self.ndx] - self[0][1]
+
+    def stat(self, name):
+        """Statistic by name; one of `STATS`."""
+        if name not in STATS:
+            raise ValueError(f'invalid statistic:{name}; choices:{STATS}')
+        return getattr(self, name)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """(value, timestamp) of `i`th sample, oldest first."""
+        if not -self.count <= i < self.count:
+            raise IndexError('ring buffer index out of range')
+        j = (self.ndx - self.count + 1 + i % self.count) % self.n
+        return self.vals[j], self.times[j]
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def tolist(self):
+        """Buffered values, oldest first."""
+        return [x for x, _ in self]
+
+    def __repr__(self):
+        return (f'RingBuffer(n={self.n}, count={self.count}, last={self.last:.2f}, '
+                f'mean={self.mean:.2f}, slope={self.slope:.3f}/s)')
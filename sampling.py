@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Sample period schedulers for Calcifer. After every loop iteration the
+scheduler picks how long to sleep before the next sample. All schedulers
+cost O(1) per channel.
+
+`fixed` is the original behavior: `T_read` while no fire is detected and
+`T_going` while one is. `adaptive` samples just often enough that the
+temperature cannot cross the next detection threshold unseen: the period is
+the time to reach `thresh` (or fall to `off_thresh` while a fire is going)
+at the faster of the measured trend and `max_rate`, halved for margin,
+and bounded by `T_min` and `T_max`. Far from a threshold on flat readings
+it stretches to `T_max`; close to one, or on a steep trend, it shortens
+toward `T_min`. Channels with a slope detector are also sampled at least
+once per slope bin, so the rate-of-rise fit is never starved.
+
+`Ticker` turns those periods into sleeps. Deadlines are kept in integer
+nanoseconds and each is one period after the previous deadline rather than
+after the work finished, so the cadence does not drift by the conversion,
+logging, or sound queueing time spent each iteration.
+
+`Idle` duty-cycles the daemon outside heating season. Once every channel
+has read cold (below `off_thresh`) and flat for `after` seconds, the
+amplifiers are powered down between samples taken every `period` seconds
+and heartbeat blinks are batched into one burst per period. The first
+warm, rising, or unreadable sample resumes normal sampling.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['FixedPeriod', 'AdaptivePeriod', 'Ticker', 'Idle', 'get_sampler',
+           'SAMPLERS']
+
+import time
+from math import isnan
+from threading import Event
+
+from detectors import SLOPE_BINS
+
+
+class FixedPeriod(object):
+    """Fixed period per fire state.
+
+    Parameters
+    ----------
+    T_read : float
+        Seconds between samples while no fire is detected
+    T_going : float
+        Seconds between samples while a fire is going
+    """
+    name = 'fixed'
+
+    def __init__(self, T_read, T_going, **kwargs):
+        self.T_read = T_read
+        self.T_going = T_going
+        self.last = T_read
+
+    def period(self, channels, fire_going):
+        """Seconds until the next sample.
+
+        Parameters
+        ----------
+        channels : list of channels.Channel
+            Channels after detection of the newest sample
+        fire_going : bool
+            Fire state before the newest sample
+
+        Returns
+        -------
+        float
+        """
+        self.last = self.T_going if fire_going else self.T_read
+        return self.last
+
+
+class AdaptivePeriod(object):
+    """Period from the distance to the next threshold and the trend.
+
+    Parameters
+    ----------
+    T_min : float
+        Shortest period in seconds
+    T_max : float
+        Longest period in seconds
+    max_rate : float
+        degC/min the temperature is assumed able to change by regardless of
+        trend; bounds detection latency for changes up to this fast
+    margin : float, optional
+        Fraction of the predicted time to a threshold to sleep, by default 0.5
+    growth : float, optional
+        Max factor the period may grow by per sample, so one quiet reading
+        cannot jump straight to `T_max`, by default 2
+
+    Notes
+    -----
+    Each channel's distance is from its smoothed temperature to `thresh`
+    while its fire is off, and to `off_thresh` while it is going; its rate is
+    the buffer's least-squares slope toward that threshold, floored at
+    `max_rate`. A channel whose detector uses the slope is sampled at
+    least every `slope_window / SLOPE_BINS` seconds. The shortest channel
+    period wins. Periods shrink immediately.
+
+    Ignition is only caught early if it is no faster than `max_rate`; a
+    fire rising faster can go unseen for up to `T_max` (or a slope bin), so
+    adaptive sampling can detect a fast kindling later than a short fixed
+    `T_read` while taking far fewer samples.
+    """
+    name = 'adaptive'
+
+    def __init__(self, T_min, T_max, max_rate, margin=0.5, growth=2.,
+                 **kwargs):
+        if not 0 < T_min <= T_max:
+            raise ValueError(f'need 0 < T_min:{T_min} <= T_max:{T_max}')
+        if not max_rate > 0:
+            raise ValueError(f'invalid max_rate:{max_rate}')
+        self.T_min = T_min
+        self.T_max = T_max
+        self.max_rate = max_rate / 60  # degC/s
+        self.margin = margin
+        self.growth = growth
+        self.last = T_min
+
+    def _channel_period(self, ch):
+        temp = ch.smoothed
+        if isnan(temp):
+            return self.T_min
+        slope = ch.tempbuf.slope
+        if ch.fire_going:  # watching for the fall to off_thresh
+            dist, toward = temp - ch.off_thresh, -slope
+        else:
+            dist, toward = ch.thresh - temp, slope
+        if dist <= 0:
+            return self.T_min
+        T = self.margin * dist / max(self.max_rate, toward)
+        if ch.detector_name != 'threshold':  # slope fit needs every bin
+            T = min(T, ch.slope_window / SLOPE_BINS)
+        return T
+
+    def period(self, channels, fire_going):
+        """Seconds until the next sample. See `FixedPeriod.period`."""
+        T = min((self._channel_period(ch) for ch in channels),
+                default=self.T_min)
+        T = min(T, self.last*self.growth, self.T_max)
+        self.last = max(T, self.T_min)
+        return self.last
+
+
+SAMPLERS = {'fixed': FixedPeriod, 'adaptive': AdaptivePeriod}
+
+
+def get_sampler(name, **kwargs):
+    """Construct sample period scheduler by name.
+
+    Parameters
+    ----------
+    name : str
+        Scheduler name; key of `SAMPLERS`
+    kwargs
+        Scheduler parameters: T_read, T_going, T_min, T_max, max_rate
+
+    Returns
+    -------
+    Scheduler instance
+    """
+    try:
+        cls = SAMPLERS[name.lower()]
+    except KeyError:
+        raise ValueError(f'unknown sampling:{name}; choices:{list(SAMPLERS)}')
+    return cls(**kwargs)
+
+
+class Ticker(object):
+    """Sleeps to deadlines a period apart on a monotonic nanosecond clock.
+
+    Parameters
+    ----------
+    clock : object, optional
+        Time source with `monotonic_ns` and `sleep`, by default the `time`
+        module
+
+    Attributes
+    ----------
+    due : int or None
+        Latest deadline in clock nanoseconds; None until `start`
+    overruns : int
+        Deadlines already past when `wait` was called
+    late : float
+        Seconds the latest wakeup came after its deadline
+
+    Notes
+    -----
+    An overrun re-anchors the schedule at the current time instead of
+    sleeping 0 until it catches up, so a long stall (e.g. a blocked SPI
+    read) is followed by one sample, not a burst.
+    """
+    def __init__(self, clock=time):
+        self.clock = clock
+        self.due = None
+        self.overruns = 0
+        self.late = 0.
+
+    def start(self):
+        """Anchor the schedule at the current time.
+
+        Returns
+        -------
+        int
+            Clock nanoseconds
+        """
+        self.due = self.clock.monotonic_ns()
+        return self.due
+
+    def wait(self, period):
+        """Sleep until `period` seconds after the previous deadline.
+
+        Parameters
+        ----------
+        period : float
+            Seconds between deadlines; 0 re-anchors without sleeping, e.g.
+            when acquisition already waited for the conversion
+
+        Returns
+        -------
+        float
+            Seconds the wakeup came after the deadline
+        """
+        now = self.clock.monotonic_ns()
+        if not period or self.due is None:
+            self.due, self.late = now, 0.
+            return self.late
+        due = self.due + round(period*1e9)
+        if now >= due:
+            self.overruns += 1
+            self.due = now
+        else:
+            self.clock.sleep((due - now)*1e-9)
+            now = self.clock.monotonic_ns()
+            self.due = due
+        self.late = (now - due)*1e-9
+        return self.late
+
+
+class Idle(object):
+    """Decides when to idle and accounts for what idling saved.
+
+    Parameters
+    ----------
+    after : float
+        Seconds of cold, flat readings before idling; 0 disables
+    period : float
+        Seconds between samples while idle
+    rate : float
+        degC/min; readings are flat while every buffer slope is within
+        +-`rate`, and rising once a channel warms faster than `rate` between
+        idle samples
+    hbeat : float, optional
+        Seconds between heartbeat LED toggles outside idle, for the wakeup
+        account; 0 for no heartbeat, by default 0
+
+    Attributes
+    ----------
+    active : bool
+        Whether idling
+    awake : threading.Event
+        Set while not idling; idle waiters wake on it
+    seconds : float
+        Seconds spent idle, excluding the current stretch
+    wakeups : int
+        Sampler and heartbeat wakeups made while idle
+    expected : float
+        Wakeups the same time would have taken at the normal rate
+    powered : float
+        Seconds the amplifiers were powered while idle
+
+    Notes
+    -----
+    `update` runs on the sampler thread after each sample; heartbeat
+    wakeups are added with `blinked`.
+    """
+    def __init__(self, after, period, rate, hbeat=0.):
+        if after and not period > 0:
+            raise ValueError(f'invalid T_idle:{period}')
+        self.after = after
+        self.period = period
+        self.rate = rate / 60  # degC/s
+        self.hbeat = hbeat
+        self.active = False
+        self.awake = Event()
+        self.awake.set()
+        self.since = None  # start of the current cold, flat stretch
+        self.entered = self.last = None
+        self.normal = period
+        self.refs = []
+        self.seconds = self.expected = self.powered = 0.
+        self.wakeups = 0
+
+    def _quiet(self, channels, fire_going):
+        """Whether every channel reads cold and flat."""
+        if fire_going:
+            return False
+        for ch in channels:
+            temp, slope = ch.smoothed, ch.tempbuf.slope
+            # NaN compares False, so unread channels are never quiet
+            if not (ch.fresh and temp < ch.off_thresh
+                    and abs(slope) <= self.rate):
+                return False
+        return True
+
+    def _rising(self, channels, dt):
+        """Whether any channel warmed faster than `rate` since the last
+        idle sample, or is unreadable or warm."""
+        for ch, ref in zip(channels, self.refs):
+            temp = ch.tempbuf.last
+            if not (ch.fresh and temp < ch.off_thresh
+                    and temp - ref <= self.rate*dt):
+                return True
+        return False
+
+    def update(self, channels, fire_going, now, period):
+        """Enter, stay in, or leave idle after a sample.
+
+        Parameters
+        ----------
+        channels : list of channels.Channel
+            Channels after detection of the newest sample
+        fire_going : bool
+            Fire state before the newest sample
+        now : float
+            Clock monotonic time
+        period : float
+            Normal seconds until the next sample
+
+        Returns
+        -------
+        bool
+            Whether to idle until the next sample
+        """
+        if not self.active:
+            if not (self.after > 0 and self._quiet(channels, fire_going)):
+                self.since = None
+                return False
+            if self.since is None:
+                self.since = now
+            if now - self.since < self.after:
+                return False
+            self.active = True
+            self.awake.clear()
+            self.entered = self.last = now
+            self.normal = period
+        else:
+            dt = now - self.last
+            self.wakeups += 1
+            self.expected += dt/self.normal if self.normal > 0 else 0
+            self.expected += dt/self.hbeat if self.hbeat > 0 else 0
+            self.last = now
+            if fire_going or self._rising(channels, dt):
+                self.wake(now)
+                return False
+        self.refs = [ch.tempbuf.last for ch in channels]
+        return True
+
+    def wake(self, now):
+        """Leave idle, e.g. on a rising trend or config change."""
+        if not self.active:
+            return
+        self.seconds += now - self.entered
+        self.active = False
+        self.since = None
+        self.awake.set()
+
+    def blinked(self, n=1):
+        """Count `n` heartbeat wakeups made while idle."""
+        self.wakeups += n
+
+    def pause(self):
+        """Sleep off-sampler threads for one idle period, or until idle
+        ends.
+
+        Returns
+        -------
+        bool
+            Whether idle ended
+        """
+        return self.awake.wait(self.period)
+
+    def status(self, now):
+        """Idle state and what idling saved.
+
+        Parameters
+        ----------
+        now : float
+            Clock monotonic time
+
+        Returns
+        -------
+        dict
+            `active`; idle `seconds`; seconds amplifiers were `off`;
+            `wakeups` made and `saved` against the normal rate
+        """
+        seconds = self.seconds
+        if self.active:
+            seconds += now - self.entered
+        return {'active': self.active, 'seconds': seconds,
+                'off': max(seconds - self.powered, 0.),
+                'wakeups': self.wakeups,
+                'saved': max(round(self.expected) - self.wakeups, 0)}
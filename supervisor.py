@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Worker supervision for Calcifer. Each worker thread reports progress with
+`beat`, promising its next beat within some seconds. A supervisor thread
+checks every worker each `period`:
+
+- a worker whose thread died (an uncaught exception) is restarted, with
+  `faults.Backoff` spacing out restarts and suspending them after
+  repeated crashes;
+- a worker that missed its promised beat by more than `slack` seconds is
+  reported as stalled. A thread stuck inside a driver cannot be killed,
+  so the supervisor stops petting the systemd watchdog and lets systemd
+  restart the whole service.
+
+Threads that manage their own replacement (e.g. the audio worker, which
+abandons a thread hung in the driver) register a `probe` instead: a
+callable run every check that recovers what it can and reports whether
+the thread was healthy, so a hang is logged and shown in status and
+metrics without waiting for the next time the thread is used.
+
+Under systemd (`Type=notify`) the supervisor sends READY=1 once workers
+are up, WATCHDOG=1 every check while every worker is healthy, a STATUS=
+line, and STOPPING=1 on shutdown, over the `NOTIFY_SOCKET` datagram
+protocol. Outside systemd these are no-ops.
+
+Author: Marion Anderson
+"""
+
+__all__ = ['Supervisor', 'Worker', 'sd_notify']
+
+import socket
+from os import environ
+from threading import Event, Thread
+from time import monotonic
+
+from faults import Backoff
+
+
+def sd_notify(state, env=environ):
+    """Send a state string to systemd's notify socket.
+
+    Parameters
+    ----------
+    state : str
+        Newline separated assignments, e.g. 'READY=1' or 'WATCHDOG=1'
+    env : mapping, optional
+        Environment holding NOTIFY_SOCKET, by default `os.environ`
+
+    Returns
+    -------
+    bool
+        Whether there was a notify socket to send to
+    """
+    path = env.get('NOTIFY_SOCKET')
+    if not path:
+        return False
+    if path[0] == '@':  # abstract namespace
+        path = '\0' + path[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(path)
+            sock.sendall(state.encode())
+    except OSError:
+        return False
+    return True
+
+
+class Worker(object):
+    """One supervised thread.
+
+    Parameters
+    ----------
+    name : str
+        Worker name for logs, metrics, and `Supervisor.beat`
+    target : callable
+        Loop body run on the thread; returns when the daemon stops
+    backoff : faults.Backoff
+        Restart spacing and breaker
+
+    Attributes
+    ----------
+    due : float or None
+        `time.monotonic` time the next beat was promised by
+    beats : int
+        Beats so far
+    restarts : int
+        Times the thread was restarted after dying
+    error : str or None
+        Exception that last ended the thread
+    exited : bool
+        Whether `target` returned; an exited worker is not restarted
+    """
+    def __init__(self, name, target, backoff):
+        self.name = name
+        self.target = target
+        self.backoff = backoff
+        self.thread = None
+        self.due = None
+        self.beats = 0
+        self.restarts = 0
+        self.error = None
+        self.exited = False
+        self.suspended = False  # restart breaker open
+
+    @property
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stalled(self, now, slack):
+        """Whether the promised beat is more than `slack` seconds late."""
+        return self.due is not None and now > self.due + slack
+
+
+class Supervisor(object):
+    """Starts, watches, and restarts worker threads.
+
+    Parameters
+    ----------
+    job : Calcifer
+        Daemon; workers run while `job.go`
+    period : float, optional
+        Seconds between checks, by default 5; shortened to half of
+        systemd's WatchdogSec when that is set
+    slack : float, optional
+        Seconds a beat may be late before its worker counts as stalled,
+        by default 30
+    backoff : dict, optional
+        `faults.Backoff` parameters for restarts, by default its defaults
+    metrics : metrics.Registry, optional
+        Registry for worker series
+    """
+    def __init__(self, job, period=5., slack=30., backoff=None, metrics=None):
+        self.job = job
+        self.period = period
+        usec = environ.get('WATCHDOG_USEC')
+        if usec:  # pet at twice the watchdog rate
+            self.period = min(period, int(usec)*1e-6/2)
+        self.slack = slack
+        self.backoff = backoff or {}
+        self.metrics = metrics
+        self.workers = {}
+        self.probes = {}  # name -> [probe, healthy at last check, failures]
+        self.thread = None
+        self.healthy = True
+        self._stop = Event()
+
+    def add(self, name, target):
+        """Register a worker; started by `start`.
+
+        Returns
+        -------
+        Worker
+        """
+        w = Worker(name, target, Backoff(**self.backoff))
+        self.workers[name] = w
+        if self.metrics is not None:
+            self.metrics.counter('worker_restarts_total', 'Worker restarts '
+                                 'after a crash', fn=lambda: w.restarts,
+                                 worker=name)
+            self.metrics.gauge('worker_up', 'Worker thread alive and beating',
+                               fn=lambda: self.ok(name), worker=name)
+        return w
+
+    def probe(self, name, fn):
+        """Register a health probe run on every check.
+
+        Parameters
+        ----------
+        name : str
+            Name for logs, metrics, and `status`
+        fn : callable
+            Returns whether the thread it watches was healthy; may recover
+            it before returning
+        """
+        self.probes[name] = [fn, True, 0]
+        if self.metrics is not None:
+            self.metrics.gauge('worker_up', 'Worker thread alive and beating',
+                               fn=lambda: self.probes[name][1], worker=name)
+
+    def beat(self, name, within):
+        """Record progress of worker `name`, promising another beat within
+        `within` seconds. Called on the worker's own thread."""
+        w = self.workers[name]
+        w.due = monotonic() + within
+        w.beats += 1
+
+    def ok(self, name):
+        """Whether worker `name` is alive and beating on time."""
+        w = self.workers.get(name)
+        return (w is not None and w.alive
+                and not w.stalled(monotonic(), self.slack))
+
+    def _launch(self, w):
+        w.due = None
+        w.exited = w.suspended = False
+        w.thread = Thread(target=self._wrap, args=(w,), name=w.name)
+        w.thread.daemon = True
+        w.thread.start()
+
+    def _wrap(self, w):
+        try:
+            w.target()
+            w.exited = True
+        except Exception as e:
+            w.error = repr(e)
+            self.job._errlog(e)
+
+    def start(self):
+        """Start every worker and the supervisor thread, then tell systemd
+        the daemon is ready."""
+        for w in self.workers.values():
+            self._launch(w)
+        self.thread = Thread(target=self._watch, args=(), name='supervisor')
+        self.thread.daemon = True
+        self.thread.start()
+        sd_notify('READY=1')
+
+    def check(self, now):
+        """Restart dead workers and report stalled ones.
+
+        Returns
+        -------
+        bool
+            Whether every worker is alive and on time
+        """
+        healthy = True
+        logger = self.job.logger
+        for w in self.workers.values():
+            if w.exited:
+                continue
+            if not w.alive:
+                healthy = False
+                if not self.job.go:
+                    continue
+                if w.backoff.request(now):
+                    w.restarts += 1
+                    logger.error('worker %s died (%s); restart %d', w.name,
+                                 w.error, w.restarts)
+                    self._launch(w)
+                elif w.backoff.is_open(now) and not w.suspended:
+                    w.suspended = True
+                    logger.critical('worker %s keeps dying; restarts '
+                                    'suspended', w.name)
+            elif w.stalled(now, self.slack):
+                healthy = False
+                logger.critical('worker %s stalled; last beat due %.0fs ago',
+                                w.name, now - w.due)
+        for name, p in self.probes.items():
+            try:
+                p[1] = bool(p[0]())
+            except Exception as e:
+                p[1] = False
+                self.job._errlog(e)
+            if not p[1]:
+                p[2] += 1
+                logger.error('worker %s unhealthy; failures %d', name, p[2])
+        return healthy
+
+    def _watch(self):
+        while not self._stop.is_set():
+            healthy = self.check(monotonic())
+            if healthy:
+                sd_notify('WATCHDOG=1')
+            if healthy != self.healthy:
+                sd_notify('STATUS=' + ('running' if healthy else 'degraded: '
+                          + ' '.join(self.status(only_bad=True))))
+            self.healthy = healthy
+            self._stop.wait(self.period)
+
+    def status(self, only_bad=False):
+        """Worker states for the control `status` command.
+
+        Returns
+        -------
+        dict
+            Worker name -> alive, on time, beats, restarts, last error
+        """
+        now = monotonic()
+        out = {}
+        for name, w in self.workers.items():
+            on_time = not w.stalled(now, self.slack)
+            if only_bad and (w.exited or w.alive and on_time):
+                continue
+            out[name] = {'alive': w.alive, 'on_time': on_time,
+                         'beats': w.beats, 'restarts': w.restarts,
+                         'error': w.error}
+        for name, (_, ok, failures) in self.probes.items():
+            if not (only_bad and ok):
+                out[name] = {'ok': ok, 'failures': failures}
+        return out
+
+    def stop(self):
+        """Stop the supervisor thread and tell systemd the daemon is
+        stopping. Workers exit on `job.go`."""
+        self._stop.set()
+        sd_notify('STOPPING=1')
+
+    def join(self, timeout=None):
+        """Wait for every worker thread to exit, then stop the supervisor."""
+        for w in self.workers.values():
+            if w.thread is not None:
+                w.thread.join(timeout)
+        self.stop()
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Persistent temperature telemetry for Calcifer. Samples are appended to
+fixed-width binary files by a background thread and read back as NumPy
+structured arrays through memory maps.
+
+File layout: 16 byte header (`MAGIC`, version, record size) followed by
+16 byte little-endian records of
+
+    time        float64  wall-clock seconds since epoch
+    temp        float32  degC; NaN if no conversion was read
+    drdy        uint8    1 if a conversion was read
+    fault       uint8    fault LED state
+    fire_going  uint8    fire state after the sample
+    channel     uint8    thermocouple channel index; 0 in single channel
+                         files, which predate it as padding
+
+Author: Marion Anderson
+"""
+
+__all__ = ['TelemetryWriter', 'open_memmap', 'load', 'RECORD', 'HEADER']
+
+from logging import getLogger
+from pathlib import Path
+from struct import Struct
+from threading import Event, Lock, Thread
+from time import localtime, strftime
+
+MAGIC = b'CALCTLM\0'
+VERSION = 1
+HEADER = Struct('<8sII')
+RECORD = Struct('<dfBBBB')
+SUFFIX = '.tlm'
+
+
+def _dtype():
+    """NumPy dtype matching `RECORD`. NumPy imported here to avoid slowing
+    daemon startup."""
+    from numpy import dtype
+    return dtype([('time', '<f8'), ('temp', '<f4'), ('drdy', 'u1'),
+                  ('fault', 'u1'), ('fire_going', 'u1'), ('channel', 'u1')])
+
+
+class TelemetryWriter(object):
+    """Batched background writer of sample records.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory for telemetry files; created if missing
+    rotate : float, optional
+        Seconds covered by each file, aligned to local midnight for multiples
+        of a day, by default 86400
+    flush : float, optional
+        Seconds between background flushes, by default 10
+    maxbuf : int, optional
+        Max buffered records; oldest are dropped if the disk falls behind,
+        by default 100000
+    logger : logging.Logger, optional
+        by default module logger
+
+    Notes
+    -----
+    `record` only appends a tuple to a list under a lock. Packing, writing,
+    and flushing happen on the writer thread, so SD card latency never reaches
+    the sampling loop.
+    """
+    def __init__(self, directory, rotate=86400., flush=10., maxbuf=100000,
+                 logger=None):
+        self.directory = Path(directory).expanduser()
+        self.rotate = rotate
+        self.flush = flush
+        self.maxbuf = maxbuf
+        self.logger = getLogger(__name__) if logger is None else logger
+        self.written = 0
+        self.dropped = 0
+        self._buf = []
+        self._lock = Lock()
+        self._wake = Event()
+        self._go = False
+        self._thread = None
+        self._f = None
+        self._fperiod = None  # rotation period of open file
+
+    def record(self, t, temp, drdy, fault, fire_going, channel=0):
+        """Queue a sample record. Never blocks on I/O."""
+        with self._lock:
+            self._buf.append((t, temp, drdy, fault, fire_going, channel))
+            if len(self._buf) > self.maxbuf:
+                del self._buf[0]
+                self.dropped += 1
+
+    def start(self):
+        """Start writer thread."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._go = True
+        self._thread = Thread(target=self._work, args=())
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Flush remaining records and stop writer thread."""
+        self._go = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _work(self):
+        while self._go:
+            self._wake.wait(self.flush)
+            self._wake.clear()
+            self._write()
+        self._write()
+        self._close()
+
+    def _period(self, t):
+        """Start of rotation period containing wall time `t`."""
+        offset = localtime(t).tm_gmtoff if self.rotate % 86400 == 0 else 0
+        return (t + offset) // self.rotate * self.rotate - offset
+
+    def _open(self, period):
+        self._close()
+        fn = self.directory / (strftime('calcifer-%Y%m%d-%H%M%S', localtime(period))
+                               + SUFFIX)
+        new = not fn.exists() or fn.stat().st_size == 0
+        self._f = open(fn, 'ab')
+        if new:
+            self._f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._fperiod = period
+        self.logger.info(f'telemetry file {fn}')
+
+    def _close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _write(self):
+        with self._lock:
+            buf, self._buf = self._buf, []
+        if not buf:
+            return
+        try:
+            chunk = bytearray()
+            for rec in buf:
+                period = self._period(rec[0])
+                if period != self._fperiod:
+                    if chunk:
+                        self._f.write(chunk)
+                        chunk = bytearray()
+                    self._open(period)
+                chunk += RECORD.pack(*rec)
+            self._f.write(chunk)
+            self._f.flush()
+            self.written += len(buf)
+        except (OSError, ValueError) as e:
+            self.dropped += len(buf)
+            self.logger.error(f'telemetry write failed: {e!r}')
+            self._close()
+            self._fperiod = None
+
+
+def open_memmap(fn):
+    """Memory map a telemetry file as a NumPy structured array.
+
+    Parameters
+    ----------
+    fn : str or Path
+        Telemetry file
+
+    Returns
+    -------
+    numpy.memmap
+        Records with fields time, temp, drdy, fault, fire_going, channel
+    """
+    from numpy import memmap
+    with open(fn, 'rb') as f:
+        magic, version, size = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError(f'{fn} is not a version {VERSION} telemetry file')
+    nrec = (Path(fn).stat().st_size - HEADER.size) // RECORD.size
+    return memmap(fn, dtype=_dtype(), mode='r', offset=HEADER.size,
+                  shape=(nrec,))
+
+
+def load(paths, start=None, end=None, channel=None):
+    """Load telemetry records from files and/or directories.
+
+    Parameters
+    ----------
+    paths : str, Path, or list of them
+        Telemetry files or directories of them
+    start : float, optional
+        Earliest wall time to keep, by default None
+    end : float, optional
+        Latest wall time to keep, by default None
+    channel : int, optional
+        Channel index to keep, by default all
+
+    Returns
+    -------
+    numpy structured array
+        Records sorted by file name, i.e. by time
+    """
+    from numpy import concatenate, empty
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    fns = []
+    for p in map(Path, paths):
+        fns += sorted(p.glob('*' + SUFFIX)) if p.is_dir() else [p]
+    parts = []
+    for fn in fns:
+        m = open_memmap(fn)
+        if not len(m):
+            continue
+        if start is not None and m['time'][-1] < start:
+            continue
+        if end is not None and m['time'][0] > end:
+            continue
+        if start is not None or end is not None:
+            keep = m['time'] >= (start if start is not None else -float('inf'))
+            keep &= m['time'] <= (end if end is not None else float('inf'))
+            m = m[keep]
+        if channel is not None:
+            m = m[m['channel'] == channel]
+        parts.append(m)
+    return concatenate(parts) if parts else empty(0, dtype=_dtype())
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    parser = ArgumentParser('Summarize or export Calcifer telemetry')
+    parser.add_argument('paths', nargs='+', help='telemetry files/directories')
+    parser.add_argument('--csv', type=str, default=None,
+                        help='export time,temperature,fire csv to file')
+    parser.add_argument('--channel', type=int, default=None,
+                        help='channel index to keep, default all')
+    args = parser.parse_args()
+    data = load(args.paths, channel=args.channel)
+    print(f'{len(data)} records')
+    if len(data):
+        from numpy import nanmax, nanmin
+        print(f'from {strftime("%c", localtime(data["time"][0]))} '
+              f'to {strftime("%c", localtime(data["time"][-1]))}')
+        print(f'temperature min {nanmin(data["temp"]):.1f} '
+              f'max {nanmax(data["temp"]):.1f} degC')
+    if args.csv is not None:
+        with open(args.csv, 'w') as f:
+            f.write('time,temperature,fire\n')
+            for rec in data:
+                f.write(f'{rec["time"]:.3f},{rec["temp"]:.3f},{rec["fire_going"]}\n')
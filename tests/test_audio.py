@@ -0,0 +1,54 @@
+"""Audio worker supervision tests with a stand-in driver.
+
+Author: Marion Anderson
+"""
+import sys
+from pathlib import Path
+from threading import Event
+from time import monotonic, sleep
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio import AudioWorker  # noqa: E402
+from supervisor import Supervisor  # noqa: E402
+
+
+class HangingAudio(AudioWorker):
+    """Playback blocks as if stuck in the audio driver."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = Event()
+
+    def _play(self, fn, queued):
+        self.busy_since = monotonic()
+        self.release.wait(5)
+
+
+class FakeJob(object):
+    go = True
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def _errlog(self, e):
+        raise e
+
+
+def test_probe_replaces_hung_worker():
+    audio = HangingAudio(timeout=0.05)
+    audio.start()
+    sup = Supervisor(FakeJob(audio.logger), period=60)
+    sup.probe('audio', audio.check)
+    try:
+        audio.play('x.wav')
+        sleep(0.5)  # past timeout plus two polls; no further play() calls
+        hung = audio.thread
+        sup.check(monotonic())
+        assert sup.status()['audio'] == {'ok': False, 'failures': 1}
+        assert audio.hangs == 1
+        assert audio.thread is not hung and audio.thread.is_alive()
+        sup.check(monotonic())
+        assert sup.status()['audio']['ok']
+    finally:
+        audio.release.set()
+        audio.stop(timeout=1)
@@ -0,0 +1,49 @@
+"""Characterization session tests with a stand-in amplifier.
+
+Author: Marion Anderson
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip('numpy')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from characterize import Session  # noqa: E402
+
+
+class FakeEngine(object):
+    """Reads `ref + 1` on every type."""
+    tctypes = ['K', 'J']
+
+    def __init__(self):
+        self.temp = 0.
+
+    def measure(self, n):
+        return {t: np.full(n, self.temp + 1) for t in self.tctypes}
+
+
+def run(out, refs, **kwargs):
+    engine = FakeEngine()
+    session = Session(engine, out=out, **kwargs)
+    for ref in refs:
+        engine.temp = ref
+        session.measure(ref)
+    session.close()
+    return session
+
+
+def test_points_past_capacity_are_kept(tmp_path):
+    session = run(tmp_path / 'c', range(10), max_points=4)
+    assert session.points == 10
+    assert session.ref.tolist() == list(range(10))
+    assert np.allclose(session.mean - session.ref[:, None], 1)
+
+
+def test_csv_appends_with_one_header(tmp_path):
+    run(tmp_path / 'c', [10, 20])
+    run(tmp_path / 'c', [30])
+    lines = (tmp_path / 'c.csv').read_text().splitlines()
+    assert lines[0].startswith('ref,n,')
+    assert [line.split(',')[0] for line in lines[1:]] == ['10', '20', '30']
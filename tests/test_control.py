@@ -0,0 +1,56 @@
+"""Control server tests against a stand-in daemon.
+
+Author: Marion Anderson
+"""
+import logging
+import sys
+from pathlib import Path
+from threading import Event, Thread
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from control import ControlServer, request  # noqa: E402
+
+
+class FakeJob(object):
+    """Just enough of `Calcifer` for the commands used here."""
+    def __init__(self):
+        self.logger = logging.getLogger('test_control')
+        self.release = Event()
+
+    def reload(self):
+        self.release.wait(5)  # e.g. waiting on `job.lock`
+        return {'changed': []}
+
+    def soundbyte(self):
+        raise RuntimeError('mixer gone')
+
+
+def test_slow_command_does_not_block_others(tmp_path):
+    job = FakeJob()
+    path = tmp_path / 'ctl.sock'
+    server = ControlServer(job, path)
+    server.start()
+    try:
+        slow = Thread(target=request, args=('reload', path), daemon=True)
+        slow.start()
+        tstart = perf_counter()
+        assert request('help', path)['ok']
+        assert perf_counter() - tstart < 1
+        job.release.set()
+        slow.join(5)
+    finally:
+        server.stop(5)
+
+
+def test_unexpected_error_is_replied(tmp_path):
+    path = tmp_path / 'ctl.sock'
+    server = ControlServer(FakeJob(), path)
+    server.start()
+    try:
+        reply = request('sound', path)
+        assert not reply['ok'] and 'mixer gone' in reply['error']
+        assert request('help', path)['ok']  # server still answering
+    finally:
+        server.stop(5)
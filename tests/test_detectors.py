@@ -0,0 +1,46 @@
+"""Fire detector tests.
+
+Author: Marion Anderson
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from detectors import get_detector  # noqa: E402
+from replay import VirtualClock  # noqa: E402
+from ringbuf import RingBuffer  # noqa: E402
+
+
+def test_set_thresholds_keeps_slope_fit_and_hold():
+    det = get_detector('combined', thresh=100, off_thresh=50,
+                       slope_window=30, rise_rate=10, hold=2)
+    slope = det.detector.detectors[1]
+    buf = RingBuffer(60)
+    for i in range(80):  # 40s flat, then a steep rise
+        t = i*0.5
+        buf.append(20 if t < 35 else 20 + 5*(t - 35), t)
+        going = det.update(buf, False)
+    assert not going and det._since is not None  # rise seen, hold pending
+    window, since = len(slope.window), det._since
+    det.set_thresholds(200, 150)
+    assert len(slope.window) == window and det._since == since
+    assert det.detector.detectors[0].thresh == 200
+    assert slope.off_thresh == 150
+
+
+def test_calcifer_set_thresholds_keeps_detector():
+    from calcifer import Calcifer
+    job = Calcifer(section='SIM', clock=VirtualClock(), backend='sim',
+                   telemetry_dir='', loglevel='ERROR')
+    try:
+        for _ in range(60):
+            job.clock.sleep(job.step())
+        ch = job.channels[0]
+        detector = ch.detector
+        job.set_thresholds(120, 60)
+        assert ch.detector is detector
+        assert (ch.thresh, ch.off_thresh) == (120, 60)
+        assert detector.detector.detectors[1].ready
+    finally:
+        job._wrapup()
@@ -0,0 +1,31 @@
+"""Idle amplifier power tests on the simulator.
+
+Author: Marion Anderson
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calcifer import Calcifer  # noqa: E402
+from replay import VirtualClock  # noqa: E402
+
+
+def test_idle_wakeup_waits_for_recovery():
+    """Waking from idle must not re-energize the amplifiers while a
+    recovery holds them powered off."""
+    job = Calcifer(section='SIM', clock=VirtualClock(), backend='sim',
+                   telemetry_dir='', loglevel='ERROR')
+    try:
+        job._amp_power(False)
+        assert job.amp_off and job.tc_reset.value
+        for ch in job.channels:  # as `powercycle_max` does
+            ch.recovering = True
+        job.step()
+        assert job.amp_off and job.tc_reset.value
+        for ch in job.channels:
+            ch.recovering = False
+        job.step()
+        assert not job.amp_off and not job.tc_reset.value
+    finally:
+        job._wrapup()
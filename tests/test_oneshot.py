@@ -0,0 +1,33 @@
+"""`--oneshot` on the simulated amplifier.
+
+Author: Marion Anderson
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.mark.parametrize('acquisition', ['poll', 'event'])
+@pytest.mark.parametrize('conversion', ['oneshot', 'continuous'])
+def test_oneshot_reads_curve(tmp_path, acquisition, conversion):
+    """The first read after auto-conversion starts must wait for a result
+    instead of returning the empty result registers."""
+    fnconf = tmp_path / 'calcifer.ini'
+    fnconf.write_text((ROOT / 'calcifer.ini').read_text() + f"""
+[ONESHOT]
+backend = sim
+sim_curve = const:80
+sim_noise = 0
+telemetry_dir =
+acquisition = {acquisition}
+conversion = {conversion}
+""")
+    out = subprocess.run(
+        [sys.executable, str(ROOT / 'calcifer.py'), f'--fnconf={fnconf}',
+         '--section=ONESHOT', '--oneshot'],
+        capture_output=True, text=True, timeout=60, check=True).stdout
+    assert out.strip() == 'K-type Temperature: 80.0'
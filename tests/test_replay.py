@@ -0,0 +1,68 @@
+"""Replay regression tests on the simulated amplifier.
+
+Author: Marion Anderson
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replay import replay, score  # noqa: E402
+
+
+def test_event_continuous_advances():
+    """event acquisition + continuous conversion must not stall the
+    virtual clock on float rounding of the conversion count."""
+    res = replay('const:20', section='SIM', duration=60,
+                 acquisition='event', conversion='continuous')
+    assert res['sim_s'] >= 60
+    assert res['samples'] > 500  # ~one per 100ms conversion
+
+
+@pytest.mark.parametrize('overrides', [
+    {}, {'acquisition': 'event'}, {'averaging': '4'}])
+def test_sim_no_false_triggers(overrides):
+    """The shipped SIM section detects its own burn exactly once."""
+    res = replay('burn:20,300,30,120,600,300', section='SIM', duration=3600,
+                 **overrides)
+    assert [going for _, going in res['transitions']] == [True, False]
+    assert res['false_triggers'] == 0
+    assert 0 <= res['latency'] < 30
+
+
+def test_score_retrigger_after_burn_is_false():
+    res = score([(35, True), (700, False), (1000, True)], [(30, 600)])
+    assert res['latency'] == 5
+    assert res['false_triggers'] == 1
+    assert [g['false_triggers'] for g in res['gaps']] == [0, 1]
+
+
+def test_score_already_on_at_ignition():
+    res = score([(10, True), (2000, False), (2100, True)], [(30, None)])
+    assert res['latency'] == 0 and res['already_on']
+    assert res['false_triggers'] == 1  # the early trigger
+    assert res['burns'][0]['retriggers'] == 1
+
+
+def test_score_multiple_burns():
+    transitions = [(32, True), (700, False), (800, True), (900, False),
+                   (2010, True), (2700, False)]
+    res = score(transitions, [(30, 600), (2000, 2500)])
+    assert [b['latency'] for b in res['burns']] == [2, 10]
+    assert [g['false_triggers'] for g in res['gaps']] == [0, 1, 0]
+    assert res['latency'] == 10 and res['missed'] == 0
+    res = score(transitions[:4], [(30, 600), (2000, 2500)])
+    assert res['latency'] is None and res['missed'] == 1
+
+
+def test_adaptive_keeps_slope_detector_fed():
+    """Adaptive sampling must not starve the SIM slope fit between
+    threshold-driven periods."""
+    trace = 'burn:20,300,30,120,600,300'
+    fixed = replay(trace, section='SIM', duration=1200)
+    adaptive = replay(trace, section='SIM', duration=1200,
+                      sampling='adaptive')
+    assert adaptive['samples'] < fixed['samples'] / 2
+    assert adaptive['latency'] < fixed['latency'] + 10